@@ -1,12 +1,17 @@
+# pylint: disable=unused-argument
 """
 Backend for managing users
 """
 
-from flask import Flask, jsonify, request
+from functools import partial
+
+from flask import Flask
 from redis import StrictRedis
 from werkzeug.exceptions import BadRequest
 
 from ..base.mountable import MountableAPI
+from ..base.response import json_response, request_json
+from ..base.schema import Field, Schema
 from ...core.rules import RULE_TOKEN
 from ...util.config import ConfigurationFileFinder
 from ...util.redis import RedisConfiguration
@@ -23,6 +28,15 @@ class UserManagementAPI(MountableAPI):
 
     api_pool = api_redis.create_redis_connection_pool()
 
+    schemas = {
+        'admin_token': Schema(
+            Field('admin_token', rule=RULE_TOKEN),
+        ),
+        'admin': Schema(
+            Field('data', kind=dict),
+        ),
+    }
+
     def __init__(self):
         """
         Prepare dispatching queue
@@ -36,30 +50,36 @@ class UserManagementAPI(MountableAPI):
         :param namespace: The URL namespace
         :param application: The Flask Application
         """
+        self.compile_schemas()
         enable_user_endpoint = '{:s}/enable_user'.format(namespace)
         application.add_url_rule(enable_user_endpoint, enable_user_endpoint, self.enable_user, methods=('POST',))
         disable_user_endpoint = '{:s}/disable_user'.format(namespace)
         application.add_url_rule(disable_user_endpoint, disable_user_endpoint, self.disable_user, methods=('POST',))
         set_password_endpoint = '{:s}/set_password'.format(namespace)
         application.add_url_rule(set_password_endpoint, set_password_endpoint, self.set_password, methods=('POST',))
-
-    def __admin_handler(self, endpoint: bytes):
+        bulk_enable_endpoint = '{:s}/bulk_enable_users'.format(namespace)
+        application.add_url_rule(bulk_enable_endpoint, bulk_enable_endpoint, self.bulk_enable_users,
+                                 methods=('POST',))
+        bulk_disable_endpoint = '{:s}/bulk_disable_users'.format(namespace)
+        application.add_url_rule(bulk_disable_endpoint, bulk_disable_endpoint, self.bulk_disable_users,
+                                 methods=('POST',))
+        bulk_password_endpoint = '{:s}/bulk_set_passwords'.format(namespace)
+        application.add_url_rule(bulk_password_endpoint, bulk_password_endpoint, self.bulk_set_passwords,
+                                 methods=('POST',))
+        list_users_endpoint = '{:s}/list_users'.format(namespace)
+        application.add_url_rule(list_users_endpoint, list_users_endpoint, self.list_users, methods=('POST',))
+        stats_endpoint = '{:s}/stats'.format(namespace)
+        application.add_url_rule(stats_endpoint, stats_endpoint, self.stats, methods=('POST',))
+
+    def consume_admin_token(self, json_data: dict, endpoint: bytes) -> None:
         """
-        Handle Admin Request
+        Check and consume the one-time admin token of a request
 
-        :param bytes endpoint: Endpoint (in bytes!)
-        :return: jsonified answer data
+        :param dict json_data: Request data
+        :param bytes endpoint: Endpoint the token has to be issued for (in bytes!)
+        :raises BadRequest: When the token is missing, invalid or not issued for the endpoint
         """
-        json_data = request.get_json()
-        if json_data is None:
-            raise BadRequest()
-        if 'admin_token' not in json_data:
-            raise BadRequest()
-        admin_token = json_data['admin_token']
-        if not isinstance(admin_token, str):
-            raise BadRequest()
-        if not RULE_TOKEN.match(admin_token):
-            raise BadRequest()
+        admin_token = self.validate('admin_token', json_data)['admin_token']
         redis = StrictRedis(connection_pool=self.api_pool)
         ep_key = 'ADMIN_TOKEN:{:s}'.format(admin_token)
         should_endpoint = redis.get(ep_key)
@@ -68,15 +88,45 @@ class UserManagementAPI(MountableAPI):
         redis.delete(ep_key)
         if should_endpoint != endpoint:
             raise BadRequest()
-        if 'data' not in json_data:
-            raise BadRequest()
-        data = json_data['data']
-        if not isinstance(data, dict):
-            raise BadRequest()
-        return jsonify(self.queue_dispatcher({
-            '_': 'admin:{:s}'.format(endpoint.decode('utf-8')),
-            'data': data,
-        }))
+
+    def admin_message(self, endpoint: str, json_data: dict, remote_ip: str=None) -> dict:
+        """
+        Validate the request data and build the queue message for an admin endpoint
+
+        :param str endpoint: Endpoint
+        :param dict json_data: Request data
+        :param str remote_ip: IP address of the client (unused)
+        :return: Queue message
+        :rtype: dict
+        :raises BadRequest: When the request data is invalid
+        """
+        return {
+            '_': 'admin:{:s}'.format(endpoint),
+            'data': self.validate('admin', json_data)['data'],
+        }
+
+    def operations(self) -> dict:
+        """
+        Admin operations available for batch requests - the admin token is checked once for the whole batch
+
+        :return: Dictionary of operation names and message builders
+        :rtype: dict
+        """
+        return {
+            'admin:{:s}'.format(endpoint): partial(self.admin_message, endpoint)
+            for endpoint in ('enable_user', 'disable_user', 'set_password')
+        }
+
+    def __admin_handler(self, endpoint: bytes):
+        """
+        Handle Admin Request
+
+        :param bytes endpoint: Endpoint (in bytes!)
+        :return: jsonified answer data
+        """
+        json_data = request_json()
+        self.consume_admin_token(json_data, endpoint)
+        return json_response(self.queue_dispatcher(self.admin_message(endpoint.decode('utf-8'), json_data)))
 
     def enable_user(self):
         """
@@ -101,3 +151,43 @@ class UserManagementAPI(MountableAPI):
         :return: JSON response
         """
         return self.__admin_handler(b'set_password')
+
+    def bulk_enable_users(self):
+        """
+        Enable many users
+
+        :return: JSON response
+        """
+        return self.__admin_handler(b'bulk_enable_users')
+
+    def bulk_disable_users(self):
+        """
+        Disable many users
+
+        :return: JSON response
+        """
+        return self.__admin_handler(b'bulk_disable_users')
+
+    def bulk_set_passwords(self):
+        """
+        Set the passwords of many users
+
+        :return: JSON response
+        """
+        return self.__admin_handler(b'bulk_set_passwords')
+
+    def list_users(self):
+        """
+        List users page by page
+
+        :return: JSON response
+        """
+        return self.__admin_handler(b'list_users')
+
+    def stats(self):
+        """
+        Show the user statistics
+
+        :return: JSON response
+        """
+        return self.__admin_handler(b'stats')
@@ -2,10 +2,11 @@
 Contains everything for login
 """
 
-from flask import Flask, jsonify, request
-from werkzeug.exceptions import BadRequest
+from flask import Flask
 
 from ..base.mountable import MountableAPI
+from ..base.response import json_response, request_json
+from ..base.schema import Field, Schema
 from ...core.rules import RULE_USERNAME, RULE_PASSWORD, RULE_TOKEN
 
 
@@ -14,6 +15,16 @@ class LoginAPI(MountableAPI):
     API for creating and managing User Sessions
     """
 
+    schemas = {
+        'authenticate': Schema(
+            Field('username', rule=RULE_USERNAME),
+            Field('password', rule=RULE_PASSWORD),
+        ),
+        'status': Schema(
+            Field('token', rule=RULE_TOKEN),
+        ),
+    }
+
     def __init__(self):
         """
         Prepare dispatching queue
@@ -27,6 +38,7 @@ class LoginAPI(MountableAPI):
         :param namespace: The URL namespace
         :param application: The Flask Application
         """
+        self.compile_schemas()
         status_endpoint = '{:s}/status'.format(namespace)
         application.add_url_rule(status_endpoint, status_endpoint, self.get_status, methods=('POST',))
         authenticate_endpoint = '{:s}/authenticate'.format(namespace)
@@ -38,25 +50,9 @@ class LoginAPI(MountableAPI):
 
         :return: JSON response
         """
-        json_data = request.get_json()
-        if json_data is None:
-            raise BadRequest()
-        if 'username' not in json_data or 'password' not in json_data:
-            raise BadRequest()
-        if not isinstance(json_data['username'], str) or not isinstance(json_data['password'], str):
-            raise BadRequest()
-        username = json_data['username']
-        password = json_data['password']
-        if not RULE_USERNAME.match(username):
-            raise BadRequest()
-        if not RULE_PASSWORD.match(password):
-            raise BadRequest()
-        return jsonify(self.queue_dispatcher({
+        return json_response(self.queue_dispatcher({
             '_': 'login:authenticate',
-            'data': {
-                'username': username,
-                'password': password,
-            },
+            'data': self.validate('authenticate', request_json()),
         }))
 
     def get_status(self):
@@ -65,19 +61,7 @@ class LoginAPI(MountableAPI):
 
         :return: JSON response
         """
-        json_data = request.get_json()
-        if json_data is None:
-            raise BadRequest()
-        if 'token' not in json_data:
-            raise BadRequest()
-        if not isinstance(json_data['token'], str):
-            raise BadRequest()
-        token = json_data['token']
-        if not RULE_TOKEN.match(token):
-            raise BadRequest()
-        return jsonify(self.queue_dispatcher({
+        return json_response(self.queue_dispatcher({
             '_': 'login:status',
-            'data': {
-                'token': token,
-            },
+            'data': self.validate('status', request_json()),
         }))
@@ -1,12 +1,13 @@
+# pylint: disable=unused-argument,no-self-use
 """
 Contains everything for registration
 """
 
-from flask import Flask, jsonify, request
-from laa import lazy_any
-from werkzeug.exceptions import BadRequest
+from flask import Flask, request
 
 from ..base.mountable import MountableAPI
+from ..base.response import json_response, request_json
+from ..base.schema import Field, Schema
 from ...core.rules import RULE_USERNAME, RULE_TOKEN, RULE_UUID, RULE_PASSWORD
 
 
@@ -15,6 +16,19 @@ class RegistrationAPI(MountableAPI):
     API for Registration
     """
 
+    schemas = {
+        'choose_username': Schema(
+            Field('token', rule=RULE_TOKEN),
+            Field('username', rule=RULE_USERNAME),
+            Field('registration_key', rule=RULE_UUID),
+        ),
+        'set_password': Schema(
+            Field('token', rule=RULE_TOKEN),
+            Field('registration_key', rule=RULE_UUID),
+            Field('password', rule=RULE_PASSWORD),
+        ),
+    }
+
     def __init__(self):
         """
         Prepare dispatching queue
@@ -28,6 +42,7 @@ class RegistrationAPI(MountableAPI):
         :param namespace: Namespace
         :param application: Application
         """
+        self.compile_schemas()
         prepare_endpoint = '{:s}/prepare'.format(namespace)
         application.add_url_rule(prepare_endpoint, prepare_endpoint, self.prepare, methods=('GET',))
         choose_username_endpoint = '{:s}/choose_username'.format(namespace)
@@ -37,18 +52,76 @@ class RegistrationAPI(MountableAPI):
         application.add_url_rule(set_password_endpoint, set_password_endpoint,
                                  self.set_password, methods=('POST',))
 
-    def prepare(self):
+    def operations(self) -> dict:
         """
-        Prepare registration
+        Registration operations available for batch requests
 
-        :return: JSON response
+        :return: Dictionary of operation names and message builders
+        :rtype: dict
+        """
+        return {
+            'registration:prepare': self.prepare_message,
+            'registration:choose_username': self.choose_username_message,
+            'registration:set_password': self.set_password_message,
+        }
+
+    def prepare_message(self, json_data: dict, remote_ip: str) -> dict:
+        """
+        Build the queue message for preparing a registration
+
+        :param json_data: Request data (unused)
+        :param remote_ip: IP address of the client
+        :return: Queue message
+        :rtype: dict
         """
-        return jsonify(self.queue_dispatcher({
+        return {
             '_': 'registration:prepare',
             'data': {
-                'ip': MountableAPI.get_ip(request),
+                'ip': remote_ip,
             },
-        }))
+        }
+
+    def choose_username_message(self, json_data: dict, remote_ip: str) -> dict:
+        """
+        Validate the request data and build the queue message for choosing a username
+
+        :param json_data: Request data
+        :param remote_ip: IP address of the client
+        :return: Queue message
+        :rtype: dict
+        :raises BadRequest: When the request data is invalid
+        """
+        data = self.validate('choose_username', json_data)
+        data['ip'] = remote_ip
+        return {
+            '_': 'registration:choose_username',
+            'data': data,
+        }
+
+    def set_password_message(self, json_data: dict, remote_ip: str) -> dict:
+        """
+        Validate the request data and build the queue message for setting the password of the new user
+
+        :param json_data: Request data
+        :param remote_ip: IP address of the client
+        :return: Queue message
+        :rtype: dict
+        :raises BadRequest: When the request data is invalid
+        """
+        data = self.validate('set_password', json_data)
+        data['ip'] = remote_ip
+        return {
+            '_': 'registration:set_password',
+            'data': data,
+        }
+
+    def prepare(self):
+        """
+        Prepare registration
+
+        :return: JSON response
+        """
+        return json_response(self.queue_dispatcher(self.prepare_message(None, MountableAPI.get_ip(request))))
 
     def choose_username(self):
         """
@@ -56,29 +129,8 @@ class RegistrationAPI(MountableAPI):
 
         :return: JSON response
         """
-        json_data = request.get_json()
-        if lazy_any([
-                lambda: json_data is None,
-                lambda: 'token' not in json_data,
-                lambda: 'username' not in json_data,
-                lambda: 'registration_key' not in json_data,
-                lambda: not isinstance(json_data['token'], str),
-                lambda: not isinstance(json_data['username'], str),
-                lambda: not isinstance(json_data['registration_key'], str),
-                lambda: not RULE_TOKEN.match(json_data['token']),
-                lambda: not RULE_USERNAME.match(json_data['username']),
-                lambda: not RULE_UUID.match(json_data['registration_key']),
-        ]):
-            raise BadRequest()
-        return jsonify(self.queue_dispatcher({
-            '_': 'registration:choose_username',
-            'data': {
-                'registration_key': json_data['registration_key'],
-                'token': json_data['token'],
-                'ip': MountableAPI.get_ip(request),
-                'username': json_data['username'],
-            }
-        }))
+        return json_response(self.queue_dispatcher(self.choose_username_message(request_json(),
+                                                                          MountableAPI.get_ip(request))))
 
     def set_password(self):
         """
@@ -86,26 +138,5 @@ class RegistrationAPI(MountableAPI):
 
         :return: JSON response
         """
-        json_data = request.get_json()
-        if lazy_any([
-                lambda: json_data is None,
-                lambda: 'token' not in json_data,
-                lambda: 'registration_key' not in json_data,
-                lambda: 'password' not in json_data,
-                lambda: not isinstance(json_data['token'], str),
-                lambda: not isinstance(json_data['registration_key'], str),
-                lambda: not isinstance(json_data['password'], str),
-                lambda: not RULE_TOKEN.match(json_data['token']),
-                lambda: not RULE_UUID.match(json_data['registration_key']),
-                lambda: not RULE_PASSWORD.match(json_data['password']),
-        ]):
-            raise BadRequest()
-        return jsonify(self.queue_dispatcher({
-            '_': 'registration:set_password',
-            'data': {
-                'registration_key': json_data['registration_key'],
-                'token': json_data['token'],
-                'ip': MountableAPI.get_ip(request),
-                'password': json_data['password']
-            }
-        }))
+        return json_response(self.queue_dispatcher(self.set_password_message(request_json(),
+                                                                       MountableAPI.get_ip(request))))
@@ -2,28 +2,67 @@
 Base Class for a mountable API
 """
 
-from json import dumps, loads
-from time import time
+from collections import OrderedDict
+from time import perf_counter, time
 from uuid import uuid4
 
-from flask import Flask
+from flask import Flask, g, has_request_context
 from redis import StrictRedis
 
+from ...core.functions import FUNCTION_TABLE
 from ...util.config import ConfigurationFileFinder
+from ...util.metrics import REGISTRY
+from ...util.queue.envelope import EnvelopeCodec
 from ...util.queue.redis import RedisQueueProducer
+from ...util.slowlog import TIMING, SlowLog, stage_offsets
+from ...util.tracing import TRACER
+
+
+ROUNDTRIP_SECONDS = REGISTRY.histogram('tts_queue_roundtrip_seconds', 'Time from firing a message until its reply',
+                                       ('function',))
+TIMEOUTS = REGISTRY.counter('tts_queue_timeouts_total', 'Messages without a reply in time', ('function',))
 
 
 class MountableAPI(object):
     """
     Provide a basic class for supporting mountable API endpoints
+
+    Subclasses declare the request data of their endpoints in ``schemas`` and call ``compile_schemas`` when mounting.
     """
 
+    schemas = {}
+
     def __init__(self):
         """
         Prepare Queues
         """
         self.__config = ConfigurationFileFinder().find_as_json()['tts']['queues']['api']
         self.__queue = RedisQueueProducer(self.__config)
+        self.__envelopes = EnvelopeCodec(
+            FUNCTION_TABLE,
+            binary='envelope' in self.__config and self.__config['envelope'] == 'binary'
+        )
+        self.validators = {}
+        self.__slowlog = SlowLog()
+        self.__slowlog.start()
+
+    def compile_schemas(self) -> None:
+        """
+        Compile the schemas of this API to validators
+        """
+        self.validators = {name: schema.compile() for name, schema in self.schemas.items()}
+
+    def validate(self, name: str, json_data) -> dict:
+        """
+        Validate request data with the compiled schema of an endpoint
+
+        :param str name: Name of the schema
+        :param json_data: Request data
+        :return: The fields of the schema
+        :rtype: dict
+        :raises BadRequest: When the request data is invalid
+        """
+        return self.validators[name].validate(json_data)
 
     def mount(self, namespace: str, application: Flask) -> None:
         """
@@ -35,6 +74,17 @@ class MountableAPI(object):
         """
         raise NotImplementedError
 
+    def operations(self) -> dict:
+        """
+        Operations of this API that may be used within a batch request. Each operation maps to a message builder
+        accepting the request data of the endpoint and the remote IP address, raising ``BadRequest`` when the request
+        data is invalid.
+
+        :return: Dictionary of operation names and message builders
+        :rtype: dict
+        """
+        return {}
+
     def queue_dispatcher(self, message: dict) -> dict:
         """
         Dispatch a request to queue
@@ -43,29 +93,94 @@ class MountableAPI(object):
         :return: JSON data in return as dict
         :rtype: dict
         """
-        uuid = str(uuid4())
-        redis = StrictRedis(connection_pool=self.__queue.connection_pool)
-        pubsub = redis.pubsub()
-        message['_uuid'] = uuid
-        message['_time'] = time()
-        queue = 'req_{:s}'.format(uuid)
-        pubsub.subscribe(queue)
-        self.__queue.fire_message(dumps(message).encode('utf-8'))
-        tries = 0
-        while tries < 3:
-            tries += 1
-            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=7.5)
-            if message is not None:
+        return self.queue_dispatcher_many([message])[0]
+
+    def queue_dispatcher_many(self, messages: list) -> list:
+        """
+        Dispatch several requests to queue at once and gather the answers concurrently
+
+        :param messages: Messages to dispatch
+        :return: JSON data in return as dicts, in the order of the messages
+        :rtype: list
+        """
+        if len(messages) <= 0:
+            return []
+        with TRACER.span('queue dispatch') as span:
+            span.set('messages', len(messages))
+            return self.__dispatch(messages, span.context)
+
+    def __collect(self, pubsub, sent: OrderedDict, start: float) -> tuple:
+        """
+        Wait for the answers until all arrived or the time is up
+
+        :param pubsub: Pubsub subscribed to the reply channels
+        :param OrderedDict sent: Function and workload by reply channel
+        :param float start: Performance counter when the messages were fired
+        :return: Answers by reply channel and the timing reported by the dispatcher with the time of arrival
+        :rtype: tuple
+        """
+        answers = {}
+        timings = {}
+        deadline = time() + 22.5
+        while len(answers) < len(sent):
+            remaining = deadline - time()
+            if remaining <= 0:
                 break
-        pubsub.unsubscribe(queue)
-        if message is None:
-            return {
-                'error': {
-                    'code': -1,
-                    'message': 'timeout',
-                }
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, 7.5))
+            if message is None or message['type'] != 'message':
+                continue
+            queue = message['channel'].decode('utf-8')
+            answers[queue] = self.__envelopes.unpack_reply(message['data'])
+            timings[queue] = (answers[queue].pop(TIMING, None) if isinstance(answers[queue], dict) else None, time())
+            ROUNDTRIP_SECONDS.observe(perf_counter() - start, (sent[queue][0],))
+        return answers, timings
+
+    def __record(self, sent: OrderedDict, arrival: float, enqueued: float, timings: dict) -> None:
+        """
+        Count the messages without an answer and record the stages of all messages in the slow log
+
+        :param OrderedDict sent: Function and workload by reply channel
+        :param float arrival: Time the request arrived
+        :param float enqueued: Time the messages were fired
+        :param dict timings: Timing reported by the dispatcher with the time of arrival by reply channel
+        """
+        for queue, (function, workload) in sent.items():
+            if queue not in timings:
+                TIMEOUTS.inc(labels=(function,))
+            timing, received = timings.get(queue, (None, None))
+            self.__slowlog.record(function, queue[4:], len(workload), arrival,
+                                  stage_offsets(arrival, enqueued, timing, received))
+
+    def __dispatch(self, messages: list, trace: str) -> list:
+        """
+        Fire the requests and wait for the answers
+
+        :param messages: Messages to dispatch
+        :param str trace: Trace context handed to the dispatcher or ``None``
+        :return: JSON data in return as dicts, in the order of the messages
+        :rtype: list
+        """
+        arrival = g.request_arrival if has_request_context() and 'request_arrival' in g else time()
+        pubsub = StrictRedis(connection_pool=self.__queue.connection_pool).pubsub()
+        sent = OrderedDict()
+        for message in messages:
+            uuid = uuid4()
+            sent['req_{!s}'.format(uuid)] = (
+                message['_'], self.__envelopes.pack(message['_'], uuid, message['data'], trace)
+            )
+        pubsub.subscribe(*sent)
+        start = perf_counter()
+        self.__queue.fire_messages([workload for dummy, workload in sent.values()])
+        enqueued = time()
+        answers, timings = self.__collect(pubsub, sent, start)
+        pubsub.unsubscribe(*sent)
+        self.__record(sent, arrival, enqueued, timings)
+        return [answers[queue] if queue in answers else {
+            'error': {
+                'code': -1,
+                'message': 'timeout',
             }
-        return loads(message['data'].decode('utf-8'), encoding='utf-8')
+        } for queue in sent]
 
     @staticmethod
     def get_ip(request) -> str:
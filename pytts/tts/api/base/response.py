@@ -0,0 +1,38 @@
+"""
+Reading JSON requests and writing JSON responses with the codec
+"""
+
+from flask import Response, g, request
+from werkzeug.exceptions import BadRequest
+
+from ...util.codec import JSONCodec
+
+
+def request_json():
+    """
+    Decode the JSON body of the current request, only once per request
+
+    :return: The decoded data or ``None`` when the request is not of type ``application/json``
+    :raises BadRequest: When the body is not valid JSON
+    """
+    if 'request_json' in g:
+        return g.request_json
+    json_data = None
+    if request.mimetype == 'application/json':
+        try:
+            json_data = JSONCodec().decode(request.get_data(cache=True))
+        except ValueError:
+            raise BadRequest()
+    g.request_json = json_data
+    return json_data
+
+
+def json_response(data) -> Response:
+    """
+    Create a compact JSON response
+
+    :param data: Data to send
+    :return: The response
+    :rtype: Response
+    """
+    return Response(JSONCodec().encode(data), mimetype='application/json')
@@ -0,0 +1,97 @@
+"""
+Declarative validation of request data
+"""
+
+from werkzeug.exceptions import BadRequest
+
+
+class Field(object):
+    """
+    Description of a single field of the request data
+    """
+
+    def __init__(self, name: str, kind: type=str, rule=None):
+        """
+        Describe a field
+
+        :param str name: Name of the field
+        :param type kind: Type the value must have
+        :param rule: Compiled regular expression the value must match, e.g. from ``tts.core.rules`` (optional)
+        """
+        self.name = name
+        self.kind = kind
+        self.rule = rule
+
+
+class Schema(object):
+    """
+    Describe the request data of an endpoint once, compile it to a ``Validator`` when mounting the endpoint
+    """
+
+    def __init__(self, *fields: Field):
+        """
+        Collect the fields
+
+        :param fields: Fields of the schema
+        """
+        self.fields = fields
+
+    def compile(self) -> 'Validator':
+        """
+        Compile the schema
+
+        :return: A validator for this schema
+        :rtype: Validator
+        """
+        return Validator(tuple(
+            (field.name, field.kind, field.rule.match if field.rule is not None else None) for field in self.fields
+        ))
+
+
+class Validator(object):
+    """
+    Check request data against a compiled schema without allocating anything per request but the result
+    """
+
+    __slots__ = ('__checks',)
+
+    def __init__(self, checks: tuple):
+        """
+        Use the compiled checks
+
+        :param tuple checks: Tuples of field name, type and bound match method (or ``None``)
+        """
+        self.__checks = checks
+
+    def is_valid(self, data) -> bool:
+        """
+        Check the data
+
+        :param data: Request data
+        :return: ``True`` when all fields are present, have the right type and match their rules
+        :rtype: bool
+        """
+        if not isinstance(data, dict):
+            return False
+        for name, kind, match in self.__checks:
+            if name not in data:
+                return False
+            value = data[name]
+            if not isinstance(value, kind):
+                return False
+            if match is not None and match(value) is None:
+                return False
+        return True
+
+    def validate(self, data) -> dict:
+        """
+        Check the data and extract the fields of the schema
+
+        :param data: Request data
+        :return: Dictionary with the fields of the schema only
+        :rtype: dict
+        :raises BadRequest: When the data is invalid
+        """
+        if not self.is_valid(data):
+            raise BadRequest()
+        return {check[0]: data[check[0]] for check in self.__checks}
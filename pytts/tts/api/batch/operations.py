@@ -0,0 +1,113 @@
+"""
+Batch API for running multiple operations with a single HTTP request
+"""
+
+from flask import Flask, request
+from werkzeug.exceptions import BadRequest
+
+from ..admin.user import UserManagementAPI
+from ..base.mountable import MountableAPI
+from ..base.response import json_response, request_json
+from ..base.schema import Field, Schema
+from ...util.config import ConfigurationFileFinder
+
+
+class BatchAPI(MountableAPI):
+    """
+    Batch API implementation
+
+    A batch request looks like this::
+
+        {
+            "admin_token": "<only needed when admin operations are part of the batch>",
+            "operations": [
+                {"operation": "registration:prepare", "request": {}},
+                {"operation": "admin:enable_user", "request": {"data": {"username": "user"}}}
+            ]
+        }
+
+    Each ``request`` is validated with the same rules as the request to the single endpoint.
+    """
+
+    max_operations = 500
+
+    schemas = {
+        'batch': Schema(
+            Field('operations', kind=list),
+        ),
+    }
+
+    def __init__(self, *apis: MountableAPI):
+        """
+        Collect the operations of the APIs that can be batched
+
+        :param apis: The APIs whose operations are available within a batch
+        """
+        super(BatchAPI, self).__init__()
+        self.__admin_api = None
+        self.__operations = {}
+        for api in apis:
+            if isinstance(api, UserManagementAPI):
+                self.__admin_api = api
+            self.__operations.update(api.operations())
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'batch' in config and 'max_operations' in config['batch']:
+            self.max_operations = config['batch']['max_operations']
+
+    def mount(self, namespace: str, application: Flask) -> None:
+        """
+        Provide the mount interface
+
+        :param namespace: The URL namespace
+        :param application: The Flask Application
+        """
+        self.compile_schemas()
+        application.add_url_rule(namespace, namespace, self.batch, methods=('POST',))
+
+    def __build_messages(self, operations: list, remote_ip: str) -> list:
+        """
+        Validate all operations and build the queue messages
+
+        :param list operations: The operations of the batch
+        :param str remote_ip: IP address of the client
+        :return: List of queue messages, ``None`` where an operation was invalid
+        :rtype: list
+        """
+        messages = []
+        for operation in operations:
+            message = None
+            if isinstance(operation, dict) and isinstance(operation.get('operation'), str) \
+                    and operation['operation'] in self.__operations and isinstance(operation.get('request', {}), dict):
+                try:
+                    message = self.__operations[operation['operation']](operation.get('request', {}), remote_ip)
+                except BadRequest:
+                    pass
+            messages.append(message)
+        return messages
+
+    def batch(self):
+        """
+        Dispatch all operations of the batch and deliver the results in the same order
+
+        :return: JSON response
+        :raises BadRequest: When the batch itself is invalid or admin operations are not authorized
+        """
+        json_data = request_json()
+        operations = self.validate('batch', json_data)['operations']
+        if len(operations) > self.max_operations:
+            raise BadRequest()
+        if any(isinstance(operation, dict) and str(operation.get('operation')).startswith('admin:')
+               for operation in operations):
+            if self.__admin_api is None:
+                raise BadRequest()
+            self.__admin_api.consume_admin_token(json_data, b'batch')
+        messages = self.__build_messages(operations, MountableAPI.get_ip(request))
+        answers = iter(self.queue_dispatcher_many([message for message in messages if message is not None]))
+        return json_response({
+            'results': [next(answers) if message is not None else {
+                'error': {
+                    'code': -3,
+                    'message': 'invalid_operation',
+                }
+            } for message in messages],
+        })
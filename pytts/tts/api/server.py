@@ -2,19 +2,31 @@
 Flask API entry point
 """
 
-from blackred import BlackRed
-from flask import Flask, jsonify, request
+from logging import getLogger
+from time import perf_counter, time
+
+from flask import Flask, g, request
 from werkzeug.exceptions import Unauthorized, BadRequest, MethodNotAllowed
 
 from .admin.user import UserManagementAPI
 from .auth.registration import RegistrationAPI
 from .auth.login import LoginAPI
+from .base.response import json_response, request_json
+from .batch.operations import BatchAPI
+from ..util.blackred import CachedBlackRed
+from ..util.metrics import REGISTRY
+from ..util.tracing import TRACER
 
 
 __version__ = '1.0'
 
 REST_APPLICATION = Flask(__name__)
-BLACKRED = BlackRed()
+BLACKRED = CachedBlackRed()
+REQUEST_SECONDS = REGISTRY.histogram('tts_api_request_seconds', 'Duration of API requests', ('endpoint',))
+REQUESTS = REGISTRY.counter('tts_api_requests_total', 'Answered API requests', ('endpoint', 'status'))
+BLACKRED_SECONDS = REGISTRY.histogram('tts_blackred_check_seconds', 'Duration of the BlackRed check')
+BLACKRED_CHECKS = REGISTRY.counter('tts_blackred_checks_total', 'BlackRed checks', ('result',))
+LOG = getLogger('tts.request')
 
 
 @REST_APPLICATION.route('/version', methods=('GET',))
@@ -24,7 +36,58 @@ def get_version():
 
     :return: JSONified version
     """
-    return jsonify({'version': __version__})
+    return json_response({'version': __version__})
+
+
+@REST_APPLICATION.before_request
+def start_timer():
+    """
+    Remember when the request started and start a trace, if the request is sampled
+    """
+    g.request_start = perf_counter()
+    g.request_arrival = time()
+    g.trace_span = TRACER.start_trace('{:s} {:s}'.format(request.method, request.path)).activate()
+
+
+@REST_APPLICATION.after_request
+def record_request(response):
+    """
+    Record duration and status of the request
+
+    :param response: The response
+    :return: The response
+    """
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unknown'
+    duration = perf_counter() - g.request_start if 'request_start' in g else None
+    if duration is not None:
+        REQUEST_SECONDS.observe(duration, (endpoint,))
+    REQUESTS.inc(labels=(endpoint, str(response.status_code)))
+    LOG.info('request', extra={
+        'endpoint': endpoint,
+        'method': request.method,
+        'status': response.status_code,
+        'duration': duration,
+    })
+    if 'trace_span' in g:
+        g.trace_span.set('http.route', endpoint)
+        g.trace_span.set('http.status_code', response.status_code)
+    return response
+
+
+@REST_APPLICATION.teardown_request
+def finish_trace(error=None):
+    """
+    End the trace of the request and log the exception that ended it
+
+    :param error: Exception that ended the request
+    """
+    if error is not None:
+        LOG.error('request failed', exc_info=(type(error), error, error.__traceback__), extra={
+            'endpoint': request.url_rule.rule if request.url_rule is not None else 'unknown',
+            'method': request.method,
+        })
+    if 'trace_span' in g:
+        g.trace_span.finish(error)
 
 
 @REST_APPLICATION.before_request
@@ -34,7 +97,10 @@ def check_blackred():
     :raises Unauthorized: When the remote user is blocked
     """
     remote_addr = request.remote_addr
-    if BLACKRED.is_blocked(remote_addr):
+    with BLACKRED_SECONDS.time(), TRACER.span('blackred check'):
+        blocked = BLACKRED.is_blocked(remote_addr)
+    BLACKRED_CHECKS.inc(labels=('blocked' if blocked else 'allowed',))
+    if blocked:
         raise Unauthorized()
 
 
@@ -48,14 +114,13 @@ def check_request():
     if not any([request.method == 'GET', request.method == 'POST']):
         raise MethodNotAllowed()
     if request.method == 'POST':
-        try:
-            json_data = request.get_json()
-        except:
-            raise BadRequest()
-        if json_data is None:
+        if request_json() is None:
             raise BadRequest()
 
 
-UserManagementAPI().mount('/v{:s}/admin'.format(__version__), REST_APPLICATION)
+USER_MANAGEMENT_API = UserManagementAPI()
+USER_MANAGEMENT_API.mount('/v{:s}/admin'.format(__version__), REST_APPLICATION)
 LoginAPI().mount('/v{:s}/login'.format(__version__), REST_APPLICATION)
-RegistrationAPI().mount('/v{:s}/registration'.format(__version__), REST_APPLICATION)
+REGISTRATION_API = RegistrationAPI()
+REGISTRATION_API.mount('/v{:s}/registration'.format(__version__), REST_APPLICATION)
+BatchAPI(USER_MANAGEMENT_API, REGISTRATION_API).mount('/v{:s}/batch'.format(__version__), REST_APPLICATION)
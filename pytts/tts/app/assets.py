@@ -0,0 +1,335 @@
+"""
+Build step for the static assets: fingerprinted file names, precompressed variants and a manifest
+"""
+
+import gzip
+from hashlib import sha256
+from json import dump, dumps, load
+from os import makedirs, path, walk
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+from ..util.config import ConfigurationFileFinder
+
+
+ENTRY_POINTS = ('xhtml', 'html')
+COMPRESSIBLE = ('xhtml', 'html', 'js', 'css', 'svg', 'eot', 'ttf', 'json', 'txt')
+RULE_XHTML_REFERENCE = re.compile(r'(?P<attribute>\b(?:src|href)=")(?P<reference>[^"#?:]+)(?P<suffix>[^"]*")')
+RULE_CSS_REFERENCE = re.compile(r'(?P<attribute>url\(["\']?)(?P<reference>[^"\'()#?:]+)(?P<suffix>[^)]*\))')
+RULE_BUNDLE = re.compile(r'<!-- bundle: (?P<name>[^ ]+) -->(?P<block>.*?)<!-- end bundle -->', re.DOTALL)
+RULE_CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.DOTALL)
+RULE_CSS_SPACE = re.compile(r'\s*([{};])\s*|\s+')
+TEMPLATES = ('(function (templates) {{\n{:s}\n}})'
+             '((window.tts = window.tts || {{}}).templates = window.tts.templates || {{}});')
+BUNDLE_TAGS = {
+    'js': '<script type="application/javascript" src="{:s}"></script>',
+    'css': '<link rel="stylesheet" type="text/css" href="{:s}" />',
+}
+
+
+def extension_of(file: str) -> str:
+    """
+    Get the extension of a file name
+
+    :param str file: File name
+    :return: Lower case extension without dot
+    :rtype: str
+    """
+    return path.splitext(file)[1][1:].lower()
+
+
+def minify_javascript(source: str) -> str:
+    """
+    Remove indentation, empty lines and comments that start a line. Line breaks are kept, so the automatic
+    semicolon insertion works as before.
+
+    :param str source: JavaScript source
+    :return: Minified source
+    :rtype: str
+    """
+    lines = []
+    comment = False
+    for line in source.splitlines():
+        line = line.strip()
+        if comment or line.startswith('/*'):
+            comment = '*/' not in line
+            line = line.partition('*/')[2].strip() if not comment else ''
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def minify_stylesheet(source: str) -> str:
+    """
+    Remove comments, except ``/*!`` license comments, and collapse white space
+
+    :param str source: CSS source
+    :return: Minified source
+    :rtype: str
+    """
+    return RULE_CSS_SPACE.sub(lambda match: match.group(1) or ' ', RULE_CSS_COMMENT.sub('', source)).strip()
+
+
+def static_configuration() -> dict:
+    """
+    Read the settings for the static assets, with defaults
+
+    :return: Dictionary with ``source``, ``build_dir``, ``brotli``, ``max_age``, ``cache_file_size``,
+             ``reload_interval`` and ``watch_source``
+    :rtype: dict
+    """
+    settings = {
+        'source': path.abspath(path.join(path.dirname(__file__), 'static')),
+        'build_dir': path.abspath(path.join(path.dirname(__file__), 'build')),
+        'brotli': True,
+        'max_age': 31536000,
+        'cache_file_size': 262144,
+        'reload_interval': 2.0,
+        'watch_source': False,
+    }
+    config = ConfigurationFileFinder().find_as_json()['tts']
+    if 'static' in config:
+        for key in settings:
+            if key in config['static'] and config['static'][key] is not None:
+                settings[key] = config['static'][key]
+    return settings
+
+
+class AssetBuilder(object):
+    """
+    Copy the static assets to the build directory. Every asset that is not an entry point (``xhtml``) gets a content
+    hash in its name, references in ``xhtml`` and ``css`` files are rewritten to these names. Bundle blocks of the
+    entry points are built into a single script or style sheet. All compressible assets are written gzip (and brotli)
+    compressed as well. The ``manifest.json`` describes the result.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, source: str, target: str, use_brotli: bool=True):
+        """
+        Prepare the build
+
+        :param str source: Directory of the static assets
+        :param str target: Build directory
+        :param bool use_brotli: Write brotli variants, if the ``brotli`` module is installed
+        """
+        self.__source = source
+        self.__target = target
+        self.__use_brotli = use_brotli and brotli is not None
+        self.__files = {}
+
+    def __source_files(self) -> list:
+        """
+        Find all files of the source directory
+
+        :return: Sorted relative paths, with ``/`` as separator
+        :rtype: list
+        """
+        files = []
+        for directory, dummy, names in walk(self.__source):
+            for name in names:
+                files.append(path.relpath(path.join(directory, name), self.__source).replace(path.sep, '/'))
+        return sorted(files)
+
+    def __source_digest(self, files: list) -> str:
+        """
+        Fingerprint the source directory by names, sizes and modification times
+
+        :param list files: Relative paths of the source files
+        :return: Hex digest
+        :rtype: str
+        """
+        digest = sha256()
+        for file in files:
+            stat = path.getsize(path.join(self.__source, file)), path.getmtime(path.join(self.__source, file))
+            digest.update('{:s}:{:d}:{!r};'.format(file, stat[0], stat[1]).encode('utf-8'))
+        digest.update(str(self.__use_brotli).encode('utf-8'))
+        return digest.hexdigest()
+
+    def __rewrite(self, file: str, content: bytes, rule, target: str=None) -> bytes:
+        """
+        Rewrite references to other assets to their built names
+
+        :param str file: Relative path of the file containing the references
+        :param bytes content: Content of the file
+        :param rule: Pattern with the groups ``attribute``, ``reference`` and ``suffix``
+        :param str target: Directory the references are relative to after the rewrite, defaults to the one of ``file``
+        :return: The rewritten content
+        :rtype: bytes
+        """
+        directory = path.dirname(file)
+        target = directory if target is None else target
+
+        def replace(match) -> str:
+            """
+            Replace a single reference
+
+            :param match: The match of the reference
+            :return: The replacement
+            :rtype: str
+            """
+            reference = match.group('reference')
+            resolved = path.normpath(path.join(directory, reference)).replace(path.sep, '/')
+            if resolved not in self.__files or (self.__files[resolved]['path'] == resolved and target == directory):
+                return match.group(0)
+            built = path.relpath(self.__files[resolved]['path'], target or '.').replace(path.sep, '/')
+            return match.group('attribute') + built + match.group('suffix')
+
+        return rule.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+    def __bundle(self, file: str, content: bytes) -> bytes:
+        """
+        Replace the ``<!-- bundle: name -->`` blocks of an entry point by a single reference to the bundle. The scripts
+        or style sheets of the block are minified and concatenated, templates referenced by the block are inlined in
+        the script bundle as ``window.tts.templates``.
+
+        :param str file: Relative path of the entry point
+        :param bytes content: Content of the entry point
+        :return: The content with references to the bundles
+        :rtype: bytes
+        """
+        directory = path.dirname(file)
+
+        def replace(match) -> str:
+            """
+            Build a single bundle
+
+            :param match: The match of the bundle block
+            :return: The reference to the bundle
+            :rtype: str
+            """
+            name = path.normpath(path.join(directory, match.group('name'))).replace(path.sep, '/')
+            extension = extension_of(name)
+            parts = []
+            templates = []
+            for reference in RULE_XHTML_REFERENCE.finditer(match.group('block')):
+                source = path.normpath(path.join(directory, reference.group('reference'))).replace(path.sep, '/')
+                if extension_of(source) in ENTRY_POINTS:
+                    templates.append('templates[{:s}] = {:s};'.format(
+                        dumps(reference.group('reference')), dumps(self.__read(source).decode('utf-8').strip())
+                    ))
+                elif extension_of(source) == 'css':
+                    part = self.__rewrite(source, self.__read(source), RULE_CSS_REFERENCE, path.dirname(name))
+                    parts.append(part.decode('utf-8') if source.endswith('.min.css') else minify_stylesheet(
+                        part.decode('utf-8')
+                    ))
+                else:
+                    part = self.__read(source).decode('utf-8')
+                    parts.append(part if source.endswith('.min.js') else minify_javascript(part))
+            if templates:
+                parts.append(TEMPLATES.format('\n'.join(templates)))
+            self.add(name, ('\n;\n' if extension == 'js' else '\n').join(parts).encode('utf-8'))
+            return BUNDLE_TAGS[extension].format(path.relpath(name, directory or '.').replace(path.sep, '/'))
+
+        return RULE_BUNDLE.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+    def add(self, file: str, content: bytes) -> None:
+        """
+        Write an asset with all its variants to the build directory
+
+        :param str file: Relative path of the asset
+        :param bytes content: Content of the asset
+        """
+        name = path.splitext(file)[0]
+        extension = extension_of(file)
+        etag = sha256(content).hexdigest()[:16]
+        immutable = extension not in ENTRY_POINTS
+        built = '{:s}.{:s}.{:s}'.format(name, etag, extension) if immutable else file
+        encodings = []
+        self.__write(built, content)
+        if extension in COMPRESSIBLE:
+            compressed = gzip.compress(content, 9)
+            if len(compressed) < len(content):
+                self.__write(built + '.gz', compressed)
+                encodings.append('gzip')
+            if self.__use_brotli:
+                compressed = brotli.compress(content)
+                if len(compressed) < len(content):
+                    self.__write(built + '.br', compressed)
+                    encodings.append('br')
+        self.__files[file] = {
+            'path': built,
+            'etag': etag,
+            'immutable': immutable,
+            'encodings': encodings,
+            'size': len(content),
+        }
+
+    def __write(self, file: str, content: bytes) -> None:
+        """
+        Write a file to the build directory
+
+        :param str file: Relative path
+        :param bytes content: Content
+        """
+        target = path.join(self.__target, file)
+        makedirs(path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as file_pointer:
+            file_pointer.write(content)
+
+    def __read(self, file: str) -> bytes:
+        """
+        Read a source file
+
+        :param str file: Relative path
+        :return: Content
+        :rtype: bytes
+        """
+        with open(path.join(self.__source, file), 'rb') as file_pointer:
+            return file_pointer.read()
+
+    def build(self, force: bool=False) -> dict:
+        """
+        Build all assets, unless the build directory is already up to date
+
+        :param bool force: Build even if the build directory is up to date
+        :return: The manifest
+        :rtype: dict
+        """
+        files = self.__source_files()
+        digest = self.__source_digest(files)
+        manifest_file = path.join(self.__target, self.MANIFEST)
+        if not force and path.isfile(manifest_file):
+            with open(manifest_file, 'r') as file_pointer:
+                manifest = load(file_pointer)
+            if manifest.get('source') == digest:
+                return manifest
+        self.__files = {}
+        for file in files:
+            if extension_of(file) not in ENTRY_POINTS + ('css',):
+                self.add(file, self.__read(file))
+        for file in files:
+            if extension_of(file) == 'css':
+                self.add(file, self.__rewrite(file, self.__read(file), RULE_CSS_REFERENCE))
+        for file in files:
+            if extension_of(file) in ENTRY_POINTS:
+                self.add(file, self.__rewrite(file, self.__bundle(file, self.__read(file)), RULE_XHTML_REFERENCE))
+        manifest = {
+            'source': digest,
+            'files': self.__files,
+        }
+        makedirs(self.__target, exist_ok=True)
+        with open(manifest_file, 'w') as file_pointer:
+            dump(manifest, file_pointer, indent=2, sort_keys=True)
+        return manifest
+
+
+def build_from_configuration(force: bool=False) -> dict:
+    """
+    Build the assets with the settings from the configuration file
+
+    :param bool force: Build even if the build directory is up to date
+    :return: The manifest
+    :rtype: dict
+    """
+    settings = static_configuration()
+    return AssetBuilder(settings['source'], settings['build_dir'], settings['brotli']).build(force)
+
+
+if __name__ == '__main__':
+    build_from_configuration('--force' in sys.argv)
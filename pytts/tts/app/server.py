@@ -2,7 +2,45 @@
 Static Server implementation
 """
 
+from json import load
+from os import path
+from threading import Event, Lock, Thread
+from time import time
+
 import cherrypy
+from cherrypy.lib import file_generator
+
+from .assets import AssetBuilder, extension_of
+
+
+def negotiate_encoding(accept_encoding: str, available: list) -> str:
+    """
+    Choose the best content encoding the client accepts
+
+    :param str accept_encoding: Value of the ``Accept-Encoding`` header
+    :param available: Encodings that are available for the resource
+    :return: ``br``, ``gzip`` or ``None`` for the identity
+    :rtype: str
+    """
+    if not accept_encoding or not available:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for parameter in parts[1:]:
+            key, dummy, value = parameter.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if encoding in available and quality > 0:
+            return encoding
+    return None
 
 
 class StaticServer(object):
@@ -22,3 +60,170 @@ class StaticServer(object):
         response.headers['Location'] = 'static/index.xhtml'
         response.status = 302
         return ['Moved Temporarily']
+
+
+class CachedResponse(object):
+    """
+    Prebuilt response of an asset in one content encoding
+    """
+
+    __slots__ = ('headers', 'etag', 'body', 'file')
+
+    def __init__(self, headers: list, etag: str, body: bytes, file: str):
+        """
+        Hold the response
+
+        :param list headers: Response headers
+        :param str etag: Quoted entity tag
+        :param bytes body: Content, ``None`` when the asset is served from disk
+        :param str file: Path of the file
+        """
+        self.headers = headers
+        self.etag = etag
+        self.body = body
+        self.file = file
+
+
+class AssetServer(object):
+    """
+    Serve the built static assets from memory: negotiate the precompressed variants, answer ``If-None-Match`` with
+    ``304`` and let clients cache fingerprinted assets forever. Headers and bodies are prepared when the manifest is
+    loaded, and loaded again when the manifest changes. Large files are streamed from disk. For development,
+    ``watch_source`` builds changed source assets in a background thread.
+    """
+
+    SUFFIXES = {
+        None: '',
+        'gzip': '.gz',
+        'br': '.br',
+    }
+
+    def __init__(self, settings: dict, content_types: dict):
+        """
+        Load the assets of the build directory
+
+        :param dict settings: Static settings with ``build_dir``, ``max_age``, ``cache_file_size`` and
+                              ``reload_interval``, optionally ``watch_source`` with ``source`` and ``brotli``
+        :param dict content_types: Content types by file extension
+        """
+        self.directory = settings['build_dir']
+        self.content_types = content_types
+        self.max_age = settings['max_age']
+        self.cache_file_size = settings['cache_file_size']
+        self.reload_interval = settings['reload_interval']
+        self.assets = {}
+        self.__manifest_mtime = None
+        self.__checked = time()
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.load()
+        if settings.get('watch_source'):
+            builder = AssetBuilder(settings['source'], self.directory, settings.get('brotli', True))
+            Thread(target=self.__watch, args=(builder,), name='pytts-asset-watch', daemon=True).start()
+
+    def headers(self, asset: dict, encoding: str) -> list:
+        """
+        Build the response headers of an asset
+
+        :param dict asset: Asset from the manifest
+        :param str encoding: Content encoding or ``None``
+        :return: List of header names and values
+        :rtype: list
+        """
+        headers = [
+            ('Content-Type', self.content_types.get(extension_of(asset['path']), 'application/octet-stream')),
+            ('ETag', '"{:s}"'.format(asset['etag'])),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if asset['immutable']:
+            headers.append(('Cache-Control', 'public, max-age={:d}, immutable'.format(self.max_age)))
+        else:
+            headers.append(('Cache-Control', 'no-cache'))
+        if encoding is not None:
+            headers.append(('Content-Encoding', encoding))
+        return headers
+
+    def load(self) -> None:
+        """
+        Load the manifest and prepare the responses of all assets
+        """
+        manifest_file = path.join(self.directory, AssetBuilder.MANIFEST)
+        manifest_mtime = path.getmtime(manifest_file)
+        with open(manifest_file, 'r') as file_pointer:
+            manifest = load(file_pointer)
+        assets = {}
+        for file, asset in manifest['files'].items():
+            assets[asset['path']] = asset
+            assets.setdefault(file, dict(asset, immutable=False))
+        bodies = {}
+        responses = {}
+        for name, asset in assets.items():
+            responses[name] = {}
+            for encoding in [None] + asset['encodings']:
+                file = path.join(self.directory, asset['path'] + self.SUFFIXES[encoding])
+                size = path.getsize(file)
+                if file not in bodies and size <= self.cache_file_size:
+                    with open(file, 'rb') as file_pointer:
+                        bodies[file] = file_pointer.read()
+                headers = self.headers(asset, encoding) + [('Content-Length', str(size))]
+                responses[name][encoding] = CachedResponse(headers, dict(headers)['ETag'], bodies.get(file), file)
+        self.assets = responses
+        self.__manifest_mtime = manifest_mtime
+
+    def __watch(self, builder: AssetBuilder) -> None:
+        """
+        Build changed source assets once per reload interval, the build only writes the manifest when a source file
+        was added, removed or modified
+
+        :param AssetBuilder builder: Builder of the source directory
+        """
+        while not self.__stopped.wait(self.reload_interval):
+            try:
+                builder.build()
+            except (OSError, ValueError):
+                pass
+
+    def stop(self) -> None:
+        """
+        Stop watching the source assets
+        """
+        self.__stopped.set()
+
+    def refresh(self) -> None:
+        """
+        Load the assets again when the manifest changed, at most once per reload interval
+        """
+        now = time()
+        if now - self.__checked < self.reload_interval or not self.__lock.acquire(False):
+            return
+        try:
+            self.__checked = now
+            if path.getmtime(path.join(self.directory, AssetBuilder.MANIFEST)) != self.__manifest_mtime:
+                self.load()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.__lock.release()
+
+    @cherrypy.expose
+    def default(self, *args, **dummy):
+        """
+        Serve an asset
+
+        :return: Content of the asset
+        :raises NotFound: When there is no such asset
+        """
+        self.refresh()
+        responses = self.assets.get('/'.join(args))
+        if responses is None:
+            raise cherrypy.NotFound()
+        request = cherrypy.request
+        response = cherrypy.response
+        cached = responses[negotiate_encoding(request.headers.get('Accept-Encoding'), responses)]
+        response.headers.update(cached.headers)
+        if cached.etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response.status = 304
+            return b''
+        if cached.body is not None:
+            return cached.body
+        return file_generator(open(cached.file, 'rb'))
@@ -62,7 +62,7 @@
                 $(div).find('span#formlib_registration_usernameStatus').text('(ok)');
                 $(div).find('span.form-control-feedback').addClass('glyphicon-ok');
                 local.states[id].state = 2;
-                $('<div></div>').load('dialogs/registration_passwords.xhtml', function() {
+                window.tts.loadTemplate($('<div></div>'), 'dialogs/registration_passwords.xhtml', function() {
                     $(form).find('input#formlib_registration_password1').focus();
                 }).insertBefore($(form).find('button[type="submit"]'));
             }
@@ -13,10 +13,25 @@
         contentType: 'application/json; charset=utf-8'
     };
 
+    namespace.templates = namespace.templates || {};
+
+    namespace.loadTemplate = function (element, name, callback) {
+        if (!namespace.templates.hasOwnProperty(name)) {
+            return $(element).load(name, callback);
+        }
+        $(element).html(namespace.templates[name]);
+        if (callback) {
+            window.setTimeout(function () {
+                callback.call($(element).get(0));
+            }, 0);
+        }
+        return $(element);
+    };
+
     namespace.registrationDialog = function () {
         BootstrapDialog.show({
             title: '<b>Registration</b>',
-            message: $('<div></div>').load('dialogs/registration.xhtml'),
+            message: namespace.loadTemplate($('<div></div>'), 'dialogs/registration.xhtml'),
             closeIcon: '<span class="glyphicon glyphicon-remove"></span>',
             onshown: function () {
                 window.tts.registration.init(this);
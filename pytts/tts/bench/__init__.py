@@ -0,0 +1,28 @@
+"""
+Microbenchmarks, run them with ``python -m tts.bench.<module>``
+"""
+
+from timeit import repeat
+
+
+def measure(statement, number: int) -> float:
+    """
+    Measure a callable and deliver the best time per call
+
+    :param statement: Callable to measure
+    :param int number: Number of calls per round
+    :return: Best time per call in microseconds
+    :rtype: float
+    """
+    return min(repeat(statement, number=number, repeat=5)) / number * 1000000
+
+
+def report(results: dict) -> None:
+    """
+    Print the results of a benchmark
+
+    :param dict results: Names and times per call in microseconds
+    """
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        print('{:s}  {:10.3f} us'.format(name.ljust(width), value))
@@ -0,0 +1,77 @@
+"""
+Cost of the JSON chain of a single API call: request body, queue message, reply and response
+"""
+
+from collections import OrderedDict
+import json
+from time import time
+from uuid import uuid4
+
+from . import measure, report
+from ..util.codec import StandardBackend, available_backends
+
+
+BODY = StandardBackend.encode({
+    'registration_key': str(uuid4()),
+    'token': 'a' * 64,
+    'username': 'username',
+})
+
+REPLY = {
+    'registration_key': str(uuid4()),
+    'token': 'b' * 64,
+    'username_message': 'username_available',
+    'username': 'username',
+}
+
+
+def legacy_chain() -> bytes:
+    """
+    The chain as it used to be: ``get_json``, ``dumps``/``loads`` through the queue and a pretty printing ``jsonify``
+
+    :return: Response body
+    :rtype: bytes
+    """
+    data = json.loads(BODY.decode('utf-8'))
+    message = json.dumps({'_': 'registration:choose_username', '_uuid': str(uuid4()), '_time': time(), 'data': data})
+    json.loads(message)
+    reply = json.dumps(REPLY)
+    return json.dumps(json.loads(reply), indent=2).encode('utf-8')
+
+
+def codec_chain(backend) -> bytes:
+    """
+    The same chain with a codec backend
+
+    :param backend: The codec backend
+    :return: Response body
+    :rtype: bytes
+    """
+    data = backend.decode(BODY)
+    message = backend.encode({
+        '_': 'registration:choose_username',
+        '_uuid': str(uuid4()),
+        '_time': time(),
+        'data': data,
+    })
+    backend.decode(message)
+    reply = backend.encode(REPLY)
+    return backend.encode(backend.decode(reply))
+
+
+def run(number: int=20000) -> dict:
+    """
+    Run the benchmark
+
+    :param int number: Number of chains per round
+    :return: Names and times per chain in microseconds
+    :rtype: dict
+    """
+    results = OrderedDict([('legacy (json, pretty response)', measure(legacy_chain, number))])
+    for backend in available_backends():
+        results['codec ({:s})'.format(backend.name)] = measure(lambda backend=backend: codec_chain(backend), number)
+    return results
+
+
+if __name__ == '__main__':
+    report(run())
@@ -0,0 +1,61 @@
+"""
+Cost of creating tokens and salts: one ``SystemRandom`` call per character or byte (as it used to be) versus bulk
+``os.urandom`` reads
+"""
+
+from collections import OrderedDict
+from random import SystemRandom
+
+from . import measure, report
+from ..core.lib.entropy import TOKEN_CHARS, salt, token, tokens
+from ..core.rules import RULE_TOKEN
+
+
+def legacy_token() -> str:
+    """
+    The former ``token_generator``: 64 calls of ``randrange`` and string concatenation
+
+    :return: A token
+    :rtype: str
+    """
+    rand = SystemRandom()
+    result = ''
+    while len(result) < 64:
+        result += TOKEN_CHARS[rand.randrange(len(TOKEN_CHARS))]
+    return result
+
+
+def legacy_salt() -> bytes:
+    """
+    The former ``create_salt``: 64 calls of ``randint`` into a list
+
+    :return: A salt
+    :rtype: bytes
+    """
+    rand = SystemRandom()
+    salt_bytes = []
+    while len(salt_bytes) < 64:
+        salt_bytes.append(rand.randint(0, 255))
+    return bytes(salt_bytes)
+
+
+def run(number: int=10000) -> dict:
+    """
+    Run the benchmark
+
+    :param int number: Number of tokens or salts per round
+    :return: Names and times per token or salt in microseconds
+    :rtype: dict
+    """
+    assert RULE_TOKEN.match(legacy_token()) and RULE_TOKEN.match(token())
+    return OrderedDict([
+        ('legacy token', measure(legacy_token, number)),
+        ('urandom token', measure(token, number)),
+        ('urandom token, batches of 100', measure(lambda: tokens(100), number // 100) / 100),
+        ('legacy salt', measure(legacy_salt, number)),
+        ('urandom salt', measure(salt, number)),
+    ])
+
+
+if __name__ == '__main__':
+    report(run())
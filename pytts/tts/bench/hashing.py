@@ -0,0 +1,137 @@
+"""
+Cost of the password hash versions and calibration of their parameters
+
+Run ``python -m tts.bench.hashing [target latency in ms]``. For every configured hash version the latency of one hash
+and the throughput of one core and of all cores is measured. For every algorithm the parameters reaching the target
+latency are recommended, ready to be added as a new version to the ``hashing`` section of ``tt-server.json``.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from json import dumps
+from math import log2
+from os import cpu_count
+import sys
+from time import perf_counter
+
+from ..core.lib.hash import HashingService, create_salt, hash_password, scrypt
+
+
+PASSWORD = 'correct horse battery staple'
+BASELINES = OrderedDict([
+    ('sha512_chain', {'algorithm': 'sha512_chain', 'rounds': 10000}),
+    ('pbkdf2_sha512', {'algorithm': 'pbkdf2_sha512', 'iterations': 10000}),
+    ('scrypt', {'algorithm': 'scrypt', 'n': 1024, 'r': 8, 'p': 1}),
+])
+WORK_FACTORS = {
+    'sha512_chain': 'rounds',
+    'pbkdf2_sha512': 'iterations',
+    'scrypt': 'n',
+}
+
+
+def latency(settings: dict, samples: int=3) -> float:
+    """
+    Measure the best latency of one hash
+
+    :param dict settings: Algorithm and parameters
+    :param int samples: Number of hashes
+    :return: Seconds per hash
+    :rtype: float
+    """
+    salt = create_salt()
+    times = []
+    for dummy in range(samples):
+        start = perf_counter()
+        hash_password(PASSWORD, salt, settings)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def throughput(settings: dict, workers: int, hashes: int) -> float:
+    """
+    Measure the throughput of worker processes, like the hashing service runs them
+
+    :param dict settings: Algorithm and parameters
+    :param int workers: Number of worker processes
+    :param int hashes: Number of hashes
+    :return: Hashes per second
+    :rtype: float
+    """
+    salt = create_salt()
+    with ProcessPoolExecutor(workers) as executor:
+        list(executor.map(hash_password, [PASSWORD] * workers, [salt] * workers, [settings] * workers))
+        start = perf_counter()
+        list(executor.map(hash_password, [PASSWORD] * hashes, [salt] * hashes, [settings] * hashes))
+        return hashes / (perf_counter() - start)
+
+
+def recommend(algorithm: str, target: float) -> dict:
+    """
+    Scale the work factor of an algorithm to the target latency, the cost grows linearly with the work factor
+
+    :param str algorithm: Name of the algorithm
+    :param float target: Target latency in seconds
+    :return: Algorithm and parameters
+    :rtype: dict
+    """
+    settings = dict(BASELINES[algorithm])
+    factor = WORK_FACTORS[algorithm]
+    scaled = settings[factor] * target / latency(settings)
+    if algorithm == 'scrypt':
+        settings[factor] = 2 ** max(int(log2(scaled)), 1)
+    else:
+        settings[factor] = max(int(round(scaled, -3)), 1000)
+    return settings
+
+
+def run(target: float=0.25) -> tuple:
+    """
+    Run the benchmark
+
+    :param float target: Target latency in seconds
+    :return: Measurements of the configured versions and recommended parameters by algorithm
+    :rtype: tuple
+    """
+    cores = cpu_count() or 1
+    service = HashingService()
+    measurements = OrderedDict()
+    for version, settings in sorted(service.versions.items()):
+        if settings['algorithm'] == 'scrypt' and scrypt is None:
+            continue
+        seconds = latency(settings)
+        hashes = max(int(2.0 / seconds), 2)
+        measurements[version] = {
+            'latency': seconds,
+            'core': throughput(settings, 1, hashes),
+            'all': throughput(settings, cores, hashes * cores),
+        }
+    recommendations = OrderedDict(
+        (algorithm, recommend(algorithm, target))
+        for algorithm in BASELINES if algorithm != 'scrypt' or scrypt is not None
+    )
+    return measurements, recommendations
+
+
+def main(argv: list) -> None:
+    """
+    Print the measurements and recommendations
+
+    :param list argv: Command line arguments, the first one is the target latency in milliseconds
+    """
+    target = float(argv[1]) / 1000.0 if len(argv) > 1 else 0.25
+    measurements, recommendations = run(target)
+    print('{:<20s} {:>12s} {:>14s} {:>14s}'.format('version', 'latency [ms]', 'core [1/s]', 'all cores [1/s]'))
+    for version, measurement in measurements.items():
+        print('{:<20s} {:>12.1f} {:>14.2f} {:>14.2f}'.format(
+            version, measurement['latency'] * 1000.0, measurement['core'], measurement['all']
+        ))
+    print()
+    print('Parameters for {:.0f} ms per hash, add them as a new version to tts.hashing.versions:'.format(
+        target * 1000.0
+    ))
+    print(dumps(recommendations, indent=2))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
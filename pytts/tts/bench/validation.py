@@ -0,0 +1,65 @@
+"""
+Cost of validating request data: a list of closures per request (as it used to be) versus a compiled schema
+"""
+
+from collections import OrderedDict
+
+from . import measure, report
+from ..api.base.schema import Field, Schema
+from ..core.rules import RULE_USERNAME, RULE_TOKEN, RULE_UUID
+
+
+SCHEMA = Schema(
+    Field('token', rule=RULE_TOKEN),
+    Field('username', rule=RULE_USERNAME),
+    Field('registration_key', rule=RULE_UUID),
+)
+
+REQUEST = {
+    'token': 'a' * 64,
+    'username': 'username',
+    'registration_key': '01234567-89ab-cdef-0123-456789abcdef',
+}
+
+
+def closures(json_data: dict) -> bool:
+    """
+    The former way of validating ``choose_username``: build ten lambdas and evaluate them lazily
+
+    :param dict json_data: Request data
+    :return: ``True`` when the data is valid
+    :rtype: bool
+    """
+    return not any(check() for check in [
+        lambda: json_data is None,
+        lambda: 'token' not in json_data,
+        lambda: 'username' not in json_data,
+        lambda: 'registration_key' not in json_data,
+        lambda: not isinstance(json_data['token'], str),
+        lambda: not isinstance(json_data['username'], str),
+        lambda: not isinstance(json_data['registration_key'], str),
+        lambda: not RULE_TOKEN.match(json_data['token']),
+        lambda: not RULE_USERNAME.match(json_data['username']),
+        lambda: not RULE_UUID.match(json_data['registration_key']),
+    ])
+
+
+def run(number: int=100000) -> dict:
+    """
+    Run the benchmark
+
+    :param int number: Number of validations per round
+    :return: Names and times per validation in microseconds
+    :rtype: dict
+    """
+    validator = SCHEMA.compile()
+    assert closures(REQUEST) and validator.is_valid(REQUEST)
+    return OrderedDict([
+        ('closures', measure(lambda: closures(REQUEST), number)),
+        ('compiled schema', measure(lambda: validator.is_valid(REQUEST), number)),
+        ('compiled schema + extract', measure(lambda: validator.validate(REQUEST), number)),
+    ])
+
+
+if __name__ == '__main__':
+    report(run())
@@ -2,18 +2,27 @@
 This holds stuff to manage our server instance
 """
 
-from os import path
-
 from blackred import BlackRed
 import cherrypy
+from pymongo import UpdateOne
 
-from ..api.server import REST_APPLICATION
-from ..app.server import StaticServer
+from ..api.server import REST_APPLICATION, __version__ as API_VERSION
+from ..app.assets import AssetBuilder, static_configuration
+from ..app.server import AssetServer, StaticServer
 from ..core.dispatcher import CoreDispatcher
+from ..core.lib.bloom import UsernameFilter
 from ..core.lib.db import UserDatabaseConnectivity
+from ..core.lib.hash import HashingService
+from ..core.lib.stats import UserStatistics
+from ..util.codec import JSONCodec
 from ..util.config import ConfigurationFileFinder
+from ..util.log import LogService
+from ..util.metrics import REGISTRY, MetricsService
+from ..util.profiling import PROFILE_RESULT, Profiler
 from ..util.queue.redis import RedisQueueConsumer, RedisQueueAccess
 from ..util.singleton import SingletonMeta
+from ..util.tracing import TRACER
+from .pools import POOL_STATISTICS, PoolMiddleware, collect_pool_metrics, pools_from_configuration
 
 
 class ControlManager(object, metaclass=SingletonMeta):
@@ -25,6 +34,16 @@ class ControlManager(object, metaclass=SingletonMeta):
     command_handler = None
     server = None
     engine = None
+    pools = None
+    metrics = None
+    profiler = None
+    log_service = None
+    routes = (
+        ('/api/v{:s}/admin'.format(API_VERSION), 'admin'),
+        ('/api/v{:s}/batch'.format(API_VERSION), 'admin'),
+        ('/api/version', 'static'),
+        ('/api/', 'api'),
+    )
 
     @staticmethod
     def __configure_blackred():
@@ -57,6 +76,19 @@ class ControlManager(object, metaclass=SingletonMeta):
         coll.create_index([
             ('username', 1),
         ], unique=True)
+        updates = []
+        for user in coll.find({'username_lower': {'$exists': False}}, projection={'username': True}):
+            updates.append(UpdateOne({'_id': user['_id']}, {'$set': {'username_lower': user['username'].lower()}}))
+            if len(updates) >= 1000:
+                coll.bulk_write(updates, ordered=False)
+                updates = []
+        if len(updates) > 0:
+            coll.bulk_write(updates, ordered=False)
+        coll.create_index([
+            ('username_lower', 1),
+        ])
+        if UsernameFilter().enabled:
+            UsernameFilter().rebuild(coll)
 
     def __init__(self, no_init: bool=False) -> None:
         """
@@ -97,6 +129,16 @@ class ControlManager(object, metaclass=SingletonMeta):
         """
         if self.command_handler is not None:
             self.command_handler.stop()
+        if self.metrics is not None:
+            self.metrics.stop()
+            self.metrics = None
+        TRACER.shutdown()
+        HashingService().shutdown()
+        if 'stats' in ConfigurationFileFinder().find_as_json()['tts']:
+            UserStatistics().stop()
+        if self.log_service is not None:
+            self.log_service.stop()
+            self.log_service = None
         if self.server is not None:
             self.server.bus.exit()
 
@@ -108,12 +150,8 @@ class ControlManager(object, metaclass=SingletonMeta):
         """
         if self.server is not None:
             raise SystemError('Server already defined')
-        static_path = path.abspath(path.join(
-            path.dirname(__file__),
-            '..',
-            'app',
-            'static'
-        ))
+        static_settings = static_configuration()
+        AssetBuilder(static_settings['source'], static_settings['build_dir'], static_settings['brotli']).build()
         csp_sources = ['default', 'script', 'style', 'img', 'connect', 'font', 'object', 'media', 'frame']
         csp_default_source = "'self'"
         csp_rules = list()
@@ -123,10 +161,23 @@ class ControlManager(object, metaclass=SingletonMeta):
         cherrypy.config.update({
             'engine.autoreload.on': False,
         })
-        cherrypy.tree.mount(StaticServer(), '/', config={
+        root = StaticServer()
+        root.static = AssetServer(static_settings, {
+            'xhtml': 'application/xhtml+xml; charset=utf-8',
+            'html': 'text/html; charset=utf-8',
+            'js': 'application/javascript; charset=utf-8',
+            'css': 'text/css; charset=utf-8',
+            'png': 'image/png',
+            'svg': 'image/svg+xml',
+            'eot': 'application/vnd.ms-fontobject',
+            'ttf': 'application/font-sfnt',
+            'woff': 'application/font-woff',
+            'woff2': 'font/woff2',
+        })
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        self.pools = pools_from_configuration(config['server'] if 'server' in config else {})
+        application = cherrypy.Application(root, '', config={
             '/static': {
-                'tools.staticdir.on': True,
-                'tools.staticdir.dir': static_path,
                 'tools.encode.on': False,
                 'tools.response_headers.on': True,
                 'tools.response_headers.headers': [
@@ -137,41 +188,103 @@ class ControlManager(object, metaclass=SingletonMeta):
                     ('X-Webkit-CSP', csp),
                     ('X-Content-Type-Options', 'nosniff'),
                 ],
-                'tools.staticdir.content_types': {
-                    'xhtml': 'application/xhtml+xml; charset=utf-8',
-                    'html': 'text/html; charset=utf-8',
-                    'js': 'application/javascript; charset=utf-8',
-                    'css': 'text/css; charset=utf-8',
-                    'png': 'image/png',
-                },
             },
         })
-        cherrypy.tree.graft(REST_APPLICATION, '/api')
+        cherrypy.tree.graft(PoolMiddleware(application, self.pools, self.routes), '/')
+        cherrypy.tree.graft(PoolMiddleware(REST_APPLICATION, self.pools, self.routes), '/api')
         self.server = cherrypy.server
         self.server.socket_host = '127.0.0.1'
         self.server.socket_port = 8080
-        config = ConfigurationFileFinder().find_as_json()['tts']
         if 'server' in config and 'bind_ip' in config['server']:
             self.server.socket_host = config['server']['bind_ip']
         if 'server' in config and 'bind_port' in config['server']:
             self.server.socket_port = config['server']['bind_port']
-        self.server.thread_pool = 30
+        self.server.thread_pool = sum(pool.threads for pool in self.pools.values())
+        pools = self.pools
+        REGISTRY.register_collector('pools', lambda: collect_pool_metrics(pools))
+        if 'stats' in config:
+            REGISTRY.register_collector('user_stats', UserStatistics().collect)
+            UserStatistics().start()
+        if 'metrics' in config and ('enabled' not in config['metrics'] or config['metrics']['enabled']):
+            self.metrics = MetricsService()
+            self.metrics.start()
+        if 'tracing' in config:
+            TRACER.configure(config['tracing'])
+        if 'logging' in config:
+            self.log_service = LogService()
+            self.log_service.start()
         self.server.subscribe()
         self.engine = cherrypy.engine
         self.engine.start()
 
+    def publish_pool_statistics(self) -> None:
+        """
+        Store the utilization of the request pools in Redis for the shell
+        """
+        if self.pools is None or self.command_handler is None:
+            return
+        self.command_handler.get_connection().set(POOL_STATISTICS, JSONCodec().encode({
+            name: pool.statistics for name, pool in self.pools.items()
+        }), ex=60)
+
+    def publish_profile_result(self, result: str) -> None:
+        """
+        Store the result of a profile in Redis for the shell
+
+        :param str result: Path of the result file or a message
+        """
+        if self.command_handler is None:
+            return
+        self.command_handler.get_connection().set(PROFILE_RESULT, result, ex=3600)
+
+    def profile(self, argument: str) -> None:
+        """
+        Sample the stacks of all threads in the background
+
+        :param str argument: Duration of the profile in seconds, 10 seconds by default
+        :raises SyntaxError: When the duration is not a number
+        """
+        try:
+            seconds = float(argument) if argument else 10.0
+        except ValueError:
+            raise SyntaxError('Invalid Command')
+        if self.profiler is None:
+            self.profiler = Profiler()
+        if not self.profiler.profile(seconds, self.publish_profile_result):
+            self.publish_profile_result('A profile is already running')
+
+    def heap_snapshot(self, argument: str) -> None:
+        """
+        Take a heap snapshot and report the growth of the allocations since the previous one
+
+        :param str argument: ``stop`` to stop tracing the allocations
+        """
+        if self.profiler is None:
+            self.profiler = Profiler()
+        if argument == 'stop':
+            self.profiler.heap.stop()
+            self.publish_profile_result('Stopped tracing allocations')
+            return
+        file = self.profiler.heap_snapshot()
+        self.publish_profile_result(file if file is not None else 'Baseline taken, tracing allocations')
+
     def manage(self, command: bytes) -> None:
         """
-        Manage incoming commands
+        Manage incoming commands, a command may be followed by an argument
 
         :param command: The raw command
         """
+        cmd, dummy, argument = command.decode(encoding='UTF-8').strip().partition(' ')
+        argument = argument.strip()
         callback_functions = {
             'stop': self.stop,
             'start': self.start,
+            'pools': self.publish_pool_statistics,
+            'profile': lambda: self.profile(argument),
+            'heapsnap': lambda: self.heap_snapshot(argument.lower()),
         }
 
-        cmd = command.decode(encoding='UTF-8').lower()
+        cmd = cmd.lower()
         if cmd not in callback_functions.keys():
             raise SyntaxError('Invalid Command')
         callback_functions[cmd]()
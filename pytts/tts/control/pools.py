@@ -0,0 +1,251 @@
+"""
+Bulkheads for the web server: every route class gets its own share of the worker threads
+"""
+
+from threading import Condition
+
+from ..util.codec import JSONCodec
+from ..util.metrics import REGISTRY
+
+
+POOL_STATISTICS = 'PYTTS_POOL_STATISTICS'
+DEFAULT_POOLS = {
+    'static': {
+        'size': 10,
+        'queue': 10,
+        'timeout': 5.0,
+    },
+    'api': {
+        'size': 16,
+        'queue': 0,
+        'timeout': 0.0,
+    },
+    'admin': {
+        'size': 4,
+        'queue': 0,
+        'timeout': 0.0,
+    },
+}
+REJECTED = REGISTRY.counter('tts_pool_rejected_total', 'Requests rejected because their pool was full', ('pool',))
+ACTIVE = REGISTRY.gauge('tts_pool_active', 'Requests handled by a pool', ('pool',))
+WAITING = REGISTRY.gauge('tts_pool_waiting', 'Requests waiting for a slot of a pool', ('pool',))
+SIZE = REGISTRY.gauge('tts_pool_size', 'Slots of a pool', ('pool',))
+
+
+class RequestPool(object):
+    """
+    Limit the number of requests of a route class that are handled at the same time. Up to ``queue`` further requests
+    wait ``timeout`` seconds for a free slot, all others are rejected.
+    """
+
+    def __init__(self, name: str, size: int, queue: int=0, timeout: float=0.0):
+        """
+        Create the pool
+
+        :param str name: Name of the route class
+        :param int size: Number of requests handled at the same time
+        :param int queue: Number of requests waiting for a free slot
+        :param float timeout: Seconds a request waits for a free slot
+        """
+        self.name = name
+        self.size = size
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.peak = 0
+        self.served = 0
+        self.rejected = 0
+        self.__condition = Condition()
+
+    def acquire(self) -> bool:
+        """
+        Take a slot of the pool
+
+        :return: ``False``, when the pool is full
+        :rtype: bool
+        """
+        with self.__condition:
+            if self.active >= self.size:
+                if self.waiting >= self.queue:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+                try:
+                    acquired = self.__condition.wait_for(lambda: self.active < self.size, self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not acquired:
+                    self.rejected += 1
+                    return False
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return True
+
+    def release(self) -> None:
+        """
+        Give a slot back to the pool
+        """
+        with self.__condition:
+            self.active -= 1
+            self.served += 1
+            self.__condition.notify()
+
+    @property
+    def threads(self) -> int:
+        """
+        Number of worker threads the pool can occupy, including the waiting requests
+
+        :return: Size plus queue limit
+        :rtype: int
+        """
+        return self.size + self.queue
+
+    @property
+    def statistics(self) -> dict:
+        """
+        Get the utilization of the pool
+
+        :return: Dictionary with the limits and counters
+        :rtype: dict
+        """
+        with self.__condition:
+            return {
+                'size': self.size,
+                'queue': self.queue,
+                'active': self.active,
+                'waiting': self.waiting,
+                'peak': self.peak,
+                'served': self.served,
+                'rejected': self.rejected,
+            }
+
+
+def pools_from_configuration(config: dict) -> dict:
+    """
+    Create the request pools from the ``pools`` section of the server configuration
+
+    :param dict config: Server configuration
+    :return: Request pools by name
+    :rtype: dict
+    """
+    pools = {}
+    for name, defaults in DEFAULT_POOLS.items():
+        settings = dict(defaults)
+        if 'pools' in config and name in config['pools']:
+            settings.update(config['pools'][name])
+        pools[name] = RequestPool(name, settings['size'], settings['queue'], settings['timeout'])
+    return pools
+
+
+def collect_pool_metrics(pools: dict) -> None:
+    """
+    Update the pool gauges
+
+    :param dict pools: Request pools by name
+    """
+    for name, pool in pools.items():
+        statistics = pool.statistics
+        ACTIVE.set(statistics['active'], (name,))
+        WAITING.set(statistics['waiting'], (name,))
+        SIZE.set(statistics['size'], (name,))
+
+
+class PooledResponse(object):
+    """
+    Response iterable that gives the slot back, when the server closes it
+    """
+
+    def __init__(self, result, pool: RequestPool):
+        """
+        Wrap the response
+
+        :param result: Iterable of the wrapped application
+        :param RequestPool pool: Pool the slot was taken from
+        """
+        self.__result = result
+        self.__pool = pool
+        self.__released = False
+
+    def __iter__(self):
+        """
+        Iterate the wrapped response
+
+        :return: Iterator of the body
+        """
+        return iter(self.__result)
+
+    def close(self) -> None:
+        """
+        Close the wrapped response and release the slot
+        """
+        try:
+            if hasattr(self.__result, 'close'):
+                self.__result.close()
+        finally:
+            if not self.__released:
+                self.__released = True
+                self.__pool.release()
+
+
+class PoolMiddleware(object):
+    """
+    WSGI middleware that runs every request in the pool of its route class and answers ``503``, when it is full
+    """
+
+    def __init__(self, application, pools: dict, routes: tuple, default: str='static'):
+        """
+        Wrap an application
+
+        :param application: WSGI application
+        :param dict pools: Request pools by name
+        :param tuple routes: Pairs of path prefix and pool name, the first match wins
+        :param str default: Pool of requests no prefix matches
+        """
+        self.application = application
+        self.pools = pools
+        self.routes = routes
+        self.default = default
+        self.overloaded = JSONCodec().encode({
+            'error': {
+                'code': -4,
+                'message': 'overloaded',
+            },
+        })
+
+    def route(self, request_path: str) -> RequestPool:
+        """
+        Find the pool of a request
+
+        :param str request_path: Full path of the request
+        :return: The pool
+        :rtype: RequestPool
+        """
+        for prefix, name in self.routes:
+            if request_path.startswith(prefix):
+                return self.pools[name]
+        return self.pools[self.default]
+
+    def __call__(self, environ: dict, start_response):
+        """
+        Handle a request
+
+        :param dict environ: WSGI environment
+        :param start_response: WSGI start_response callable
+        :return: Response iterable
+        """
+        pool = self.route(environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', ''))
+        if not pool.acquire():
+            REJECTED.inc(labels=(pool.name,))
+            start_response('503 Service Unavailable', [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(self.overloaded))),
+                ('Retry-After', '1'),
+            ])
+            return [self.overloaded]
+        try:
+            result = self.application(environ, start_response)
+        except BaseException:
+            pool.release()
+            raise
+        return PooledResponse(result, pool)
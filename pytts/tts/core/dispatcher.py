@@ -3,15 +3,28 @@
 Core Dispatcher for working from the Queue
 """
 
-from json import loads, dumps
+from logging import getLogger
 from time import time
 
 from redis import StrictRedis
 
+from .functions import FUNCTION_TABLE
 from .registry import FUNCTIONS
 from ..util.config import ConfigurationFileFinder
+from ..util.metrics import REGISTRY
+from ..util.queue.envelope import EnvelopeCodec
 from ..util.queue.redis import RedisQueueConsumer, RedisQueueAccess
 from ..util.singleton import SingletonMeta
+from ..util.slowlog import TIMING
+from ..util.tracing import TRACER
+
+
+MESSAGES = REGISTRY.counter('tts_dispatcher_messages_total', 'Messages taken from the API queue',
+                            ('function', 'outcome'))
+WAIT_SECONDS = REGISTRY.histogram('tts_dispatcher_wait_seconds', 'Time messages waited in the API queue', ('function',))
+HANDLER_SECONDS = REGISTRY.histogram('tts_dispatcher_handler_seconds', 'Duration of the exported functions',
+                                     ('function',))
+LOG = getLogger('tts.dispatch')
 
 
 class DispatcherThread:
@@ -26,6 +39,7 @@ class DispatcherThread:
         :param access: The Redis Queue Access
         """
         self.__access = access
+        self.__envelopes = EnvelopeCodec(FUNCTION_TABLE)
 
     def __call__(self, workload: bytes) -> None:
         """
@@ -33,23 +47,73 @@ class DispatcherThread:
 
         :param workload: The workload to handle
         """
-        data = loads(workload.decode('utf-8'), encoding='utf-8')
-        if '_' not in data or '_uuid' not in data or '_time' not in data or 'data' not in data:
+        dequeued = time()
+        envelope = self.__envelopes.unpack(workload)
+        if envelope is None:
+            MESSAGES.inc(labels=('-', 'invalid'))
+            LOG.warning('invalid message', extra={'size': len(workload), 'outcome': 'invalid'})
             return
-        max_age = time() - 20
-        if data['_time'] < max_age:
-            return
-        if data['_'] in FUNCTIONS:
-            response = FUNCTIONS[data['_']](data['data'])
+        function = envelope.function if envelope.function in FUNCTIONS else '-'
+        waited = max(dequeued - envelope.created, 0.0)
+        WAIT_SECONDS.observe(waited, (function,))
+        with TRACER.continue_trace(envelope.trace, 'dispatch {:s}'.format(function)) as span:
+            span.set('queue.wait', waited)
+            span.set('queue.expired', envelope.expired)
+            outcome = self.__dispatch(envelope, function, dequeued)
+        MESSAGES.inc(labels=(function, outcome))
+        LOG.info('dispatch', extra={
+            'function': function,
+            'uuid': envelope.uuid,
+            'size': len(workload),
+            'outcome': outcome,
+            'wait': waited,
+            'duration': time() - dequeued,
+        })
+
+    def __dispatch(self, envelope, function: str, dequeued: float) -> str:
+        """
+        Run the function of the message and publish the reply together with the times of the dispatcher stages
+
+        :param Envelope envelope: The unpacked message
+        :param str function: Label of the function
+        :param float dequeued: Time the message was taken from the queue
+        :return: Outcome: ``expired``, ``handled``, ``failed`` or ``unexported``
+        :rtype: str
+        """
+        if envelope.expired:
+            return 'expired'
+        handler_start = handler_end = None
+        if envelope.function in FUNCTIONS:
+            handler_start = time()
+            try:
+                with HANDLER_SECONDS.time((function,)), TRACER.span(envelope.function):
+                    response = FUNCTIONS[envelope.function](envelope.data)
+                outcome = 'handled'
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception('function failed', extra={'function': function, 'uuid': envelope.uuid})
+                outcome = 'failed'
+                response = {
+                    'error': {
+                        'code': -5,
+                        'message': 'internal error',
+                    }
+                }
+            handler_end = time()
         else:
+            outcome = 'unexported'
             response = {
                 'error': {
                     'code': -2,
                     'message': 'unexported function',
                 }
             }
+        if isinstance(response, dict):
+            response = dict(response)
+            response[TIMING] = [dequeued, handler_start, handler_end, time()]
         redis = StrictRedis(connection_pool=self.__access.connection_pool)
-        redis.publish('req_{:s}'.format(data['_uuid']), dumps(response))
+        with TRACER.span('redis PUBLISH'):
+            redis.publish('req_{:s}'.format(envelope.uuid), self.__envelopes.pack_reply(envelope, response))
+        return outcome
 
 
 class CoreDispatcher(metaclass=SingletonMeta):
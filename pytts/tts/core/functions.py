@@ -0,0 +1,23 @@
+"""
+Table of the exported functions for the compact queue envelope
+
+The position in the table is the function id on the wire. Only append to this table - changing the position of a
+function breaks the communication with servers running another version.
+"""
+
+FUNCTION_TABLE = (
+    None,
+    'admin:enable_user',
+    'admin:disable_user',
+    'admin:set_password',
+    'registration:prepare',
+    'registration:choose_username',
+    'registration:set_password',
+    'login:authenticate',
+    'login:status',
+    'admin:bulk_enable_users',
+    'admin:bulk_disable_users',
+    'admin:bulk_set_passwords',
+    'admin:list_users',
+    'admin:stats',
+)
@@ -0,0 +1,190 @@
+"""
+Bloom filter of the taken user names
+
+The filter answers "certainly not taken" without asking MongoDB, "maybe taken" falls through to the index. It is a
+bitmap in Redis shared by all processes, rebuilt from MongoDB at startup and updated on every registration. Its size
+follows from the expected number of users and the accepted false positive rate.
+"""
+
+from hashlib import sha256
+from math import ceil, exp, log
+from os import getpid
+from socket import gethostname
+
+import redis
+
+from ...util.config import ConfigurationFileFinder
+from ...util.metrics import REGISTRY
+from ...util.redis import RedisConfiguration
+from ...util.singleton import SingletonMeta
+from ...util.tracing import TRACER
+
+
+CHECKS = REGISTRY.counter('tts_username_filter_checks_total', 'Checks of the user name Bloom filter', ('result',))
+
+
+class BloomFilter(object):
+    """
+    Size and bit positions of a Bloom filter
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        Size the filter
+
+        :param int capacity: Expected number of items
+        :param float error_rate: Accepted false positive rate at the expected number of items
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = int(ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hashes = max(int(round(self.bits / capacity * log(2))), 1)
+
+    def positions(self, item: str) -> list:
+        """
+        Get the bit positions of an item by double hashing
+
+        :param str item: The item
+        :return: Bit positions
+        :rtype: list
+        """
+        digest = sha256(item.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        return [(first + index * second) % self.bits for index in range(self.hashes)]
+
+    def false_positive_rate(self, items: int) -> float:
+        """
+        Expected false positive rate
+
+        :param int items: Number of items in the filter
+        :return: Probability that an item not in the filter is reported as maybe contained
+        :rtype: float
+        """
+        return (1.0 - exp(-self.hashes * items / self.bits)) ** self.hashes
+
+    def build(self, items) -> tuple:
+        """
+        Build the bitmap of some items, bit 0 is the most significant bit of the first byte like in Redis
+
+        :param items: Iterable of items
+        :return: The bitmap and the number of items
+        :rtype: tuple
+        """
+        bitmap = bytearray((self.bits + 7) // 8)
+        count = 0
+        for item in items:
+            count += 1
+            for position in self.positions(item):
+                bitmap[position >> 3] |= 0x80 >> (position & 7)
+        return bitmap, count
+
+
+class UsernameFilter(RedisConfiguration, metaclass=SingletonMeta):
+    """
+    Bloom filter of the normalized user names in Redis
+    """
+
+    KEY = 'PYTTS_USERNAME_FILTER'
+    COUNT = 'PYTTS_USERNAME_FILTER_COUNT'
+    LOCK = 'PYTTS_USERNAME_FILTER_REBUILD'
+
+    def __init__(self):
+        """
+        Configure the filter from the ``username_filter`` section of the configuration file, without the section the
+        filter is disabled
+        """
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        configuration = config['username_filter'] if 'username_filter' in config else {'enabled': False}
+        super(UsernameFilter, self).__init__(configuration)
+        self.enabled = True
+        if 'enabled' in configuration:
+            self.enabled = bool(configuration['enabled'])
+        capacity = 1000000
+        if 'capacity' in configuration:
+            capacity = configuration['capacity']
+        error_rate = 0.001
+        if 'error_rate' in configuration:
+            error_rate = configuration['error_rate']
+        self.filter = BloomFilter(capacity, error_rate)
+        self.__connection_pool = self.create_redis_connection_pool()
+
+    def might_contain(self, username: str) -> bool:
+        """
+        Check a user name with one round-trip to Redis
+
+        :param str username: The user name
+        :return: ``False``, when the user name is certainly not taken, ``True`` also when the filter is not built yet
+        :rtype: bool
+        """
+        pipeline = redis.StrictRedis(connection_pool=self.__connection_pool).pipeline(transaction=False)
+        pipeline.exists(self.KEY)
+        for position in self.filter.positions(username.lower()):
+            pipeline.getbit(self.KEY, position)
+        with TRACER.span('redis getbit'):
+            bits = pipeline.execute()
+        return not bits[0] or all(bits[1:])
+
+    def add(self, username: str) -> None:
+        """
+        Add a user name, unless the filter is not built yet - a filter with only the new user names would report
+        all older ones as not taken
+
+        :param str username: The user name
+        """
+        connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+        if not connection.exists(self.KEY):
+            return
+        pipeline = connection.pipeline(transaction=False)
+        for position in self.filter.positions(username.lower()):
+            pipeline.setbit(self.KEY, position, 1)
+        pipeline.incr(self.COUNT)
+        with TRACER.span('redis setbit'):
+            pipeline.execute()
+
+    def rebuild(self, collection) -> int:
+        """
+        Build the filter from all users and replace the old one, unless another process rebuilt it in the last minute.
+        User names registered while the users are read can be missing, the registration still checks the index before
+        creating a user.
+
+        :param collection: The users collection
+        :return: Number of user names, ``None`` when another process rebuilt the filter
+        :rtype: int
+        """
+        connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+        if not connection.set(self.LOCK, '{:s}:{:d}'.format(gethostname(), getpid()), nx=True, ex=60):
+            return None
+        bitmap, count = self.filter.build(
+            user['username'].lower()
+            for user in collection.find({}, projection={'_id': False, 'username': True}, batch_size=10000)
+        )
+        pipeline = connection.pipeline(transaction=True)
+        pipeline.set(self.KEY, bytes(bitmap))
+        pipeline.set(self.COUNT, count)
+        pipeline.execute()
+        return count
+
+    def report(self) -> dict:
+        """
+        Report size, fill and false positive rate of the filter
+
+        :return: Dictionary of the figures
+        :rtype: dict
+        """
+        pipeline = redis.StrictRedis(connection_pool=self.__connection_pool).pipeline(transaction=False)
+        pipeline.get(self.COUNT)
+        pipeline.bitcount(self.KEY)
+        count, set_bits = pipeline.execute()
+        items = int(count) if count is not None else 0
+        return {
+            'capacity': self.filter.capacity,
+            'items': items,
+            'bits': self.filter.bits,
+            'bytes': (self.filter.bits + 7) // 8,
+            'hashes': self.filter.hashes,
+            'fill': set_bits / self.filter.bits,
+            'target_false_positive_rate': self.filter.error_rate,
+            'false_positive_rate': self.filter.false_positive_rate(items),
+            'estimated_false_positive_rate': (set_bits / self.filter.bits) ** self.filter.hashes,
+        }
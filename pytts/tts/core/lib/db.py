@@ -2,9 +2,25 @@
 Base for using the Database(s)
 """
 
+from collections import OrderedDict
+from logging import getLogger
+from threading import Event, Lock, Thread
+from time import monotonic
+
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+import redis
 
+from ...util.codec import JSONCodec
 from ...util.config import ConfigurationFileFinder
+from ...util.metrics import BACKEND_SECONDS, REGISTRY
+from ...util.redis import RedisConfiguration
+from ...util.singleton import SingletonMeta
+
+
+LOG = getLogger('tts.cache')
+CACHE_LOOKUPS = REGISTRY.counter('tts_user_cache_lookups_total', 'Lookups in the user cache', ('tier', 'result'))
+CACHE_ENTRIES = REGISTRY.gauge('tts_user_cache_entries', 'Entries in the local user cache')
 
 
 class MongoConnectivity(object):
@@ -76,3 +92,299 @@ class UserDatabaseConnectivity(MongoConnectivity):
         :return: The collection
         """
         return self.__user_collection
+
+
+class UserCacheSettings(object):
+    """
+    Settings of the user cache from the ``user_cache`` section of the configuration file
+    """
+
+    def __init__(self):
+        """
+        Load the settings, without a ``user_cache`` section the cache is local only
+        """
+        self.enabled = True
+        self.size = 10000
+        self.ttl = 30.0
+        self.shared = False
+        self.shared_ttl = 300
+        self.change_streams = False
+        self.connection_pool = None
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'user_cache' not in config:
+            return
+        cache_config = config['user_cache']
+        self.connection_pool = RedisConfiguration(cache_config).create_redis_connection_pool()
+        if 'enabled' in cache_config:
+            self.enabled = bool(cache_config['enabled'])
+        if 'size' in cache_config:
+            self.size = cache_config['size']
+        if 'ttl' in cache_config:
+            self.ttl = cache_config['ttl']
+        if 'shared' in cache_config:
+            self.shared = bool(cache_config['shared'])
+        if 'shared_ttl' in cache_config:
+            self.shared_ttl = cache_config['shared_ttl']
+        if 'change_streams' in cache_config:
+            self.change_streams = bool(cache_config['change_streams'])
+
+
+class UserCache(object, metaclass=SingletonMeta):
+    """
+    Read-through cache of user documents by normalized user name: a bounded LRU in every process and optionally a
+    shared tier in Redis in front of MongoDB.
+
+    Every write to a user has to call ``invalidate``. It deletes the shared entry and broadcasts the user name via Redis
+    Publish/Subscribe, so every process drops its local entry. With ``change_streams`` enabled and MongoDB running as a
+    replica set, changes made outside of the server invalidate the entries as well. Entries that miss an invalidation
+    still expire after their time to live.
+
+    A miss that reads MongoDB while the user is invalidated must not cache what it read, it may be the old document.
+    Every invalidation counts up a generation of the user, locally and in Redis, and the result of a read is only
+    cached when the generation did not change in the meantime.
+
+    The shared tier stores whole user documents, password hashes and salts included, so it is disabled by default.
+    Only enable ``shared`` when the Redis database is protected like MongoDB, it saves reads of MongoDB for users
+    that are not in the local cache of the process yet.
+    """
+
+    INVALIDATION_CHANNEL = 'PYTTS_USER_CACHE_INVALIDATION'
+    FLUSH = '*'
+
+    def __init__(self, collection=None):
+        """
+        Configure the cache from the ``user_cache`` section of the configuration file
+
+        :param collection: The users collection to ask on a cache miss
+        """
+        self.__collection = collection if collection is not None else UserDatabaseConnectivity().collection
+        self.__cache = OrderedDict()
+        self.__generations = {}
+        self.__flushes = 0
+        self.__lock = Lock()
+        self.__subscribed = Event()
+        self.__threads = []
+        self.__should_run = True
+        self.__codec = JSONCodec()
+        self.settings = UserCacheSettings()
+
+    @staticmethod
+    def key(username: str) -> str:
+        """
+        Redis key of a user in the shared tier
+
+        :param str username: Normalized user name
+        :return: The key
+        :rtype: str
+        """
+        return 'PYTTS_USER_{:s}'.format(username)
+
+    @staticmethod
+    def generation_key(username: str) -> str:
+        """
+        Redis key of the generation of a user in the shared tier
+
+        :param str username: Normalized user name
+        :return: The key
+        :rtype: str
+        """
+        return 'PYTTS_USER_GENERATION_{:s}'.format(username)
+
+    def __start_listener(self) -> None:
+        """
+        Start listening for invalidations and changes, if not already done. The thread that starts the listener waits
+        until it is subscribed.
+        """
+        if len(self.__threads) > 0 or self.settings.connection_pool is None:
+            return
+        with self.__lock:
+            if len(self.__threads) > 0:
+                return
+            self.__threads.append(Thread(target=self.__listen, daemon=True))
+            if self.settings.change_streams:
+                self.__threads.append(Thread(target=self.__watch, daemon=True))
+            for thread in self.__threads:
+                thread.start()
+        self.__subscribed.wait(1.0)
+
+    def __listen(self) -> None:
+        """
+        Wait for invalidation messages on the pubsub channel
+        """
+        pubsub = redis.StrictRedis(connection_pool=self.settings.connection_pool).pubsub()
+        pubsub.subscribe(self.INVALIDATION_CHANNEL)
+        self.invalidate_local(self.FLUSH)
+        self.__subscribed.set()
+        while self.__should_run:
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=.125)
+            if message and message['type'] == 'message':
+                self.invalidate_local(message['data'].decode('utf-8'))
+        pubsub.unsubscribe(self.INVALIDATION_CHANNEL)
+
+    def __watch(self) -> None:
+        """
+        Follow the change stream of the users collection, stop when MongoDB does not provide one
+        """
+        try:
+            with self.__collection.watch(full_document='updateLookup', max_await_time_ms=125) as stream:
+                while self.__should_run and stream.alive:
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    document = change.get('fullDocument')
+                    if document is not None and 'username_lower' in document:
+                        self.invalidate_local(document['username_lower'])
+                        if self.settings.shared:
+                            pipeline = redis.StrictRedis(connection_pool=self.settings.connection_pool).pipeline(
+                                transaction=False
+                            )
+                            self.__invalidate_shared(pipeline, document['username_lower'])
+                            pipeline.execute()
+                    else:
+                        self.invalidate_local(self.FLUSH)
+        except (AttributeError, PyMongoError):  # pymongo before 3.6 has no watch
+            LOG.warning('change stream of the users collection not available', exc_info=True)
+
+    def __generation(self, username: str) -> tuple:
+        """
+        Get the local generation of a user, call with the lock held
+
+        :param str username: Normalized user name
+        :return: Number of flushes and invalidations of the user
+        :rtype: tuple
+        """
+        return self.__flushes, self.__generations.get(username, 0)
+
+    def __remember(self, username: str, user: dict, generation: tuple) -> bool:
+        """
+        Put a user into the local cache, unless it was invalidated since it was read
+
+        :param str username: Normalized user name
+        :param dict user: The user document
+        :param tuple generation: Local generation of the user before it was read
+        :return: ``True``, when the user was cached
+        :rtype: bool
+        """
+        with self.__lock:
+            if self.__generation(username) != generation:
+                return False
+            self.__cache[username] = (user, monotonic() + self.settings.ttl)
+            self.__cache.move_to_end(username)
+            while len(self.__cache) > self.settings.size:
+                self.__cache.popitem(last=False)
+            CACHE_ENTRIES.set(len(self.__cache))
+        return True
+
+    def __share(self, username: str, user: dict, generation: bytes) -> None:
+        """
+        Put a user into the shared cache, unless it was invalidated since it was read
+
+        :param str username: Normalized user name
+        :param dict user: The user document
+        :param bytes generation: Generation of the user in Redis before it was read, ``None`` if there was none
+        """
+        with redis.StrictRedis(connection_pool=self.settings.connection_pool).pipeline() as pipeline:
+            try:
+                pipeline.watch(self.generation_key(username))
+                if pipeline.get(self.generation_key(username)) != generation:
+                    return
+                pipeline.multi()
+                pipeline.set(self.key(username), self.__codec.encode(user), ex=self.settings.shared_ttl)
+                pipeline.execute()
+            except redis.WatchError:
+                pass
+
+    def __invalidate_shared(self, pipeline, username: str) -> None:
+        """
+        Add the removal of a user from the shared cache to a pipeline
+
+        :param pipeline: A Redis pipeline
+        :param str username: Normalized user name
+        """
+        pipeline.delete(self.key(username))
+        pipeline.incr(self.generation_key(username))
+        pipeline.expire(self.generation_key(username), self.settings.shared_ttl)
+
+    def get(self, username: str) -> dict:
+        """
+        Get a user by name, case insensitive, use the caches whenever possible
+
+        :param str username: The user name
+        :return: The user document without ``_id`` or ``None``, when the user does not exist
+        :rtype: dict
+        """
+        username = username.lower()
+        if not self.settings.enabled:
+            return self.__collection.find_one({'username_lower': username}, projection={'_id': False})
+        self.__start_listener()
+        now = monotonic()
+        with self.__lock:
+            entry = self.__cache.get(username)
+            if entry is not None and entry[1] > now:
+                self.__cache.move_to_end(username)
+                CACHE_LOOKUPS.inc(labels=('local', 'hit'))
+                return dict(entry[0])
+            generation = self.__generation(username)
+        CACHE_LOOKUPS.inc(labels=('local', 'miss'))
+        shared = self.settings.shared and self.settings.connection_pool is not None
+        shared_generation = None
+        if shared:
+            pipeline = redis.StrictRedis(connection_pool=self.settings.connection_pool).pipeline(transaction=False)
+            pipeline.get(self.key(username))
+            pipeline.get(self.generation_key(username))
+            with BACKEND_SECONDS.time(('redis', 'get')):
+                cached, shared_generation = pipeline.execute()
+            CACHE_LOOKUPS.inc(labels=('shared', 'hit' if cached is not None else 'miss'))
+            if cached is not None:
+                user = self.__codec.decode(cached)
+                self.__remember(username, user, generation)
+                return dict(user)
+        with BACKEND_SECONDS.time(('mongo', 'find_one')):
+            user = self.__collection.find_one({'username_lower': username}, projection={'_id': False})
+        if user is None:
+            return None
+        if self.__remember(username, user, generation) and shared:
+            with BACKEND_SECONDS.time(('redis', 'set')):
+                self.__share(username, user, shared_generation)
+        return dict(user)
+
+    def invalidate_local(self, username: str) -> None:
+        """
+        Drop a user from the local cache
+
+        :param str username: Normalized user name or ``FLUSH`` to drop everything
+        """
+        with self.__lock:
+            if username == self.FLUSH or len(self.__generations) >= self.settings.size:
+                # forgetting the generations counts as a flush for the reads in progress
+                self.__flushes += 1
+                self.__generations.clear()
+            if username == self.FLUSH:
+                self.__cache.clear()
+            else:
+                self.__generations[username] = self.__generations.get(username, 0) + 1
+                self.__cache.pop(username, None)
+            CACHE_ENTRIES.set(len(self.__cache))
+
+    def invalidate(self, usernames: list) -> None:
+        """
+        Drop users from all caches of all processes, call after every write to the users
+
+        :param list usernames: The user names
+        """
+        usernames = [username.lower() for username in usernames]
+        for username in usernames:
+            self.invalidate_local(username)
+        if self.settings.connection_pool is None or len(usernames) <= 0:
+            return
+        pipeline = redis.StrictRedis(connection_pool=self.settings.connection_pool).pipeline(transaction=False)
+        for username in usernames:
+            self.__invalidate_shared(pipeline, username)
+            pipeline.publish(self.INVALIDATION_CHANNEL, username)
+        pipeline.execute()
+
+    def stop(self) -> None:
+        """
+        Stop listening for invalidations and changes
+        """
+        self.__should_run = False
@@ -0,0 +1,85 @@
+"""
+Random tokens and salts from bulk ``os.urandom`` reads
+
+Characters are mapped from random bytes without bias: bytes at or above the largest multiple of the alphabet size are
+dropped, the remaining ones are mapped by ``bytes.translate``, so no Python code runs per character.
+"""
+
+from os import urandom
+from string import ascii_letters, digits
+
+
+TOKEN_CHARS = ascii_letters + digits
+TOKEN_LENGTH = 64
+SALT_SIZE = 64
+TRANSLATIONS = {}
+
+
+def translation(alphabet: str) -> tuple:
+    """
+    Get the translation table and the rejected bytes for an alphabet
+
+    :param str alphabet: ASCII characters to choose from, at most 256
+    :return: Table mapping every byte to a character, rejected bytes and share of accepted bytes
+    :rtype: tuple
+    :raises ValueError: When the alphabet is empty, too large or not ASCII
+    """
+    if alphabet not in TRANSLATIONS:
+        if not 0 < len(alphabet) <= 256 or not all(ord(char) < 128 for char in alphabet):
+            raise ValueError('The alphabet must consist of 1 to 256 ASCII characters')
+        limit = 256 - 256 % len(alphabet)
+        table = bytes(ord(alphabet[byte % len(alphabet)]) for byte in range(256))
+        TRANSLATIONS[alphabet] = (table, bytes(range(limit, 256)), limit / 256)
+    return TRANSLATIONS[alphabet]
+
+
+def random_string(length: int, alphabet: str=TOKEN_CHARS) -> str:
+    """
+    Create a random string
+
+    :param int length: Number of characters
+    :param str alphabet: ASCII characters to choose from
+    :return: The string
+    :rtype: str
+    """
+    table, rejected, accepted = translation(alphabet)
+    chars = b''
+    while len(chars) < length:
+        missing = length - len(chars)
+        chars += urandom(int(missing / accepted) + 8).translate(table, rejected)
+    return chars[:length].decode('ascii')
+
+
+def tokens(count: int, length: int=TOKEN_LENGTH) -> list:
+    """
+    Create several tokens with a single read
+
+    :param int count: Number of tokens
+    :param int length: Characters per token
+    :return: The tokens
+    :rtype: list
+    """
+    chars = random_string(count * length)
+    return [chars[index:index + length] for index in range(0, count * length, length)]
+
+
+def token(length: int=TOKEN_LENGTH) -> str:
+    """
+    Create a token
+
+    :param int length: Number of characters
+    :return: The token
+    :rtype: str
+    """
+    return random_string(length)
+
+
+def salt(size: int=SALT_SIZE) -> bytes:
+    """
+    Create a salt
+
+    :param int size: Number of bytes
+    :return: The salt
+    :rtype: bytes
+    """
+    return urandom(size)
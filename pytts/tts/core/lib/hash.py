@@ -1,10 +1,45 @@
 """
 Stuff around creating Hashes and Salts
+
+Hashing a password takes a lot of CPU time on purpose. ``HashingService`` runs it in a pool of processes sized to the
+cores, so the dispatcher threads stay free for cheap functions and hashing scales beyond the GIL. A thread that waits
+for a hash still blocks, so fewer threads may wait than there are dispatcher threads.
+
+Every stored hash has a version. A version names an algorithm with fixed parameters, configured in the ``versions``
+of the ``hashing`` section. New hashes use the configured ``version``; to raise the cost, add a new version instead of
+changing the parameters of an existing one. ``python -m tts.bench.hashing`` measures the cost and recommends
+parameters.
 """
 
 from base64 import b64encode, b64decode
-from hashlib import sha512
-from random import SystemRandom
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from hashlib import pbkdf2_hmac, sha512
+from os import cpu_count
+from threading import Lock
+from time import time
+
+from ...util.config import ConfigurationFileFinder
+from ...util.metrics import REGISTRY
+from ...util.singleton import SingletonMeta
+from .entropy import salt as random_salt
+
+try:
+    from hashlib import scrypt
+except ImportError:  # pragma: no cover
+    scrypt = None
+
+
+QUEUE_SECONDS = REGISTRY.histogram('tts_hash_queue_seconds', 'Time password hashes waited for a worker process')
+COMPUTE_SECONDS = REGISTRY.histogram('tts_hash_compute_seconds', 'Time spent computing password hashes')
+REJECTED = REGISTRY.counter('tts_hash_rejected_total', 'Password hashes rejected because the hashing service was full')
+PENDING = REGISTRY.gauge('tts_hash_pending', 'Password hashes waiting or being computed')
+LEGACY = 'legacy'
+DEFAULT_VERSIONS = {
+    LEGACY: {
+        'algorithm': 'sha512_chain',
+        'rounds': 250000,
+    },
+}
 
 
 def create_salt() -> bytes:
@@ -14,11 +49,7 @@ def create_salt() -> bytes:
     :return: Salt data
     :rtype: bytes
     """
-    rand = SystemRandom()
-    salt_bytes = []
-    while len(salt_bytes) < 64:
-        salt_bytes.append(rand.randint(0, 255))
-    return bytes(salt_bytes)
+    return random_salt()
 
 
 def create_salt_as_base64_string() -> str:
@@ -31,30 +62,285 @@ def create_salt_as_base64_string() -> str:
     return b64encode(create_salt()).decode('utf-8')
 
 
-def hash_password_with_salt(password: str, salt: bytes) -> bytes:
+def hash_password_with_salt(password: str, salt: bytes, rounds: int=250000) -> bytes:
     """
-    Hash a password with a salt (250000 rounds)
+    Hash a password with a salt by chaining SHA-512 (250000 rounds by default)
 
     :param str password: Password to hash
     :param bytes salt: Salt
+    :param int rounds: Number of rounds
     :return: Hash in bytes
     :rtype: bytes
     """
     load = password.encode('utf-8')
-    for dummy in range(250000):
+    for dummy in range(rounds):
         load += salt
         load = sha512(load).digest()
     return load
 
 
-def hash_password_with_base64_salt_as_base64_string(password: str, salt: str) -> str:
+def hash_password(password: str, salt: bytes, settings: dict) -> bytes:
+    """
+    Hash a password with the algorithm and parameters of a hash version
+
+    :param str password: Password to hash
+    :param bytes salt: Salt
+    :param dict settings: ``algorithm`` and its parameters: ``rounds`` for ``sha512_chain``, ``iterations`` for
+                          ``pbkdf2_sha512`` and ``n``, ``r``, ``p`` for ``scrypt``
+    :return: Hash in bytes
+    :rtype: bytes
+    :raises ValueError: When the algorithm is unknown or not available
+    """
+    algorithm = settings['algorithm']
+    if algorithm == 'sha512_chain':
+        return hash_password_with_salt(password, salt, settings['rounds'])
+    if algorithm == 'pbkdf2_sha512':
+        return pbkdf2_hmac('sha512', password.encode('utf-8'), salt, settings['iterations'])
+    if algorithm == 'scrypt' and scrypt is not None:
+        return scrypt(password.encode('utf-8'), salt=salt, n=settings['n'], r=settings['r'], p=settings['p'],
+                      maxmem=256 * settings['n'] * settings['r'] * settings['p'], dklen=64)
+    raise ValueError('Unknown hash algorithm {:s}'.format(algorithm))
+
+
+def hash_password_with_base64_salt_as_base64_string(password: str, salt: str, settings: dict=None) -> str:
     """
     Hash a password and use a base64 salt and deliver a base64 string as result
 
     :param str password: Password to hash
     :param str salt: Salt
+    :param dict settings: Algorithm and parameters, the legacy version by default
     :return: Base 64 encoded salted hash of password
     :rtype: str
     """
     decoded_salt = b64decode(salt)
-    return b64encode(hash_password_with_salt(password, decoded_salt)).decode('utf-8')
+    return b64encode(hash_password(password, decoded_salt, settings or DEFAULT_VERSIONS[LEGACY])).decode('utf-8')
+
+
+def timed_hash(password: str, salt: str, settings: dict, submitted: float) -> tuple:
+    """
+    Hash a password in a worker process and measure the time in the queue and the time of the computation
+
+    :param str password: Password to hash
+    :param str salt: Base 64 encoded salt
+    :param dict settings: Algorithm and parameters
+    :param float submitted: Time the hash was submitted
+    :return: Base 64 encoded hash, seconds in the queue, seconds computing
+    :rtype: tuple
+    """
+    start = time()
+    result = hash_password_with_base64_salt_as_base64_string(password, salt, settings)
+    return result, start - submitted, time() - start
+
+
+class HashingSaturated(Exception):
+    """
+    The hashing service has no free slot
+    """
+
+
+def hashing_error(error: Exception) -> dict:
+    """
+    Turn an error of the hashing service into the error of a call
+
+    :param Exception error: ``HashingSaturated`` or ``TimeoutError`` of ``concurrent.futures``
+    :return: Error dict, ``hashing_saturated`` or ``timeout``
+    :rtype: dict
+    """
+    if isinstance(error, HashingSaturated):
+        return {'error': {'code': -6, 'message': 'hashing_saturated'}}
+    return {'error': {'code': -1, 'message': 'timeout'}}
+
+
+class HashingService(object, metaclass=SingletonMeta):
+    """
+    Hash passwords in a process pool. At most ``workers`` hashes are computed and ``queue`` further hashes wait, all
+    others are rejected at once. At most ``waiters`` threads block on hashes, this keeps dispatcher threads free for
+    the other functions.
+    """
+
+    def __init__(self, workers: int=None, queue: int=None, waiters: int=None):
+        """
+        Configure the service from the ``hashing`` section of the configuration file
+
+        :param int workers: Number of worker processes, overrides the configuration
+        :param int queue: Number of waiting hashes, overrides the configuration
+        :param int waiters: Number of threads blocking on hashes, overrides the configuration
+        """
+        self.workers = cpu_count() or 1
+        self.queue = 2 * self.workers
+        self.waiters = 4
+        self.timeout = 15.0
+        self.version = LEGACY
+        self.versions = dict(DEFAULT_VERSIONS)
+        self.pending = 0
+        self.waiting = 0
+        self.__executor = None
+        self.__lock = Lock()
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'hashing' in config:
+            hashing_config = config['hashing']
+            if 'workers' in hashing_config and hashing_config['workers'] is not None:
+                self.workers = hashing_config['workers']
+            if 'queue' in hashing_config and hashing_config['queue'] is not None:
+                self.queue = hashing_config['queue']
+            if 'waiters' in hashing_config and hashing_config['waiters'] is not None:
+                self.waiters = hashing_config['waiters']
+            if 'timeout' in hashing_config:
+                self.timeout = hashing_config['timeout']
+            if 'versions' in hashing_config:
+                self.versions.update(hashing_config['versions'])
+            if 'version' in hashing_config:
+                self.version = hashing_config['version']
+        if self.version not in self.versions:
+            raise ValueError('Unknown hash version {:s}'.format(self.version))
+        if workers is not None:
+            self.workers = workers
+        if queue is not None:
+            self.queue = queue
+        if waiters is not None:
+            self.waiters = waiters
+
+    @property
+    def saturated(self) -> bool:
+        """
+        Tell whether a hash submitted now would be rejected
+
+        :return: ``True``, when all slots or all waiter slots are taken
+        :rtype: bool
+        """
+        return self.pending >= self.workers + self.queue or self.waiting >= self.waiters
+
+    def start(self) -> None:
+        """
+        Start the worker processes. They are forked, so call this while the process has a single thread: a fork of a
+        process with running threads can leave locks held in the workers.
+        """
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(self.workers)
+            executor = self.__executor
+        list(executor.map(abs, range(self.workers)))
+
+    def settings(self, version: str=None) -> dict:
+        """
+        Get the algorithm and parameters of a hash version
+
+        :param str version: Name of the version, the current one by default
+        :return: Algorithm and parameters
+        :rtype: dict
+        :raises ValueError: When the version is unknown
+        """
+        version = version or self.version
+        if version not in self.versions:
+            raise ValueError('Unknown hash version {:s}'.format(version))
+        return self.versions[version]
+
+    def submit(self, password: str, salt: str, version: str=None) -> Future:
+        """
+        Hash a password in the background
+
+        :param str password: Password to hash
+        :param str salt: Base 64 encoded salt
+        :param str version: Hash version, the current one by default
+        :return: Future of the base 64 encoded hash
+        :rtype: Future
+        :raises HashingSaturated: When all slots are taken
+        :raises ValueError: When the version is unknown
+        """
+        settings = self.settings(version)
+        with self.__lock:
+            if self.pending >= self.workers + self.queue:
+                REJECTED.inc()
+                raise HashingSaturated()
+            self.pending += 1
+            PENDING.set(self.pending)
+            if self.__executor is None:  # without start, e.g. in the shell
+                self.__executor = ProcessPoolExecutor(self.workers)
+        result = Future()
+
+        def done(future: Future) -> None:
+            """
+            Give the slot back, record the timings and hand over the hash
+
+            :param Future future: Future of the worker process
+            """
+            with self.__lock:
+                self.pending -= 1
+                PENDING.set(self.pending)
+            if future.exception() is not None:
+                result.set_exception(future.exception())
+                return
+            password_hash, queued, computed = future.result()
+            QUEUE_SECONDS.observe(max(queued, 0.0))
+            COMPUTE_SECONDS.observe(computed)
+            result.set_result(password_hash)
+
+        try:
+            self.__executor.submit(timed_hash, password, salt, settings, time()).add_done_callback(done)
+        except BaseException:
+            with self.__lock:
+                self.pending -= 1
+                PENDING.set(self.pending)
+            raise
+        return result
+
+    def acquire_waiter(self) -> None:
+        """
+        Take a waiter slot before blocking on hashes, give it back with ``release_waiter``
+
+        :raises HashingSaturated: When all waiter slots are taken
+        """
+        with self.__lock:
+            if self.waiting >= self.waiters:
+                REJECTED.inc()
+                raise HashingSaturated()
+            self.waiting += 1
+
+    def release_waiter(self) -> None:
+        """
+        Give a waiter slot back
+        """
+        with self.__lock:
+            self.waiting -= 1
+
+    def hash(self, password: str, salt: str, version: str=None) -> str:
+        """
+        Hash a password and wait for the result
+
+        :param str password: Password to hash
+        :param str salt: Base 64 encoded salt
+        :param str version: Hash version, the current one by default
+        :return: Base 64 encoded hash
+        :rtype: str
+        :raises HashingSaturated: When all slots or all waiter slots are taken
+        :raises TimeoutError: When the hash is not ready within ``timeout`` seconds (``concurrent.futures``)
+        """
+        self.acquire_waiter()
+        try:
+            return self.submit(password, salt, version).result(self.timeout)
+        finally:
+            self.release_waiter()
+
+    def hash_or_error(self, password: str, salt: str, version: str=None) -> tuple:
+        """
+        Hash a password and wait for the result, errors of the hashing service are returned as error of the call
+
+        :param str password: Password to hash
+        :param str salt: Base 64 encoded salt
+        :param str version: Hash version, the current one by default
+        :return: Base 64 encoded hash and ``None`` or ``None`` and the error dict from ``hashing_error``
+        :rtype: tuple
+        """
+        try:
+            return self.hash(password, salt, version), None
+        except (HashingSaturated, FutureTimeout) as error:
+            return None, hashing_error(error)
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes
+        """
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown()
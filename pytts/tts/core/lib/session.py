@@ -0,0 +1,339 @@
+"""
+Sessions of logged in users
+
+A session is a token stored in Redis with a sliding time to live. Recently validated sessions are kept in a bounded
+in-process cache for a few seconds, so status checks rarely reach Redis. Revoked sessions are broadcast via Redis
+Publish/Subscribe, every process drops them from its cache at once.
+"""
+
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock, Thread
+from time import monotonic, sleep, time
+
+import redis
+
+from ...util.codec import JSONCodec
+from ...util.config import ConfigurationFileFinder
+from ...util.metrics import BACKEND_SECONDS, REGISTRY
+from ...util.redis import RedisConfiguration
+from ...util.singleton import SingletonMeta
+from ...util.tracing import TRACER
+from .entropy import token
+
+
+LOG = getLogger('tts.cache')
+RECONNECT_DELAY = 1.0
+CACHE_LOOKUPS = REGISTRY.counter('tts_session_cache_lookups_total', 'Lookups in the session cache', ('result',))
+CACHE_ENTRIES = REGISTRY.gauge('tts_session_cache_entries', 'Entries in the session cache')
+
+
+class SessionCache(object):
+    """
+    Bounded LRU of validated sessions, entries expire after ``ttl`` seconds. Every invalidation counts up a
+    generation of the session, a session validated in Redis is only cached when its generation did not change while
+    it was read.
+    """
+
+    def __init__(self, size: int=10000, ttl: float=30.0):
+        """
+        Create the cache
+
+        :param int size: Maximum number of sessions
+        :param float ttl: Seconds a session is trusted without asking Redis
+        """
+        self.size = size
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+        self.__generations = {}
+        self.__flushes = 0
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, session: str) -> str:
+        """
+        Look up a session
+
+        :param str session: Token of the session
+        :return: User name or ``None``, when the session is not cached
+        :rtype: str
+        """
+        now = monotonic()
+        with self.__lock:
+            entry = self.__entries.get(session)
+            if entry is not None and entry[1] > now:
+                self.__hits += 1
+                self.__entries.move_to_end(session)
+                CACHE_LOOKUPS.inc(labels=('hit',))
+                return entry[0]
+            self.__misses += 1
+        CACHE_LOOKUPS.inc(labels=('miss',))
+        return None
+
+    def generation(self, session: str) -> tuple:
+        """
+        Get the generation of a session, before it is read from Redis
+
+        :param str session: Token of the session
+        :return: Number of flushes and invalidations of the session
+        :rtype: tuple
+        """
+        with self.__lock:
+            return self.__flushes, self.__generations.get(session, 0)
+
+    def put(self, session: str, username: str, generation: tuple=None) -> bool:
+        """
+        Remember a validated session, unless it was invalidated since it was read
+
+        :param str session: Token of the session
+        :param str username: User of the session
+        :param tuple generation: Generation of the session before it was read, ``None`` to cache in any case
+        :return: ``True``, when the session was cached
+        :rtype: bool
+        """
+        with self.__lock:
+            if generation is not None and (self.__flushes, self.__generations.get(session, 0)) != generation:
+                return False
+            self.__entries[session] = (username, monotonic() + self.ttl)
+            self.__entries.move_to_end(session)
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+            CACHE_ENTRIES.set(len(self.__entries))
+        return True
+
+    def invalidate(self, session: str) -> None:
+        """
+        Drop a session
+
+        :param str session: Token of the session or ``SessionStore.FLUSH`` to drop everything
+        """
+        with self.__lock:
+            if session == SessionStore.FLUSH or len(self.__generations) >= self.size:
+                # forgetting the generations counts as a flush for the reads in progress
+                self.__flushes += 1
+                self.__generations.clear()
+            if session == SessionStore.FLUSH:
+                self.__entries.clear()
+            else:
+                self.__generations[session] = self.__generations.get(session, 0) + 1
+                self.__entries.pop(session, None)
+            CACHE_ENTRIES.set(len(self.__entries))
+
+    @property
+    def statistics(self) -> dict:
+        """
+        Cache hit and miss counters
+
+        :return: Dictionary with ``hits``, ``misses`` and ``entries``
+        :rtype: dict
+        """
+        with self.__lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'entries': len(self.__entries),
+            }
+
+
+class SessionStore(RedisConfiguration, metaclass=SingletonMeta):
+    """
+    Create, validate and revoke sessions
+    """
+
+    REVOCATION_CHANNEL = 'PYTTS_SESSION_REVOCATION'
+    FLUSH = '*'
+
+    def __init__(self):
+        """
+        Configure the store from the ``sessions`` section of the configuration file
+        """
+        configuration = ConfigurationFileFinder().find_as_json()['tts']['sessions']
+        super(SessionStore, self).__init__(configuration)
+        self.lifetime = 3600
+        if 'lifetime' in configuration:
+            self.lifetime = configuration['lifetime']
+        self.cache = SessionCache()
+        self.cache_enabled = True
+        if 'cache' in configuration:
+            cache_config = configuration['cache']
+            if 'enabled' in cache_config:
+                self.cache_enabled = bool(cache_config['enabled'])
+            if 'size' in cache_config:
+                self.cache.size = cache_config['size']
+            if 'ttl' in cache_config:
+                self.cache.ttl = cache_config['ttl']
+        self.__connection_pool = self.create_redis_connection_pool()
+        self.__codec = JSONCodec()
+        self.__lock = Lock()
+        self.__listener = None
+        self.__should_run = True
+
+    @staticmethod
+    def key(session: str) -> str:
+        """
+        Redis key of a session
+
+        :param str session: Token of the session
+        :return: The key
+        :rtype: str
+        """
+        return 'PYTTS_SESSION_{:s}'.format(session)
+
+    @staticmethod
+    def user_key(username: str) -> str:
+        """
+        Redis key of the set of sessions of a user
+
+        :param str username: The user
+        :return: The key
+        :rtype: str
+        """
+        return 'PYTTS_USER_SESSIONS_{:s}'.format(username)
+
+    def create(self, username: str) -> str:
+        """
+        Start a session
+
+        :param str username: The authenticated user
+        :return: Token of the session
+        :rtype: str
+        """
+        session = token()
+        pipeline = redis.StrictRedis(connection_pool=self.__connection_pool).pipeline(transaction=False)
+        pipeline.set(self.key(session), self.__codec.encode({'username': username, 'created': time()}),
+                     ex=self.lifetime)
+        pipeline.sadd(self.user_key(username), session)
+        pipeline.expire(self.user_key(username), self.lifetime)
+        with BACKEND_SECONDS.time(('redis', 'set')), TRACER.span('redis set'):
+            pipeline.execute()
+        return session
+
+    def validate(self, session: str) -> str:
+        """
+        Check a session and extend its lifetime, use the local cache whenever possible
+
+        :param str session: Token of the session
+        :return: User name or ``None``, when the session is invalid
+        :rtype: str
+        """
+        generation = None
+        if self.cache_enabled:
+            self.__start_listener()
+            username = self.cache.get(session)
+            if username is not None:
+                return username
+            generation = self.cache.generation(session)
+        pipeline = redis.StrictRedis(connection_pool=self.__connection_pool).pipeline(transaction=False)
+        pipeline.get(self.key(session))
+        pipeline.expire(self.key(session), self.lifetime)
+        with BACKEND_SECONDS.time(('redis', 'get')), TRACER.span('redis get'):
+            state = pipeline.execute()[0]
+        if state is None:
+            return None
+        username = self.__codec.decode(state)['username']
+        with BACKEND_SECONDS.time(('redis', 'expire')), TRACER.span('redis expire'):
+            redis.StrictRedis(connection_pool=self.__connection_pool).expire(self.user_key(username), self.lifetime)
+        if self.cache_enabled:
+            self.cache.put(session, username, generation)
+        return username
+
+    def revoke(self, session: str) -> bool:
+        """
+        End a session in all processes
+
+        :param str session: Token of the session
+        :return: ``True``, when the session existed
+        :rtype: bool
+        """
+        connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+        with BACKEND_SECONDS.time(('redis', 'get')), TRACER.span('redis get'):
+            state = connection.get(self.key(session))
+        if state is None:
+            return False
+        pipeline = connection.pipeline(transaction=False)
+        pipeline.delete(self.key(session))
+        pipeline.srem(self.user_key(self.__codec.decode(state)['username']), session)
+        pipeline.publish(self.REVOCATION_CHANNEL, session)
+        with BACKEND_SECONDS.time(('redis', 'delete')), TRACER.span('redis delete'):
+            pipeline.execute()
+        self.cache.invalidate(session)
+        return True
+
+    def revoke_user(self, username: str) -> int:
+        """
+        End all sessions of a user in all processes
+
+        :param str username: The user
+        :return: Number of sessions ended
+        :rtype: int
+        """
+        return self.revoke_users([username])
+
+    def revoke_users(self, usernames: list) -> int:
+        """
+        End all sessions of several users in all processes, with two round-trips to Redis
+
+        :param list usernames: The users
+        :return: Number of sessions ended
+        :rtype: int
+        """
+        if len(usernames) <= 0:
+            return 0
+        connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+        pipeline = connection.pipeline(transaction=False)
+        for username in usernames:
+            pipeline.smembers(self.user_key(username))
+        with BACKEND_SECONDS.time(('redis', 'smembers')), TRACER.span('redis smembers'):
+            sessions = [session.decode('utf-8') for members in pipeline.execute() for session in members]
+        pipeline = connection.pipeline(transaction=False)
+        for session in sessions:
+            pipeline.delete(self.key(session))
+            pipeline.publish(self.REVOCATION_CHANNEL, session)
+        for username in usernames:
+            pipeline.delete(self.user_key(username))
+        with BACKEND_SECONDS.time(('redis', 'delete')), TRACER.span('redis delete'):
+            pipeline.execute()
+        for session in sessions:
+            self.cache.invalidate(session)
+        return len(sessions)
+
+    def __start_listener(self) -> None:
+        """
+        Start listening for revocations, if not already done
+        """
+        if self.__listener is not None:
+            return
+        with self.__lock:
+            if self.__listener is not None:
+                return
+            self.__listener = Thread(target=self.__listen, daemon=True)
+            self.__listener.start()
+
+    def __listen(self) -> None:
+        """
+        Wait for revocation messages on the pubsub channel. When Redis fails, revocations may be missed, so the cache
+        is flushed and the channel subscribed again.
+        """
+        while self.__should_run:
+            pubsub = redis.StrictRedis(connection_pool=self.__connection_pool).pubsub()
+            try:
+                pubsub.subscribe(self.REVOCATION_CHANNEL)
+                self.cache.invalidate(self.FLUSH)
+                while self.__should_run:
+                    message = pubsub.get_message(ignore_subscribe_messages=True, timeout=.125)
+                    if message and message['type'] == 'message':
+                        self.cache.invalidate(message['data'].decode('utf-8'))
+                pubsub.unsubscribe(self.REVOCATION_CHANNEL)
+            except redis.RedisError:
+                LOG.warning('listening for session revocations failed, subscribing again', exc_info=True)
+                self.cache.invalidate(self.FLUSH)
+                sleep(RECONNECT_DELAY)
+            finally:
+                pubsub.close()
+
+    def stop(self) -> None:
+        """
+        Stop listening for revocations
+        """
+        self.__should_run = False
@@ -0,0 +1,199 @@
+"""
+User statistics without scanning the users collection
+
+The counters live in one Redis hash and are changed with ``HINCRBY`` whenever a user registers or is enabled or
+disabled. From time to time one process recomputes them from MongoDB in the background, this repairs counters that
+drifted, e.g. after changes made directly in the database.
+"""
+
+from logging import getLogger
+from os import getpid
+from socket import gethostname
+from threading import Event, Thread
+from time import gmtime, strftime
+
+from pymongo.errors import PyMongoError
+import redis
+
+from ...util.config import ConfigurationFileFinder
+from ...util.metrics import REGISTRY
+from ...util.redis import RedisConfiguration
+from ...util.singleton import SingletonMeta
+from ...util.tracing import TRACER
+from .db import UserDatabaseConnectivity
+
+
+LOG = getLogger('tts.stats')
+USERS = REGISTRY.gauge('tts_users', 'Registered users', ('state',))
+REGISTRATIONS_TODAY = REGISTRY.gauge('tts_user_registrations_today', 'Users registered today (UTC)')
+RECONCILED = REGISTRY.counter('tts_user_stats_reconciled_total', 'Recomputations of the user statistics')
+REGISTERED = 'registered:'
+
+
+def today() -> str:
+    """
+    Get the current day
+
+    :return: Day in UTC as ``YYYY-MM-DD``
+    :rtype: str
+    """
+    return strftime('%Y-%m-%d', gmtime())
+
+
+def parse(fields: dict) -> dict:
+    """
+    Turn the fields of the Redis hash into statistics
+
+    :param dict fields: Fields and values as returned by ``HGETALL``
+    :return: Number of ``users``, ``enabled`` and ``disabled`` users and ``registrations`` by day
+    :rtype: dict
+    """
+    counters = {
+        (key.decode('utf-8') if isinstance(key, bytes) else key): int(value) for key, value in fields.items()
+    }
+    users = counters.get('users', 0)
+    enabled = counters.get('enabled', 0)
+    return {
+        'users': users,
+        'enabled': enabled,
+        'disabled': users - enabled,
+        'registrations': {
+            key[len(REGISTERED):]: value for key, value in sorted(counters.items()) if key.startswith(REGISTERED)
+        },
+    }
+
+
+class UserStatistics(RedisConfiguration, metaclass=SingletonMeta):
+    """
+    Counters of the users. Counting never fails the write of a user, counters that missed a change are repaired by
+    the next reconciliation.
+    """
+
+    KEY = 'PYTTS_USER_STATS'
+    LOCK = 'PYTTS_USER_STATS_RECONCILIATION'
+
+    def __init__(self):
+        """
+        Configure the statistics from the ``stats`` section of the configuration file, without the section nothing
+        is counted
+        """
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        self.interval = 3600.0
+        self.__connection_pool = None
+        self.__stopped = Event()
+        self.__thread = None
+        if 'stats' not in config:
+            return
+        configuration = config['stats']
+        super(UserStatistics, self).__init__(configuration)
+        if 'reconcile_interval' in configuration:
+            self.interval = configuration['reconcile_interval']
+        self.__connection_pool = self.create_redis_connection_pool()
+
+    def registered(self) -> None:
+        """
+        Count a new user
+        """
+        if self.__connection_pool is None:
+            return
+        try:
+            pipeline = redis.StrictRedis(connection_pool=self.__connection_pool).pipeline(transaction=False)
+            pipeline.hincrby(self.KEY, 'users', 1)
+            pipeline.hincrby(self.KEY, REGISTERED + today(), 1)
+            pipeline.execute()
+        except redis.RedisError:
+            LOG.warning('counting a registered user failed', exc_info=True)
+
+    def enabled(self, count: int=1) -> None:
+        """
+        Count enabled users
+
+        :param int count: Number of users enabled, negative for disabled users
+        """
+        if count == 0 or self.__connection_pool is None:
+            return
+        try:
+            redis.StrictRedis(connection_pool=self.__connection_pool).hincrby(self.KEY, 'enabled', count)
+        except redis.RedisError:
+            LOG.warning('counting enabled users failed', exc_info=True)
+
+    def read(self) -> dict:
+        """
+        Read the statistics
+
+        :return: Statistics as returned by ``parse``, all counters are zero when nothing is counted
+        :rtype: dict
+        """
+        if self.__connection_pool is None:
+            return parse({})
+        return parse(redis.StrictRedis(connection_pool=self.__connection_pool).hgetall(self.KEY))
+
+    def collect(self) -> None:
+        """
+        Update the gauges, used as collector of the metrics registry. When Redis is not available, the gauges keep
+        their values.
+        """
+        try:
+            statistics = self.read()
+        except redis.RedisError:
+            return
+        USERS.set(statistics['enabled'], ('enabled',))
+        USERS.set(statistics['disabled'], ('disabled',))
+        REGISTRATIONS_TODAY.set(statistics['registrations'].get(today(), 0))
+
+    def reconcile(self) -> dict:
+        """
+        Recompute the statistics from MongoDB and replace the counters. The registration day is taken from the
+        creation time in the ``_id`` of the user. The users are counted while they are read with a small projection,
+        grouping the creation time by day in MongoDB would need ``$toDate`` of MongoDB 4.0.
+
+        :return: Statistics as returned by ``parse``
+        :rtype: dict
+        """
+        collection = UserDatabaseConnectivity().collection
+        fields = {'users': 0, 'enabled': 0}
+        with TRACER.span('mongo find'):
+            for user in collection.find({}, projection={'enabled': True}, batch_size=10000):
+                day = REGISTERED + user['_id'].generation_time.strftime('%Y-%m-%d')
+                fields['users'] += 1
+                fields['enabled'] += 1 if user.get('enabled') is True else 0
+                fields[day] = fields.get(day, 0) + 1
+        pipeline = redis.StrictRedis(connection_pool=self.__connection_pool).pipeline(transaction=True)
+        pipeline.delete(self.KEY)
+        for field, value in fields.items():
+            pipeline.hset(self.KEY, field, value)
+        pipeline.execute()
+        RECONCILED.inc()
+        return parse(fields)
+
+    def __reconciler(self) -> None:
+        """
+        Reconcile in every interval, if no other process did it in the same interval
+        """
+        process = '{:s}:{:d}'.format(gethostname(), getpid())
+        while True:
+            try:
+                connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+                if connection.set(self.LOCK, process, nx=True, ex=max(int(self.interval), 1)):
+                    self.reconcile()
+            except (redis.RedisError, PyMongoError):
+                LOG.warning('reconciliation of the user statistics failed', exc_info=True)
+            if self.__stopped.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        """
+        Start reconciling in the background
+        """
+        if self.__thread is not None:
+            return
+        self.__stopped.clear()
+        self.__thread = Thread(target=self.__reconciler, name='pytts-user-stats', daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop reconciling
+        """
+        self.__stopped.set()
+        self.__thread = None
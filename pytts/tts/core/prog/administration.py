@@ -2,9 +2,27 @@
 Administrative stuff
 """
 
-from ...core.lib.db import UserDatabaseConnectivity
-from ...core.lib.hash import create_salt_as_base64_string, hash_password_with_base64_salt_as_base64_string
-from ..rules import RULE_USERNAME, RULE_PASSWORD
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+import re
+from time import time
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import ExecutionTimeout
+
+from ...core.lib.db import UserCache, UserDatabaseConnectivity
+from ...core.lib.hash import HashingSaturated, HashingService, create_salt_as_base64_string, hashing_error
+from ...core.lib.session import SessionStore
+from ...core.lib.stats import UserStatistics
+from ...util.metrics import BACKEND_SECONDS
+from ...util.tracing import TRACER
+from ..rules import RULE_USERNAME, RULE_USERNAME_PREFIX, RULE_PASSWORD
+
+
+BULK_LIMIT = 1000
+BULK_HASH_SECONDS = 10.0
+LIST_LIMIT = 1000
+LIST_MAX_TIME_MS = 5000
+PUBLIC_FIELDS = ('username', 'enabled')
 
 
 class UserAdministration(object):
@@ -28,13 +46,17 @@ class UserAdministration(object):
         username = data['username']
         if not RULE_USERNAME.match(username):
             return {'error': {'code': -10002, 'message': 'invalid_username'}}
-        user = self.__user_db.collection.find_one({'username': username})
-        if user is None:
+        with BACKEND_SECONDS.time(('mongo', 'find_one_and_update')), TRACER.span('mongo find_one_and_update'):
+            previous = self.__user_db.collection.find_one_and_update(
+                {'username': username}, {'$set': {'enabled': True}},
+                projection={'_id': False, 'enabled': True}, return_document=ReturnDocument.BEFORE,
+            )
+        if previous is None:
             return {'error': {'code': -10003, 'message': 'user_not_found'}}
-        if user['enabled']:
+        if previous.get('enabled'):
             return {'error': {'code': -10004, 'message': 'user_already_enabled'}}
-        user['enabled'] = True
-        self.__user_db.collection.save(user)
+        UserCache().invalidate([username])
+        UserStatistics().enabled(1)
         return {'success': {'message': 'User enabled'}}
 
     def disable_user(self, data: dict) -> dict:
@@ -50,41 +72,355 @@ class UserAdministration(object):
         username = data['username']
         if not RULE_USERNAME.match(username):
             return {'error': {'code': -10002, 'message': 'invalid_username'}}
-        user = self.__user_db.collection.find_one({'username': username})
-        if user is None:
+        with BACKEND_SECONDS.time(('mongo', 'find_one_and_update')), TRACER.span('mongo find_one_and_update'):
+            previous = self.__user_db.collection.find_one_and_update(
+                {'username': username}, {'$set': {'enabled': False}},
+                projection={'_id': False, 'enabled': True}, return_document=ReturnDocument.BEFORE,
+            )
+        if previous is None:
             return {'error': {'code': -10003, 'message': 'user_not_found'}}
-        if not user['enabled']:
+        if not previous.get('enabled'):
             return {'error': {'code': -10004, 'message': 'user_already_disabled'}}
-        user['enabled'] = False
-        self.__user_db.collection.save(user)
+        UserCache().invalidate([username])
+        UserStatistics().enabled(-1)
+        SessionStore().revoke_user(username)
         return {'success': {'message': 'User disabled'}}
 
-    def set_password(self, data: dict) -> dict:
+    @staticmethod
+    def __check_credentials(data: dict) -> dict:
         """
-        Set the password for a user
+        Check the user name and the password of a call
 
         :param dict data: The data from the call
-        :return: Response dictionary
+        :return: Error dict or ``None``, when both are valid
         :rtype: dict
         """
         if data is None or 'username' not in data or not isinstance(data['username'], str) \
                 or 'password' not in data or not isinstance(data['password'], str):
             return {'error': {'code': -10001, 'message': 'invalid_data'}}
-        username = data['username']
-        if not RULE_USERNAME.match(username):
+        if not RULE_USERNAME.match(data['username']):
             return {'error': {'code': -10002, 'message': 'invalid_username'}}
-        password = data['password']
-        if not RULE_PASSWORD.match(password):
+        if not RULE_PASSWORD.match(data['password']):
             return {'error': {'code': -10003, 'message': 'invalid_password'}}
-        user = self.__user_db.collection.find_one({'username': username})
+        return None
+
+    def set_password(self, data: dict) -> dict:
+        """
+        Set the password for a user
+
+        :param dict data: The data from the call
+        :return: Response dictionary
+        :rtype: dict
+        """
+        error = self.__check_credentials(data)
+        if error is not None:
+            return error
+        username = data['username']
+        password = data['password']
+        with BACKEND_SECONDS.time(('mongo', 'find_one')), TRACER.span('mongo find_one'):
+            user = self.__user_db.collection.find_one({'username': username}, projection={'_id': True})
         if user is None:
             return {'error': {'code': -10004, 'message': 'user_not_found'}}
         new_salt = create_salt_as_base64_string()
-        user['salt'] = new_salt
-        user['password'] = hash_password_with_base64_salt_as_base64_string(password, new_salt)
-        self.__user_db.collection.save(user)
+        hashing = HashingService()
+        with TRACER.span('hash password'):
+            password_hash, error = hashing.hash_or_error(password, new_salt)
+        if error is not None:
+            return error
+        with BACKEND_SECONDS.time(('mongo', 'update_one')), TRACER.span('mongo update_one'):
+            result = self.__user_db.collection.update_one({'username': username}, {'$set': {
+                'salt': new_salt,
+                'password': password_hash,
+                'hash_version': hashing.version,
+            }})
+        if result.matched_count == 0:
+            return {'error': {'code': -10004, 'message': 'user_not_found'}}
+        UserCache().invalidate([username])
+        SessionStore().revoke_user(username)
         return {'success': {'message': 'User password changed'}}
 
+    def __bulk_usernames(self, data: dict) -> tuple:
+        """
+        Get the users of a bulk call, either a list of ``usernames`` or the first ``BULK_LIMIT`` users starting with a
+        ``prefix``, in the order of the user names and after the user name ``after``
+
+        :param dict data: Data from call
+        :return: User names and the user name to continue after, when more users start with the prefix
+        :rtype: tuple
+        :raises ValueError: When the data is invalid
+        :raises OverflowError: When there are more than ``BULK_LIMIT`` user names
+        """
+        if data is None:
+            raise ValueError()
+        if 'usernames' in data and isinstance(data['usernames'], list) \
+                and all(isinstance(username, str) for username in data['usernames']):
+            usernames = list(dict.fromkeys(data['usernames']))
+            if len(usernames) > BULK_LIMIT:
+                raise OverflowError()
+            return usernames, None
+        if 'prefix' in data and isinstance(data['prefix'], str) and RULE_USERNAME_PREFIX.match(data['prefix']) \
+                and isinstance(data.get('after', ''), str):
+            condition = {'$regex': '^' + re.escape(data['prefix'])}
+            if 'after' in data:
+                condition['$gt'] = data['after']
+            with BACKEND_SECONDS.time(('mongo', 'find')), TRACER.span('mongo find'):
+                usernames = [user['username'] for user in self.__user_db.collection.find(
+                    {'username': condition}, projection={'_id': False, 'username': True},
+                    sort=[('username', 1)], limit=BULK_LIMIT + 1,
+                )]
+            if len(usernames) > BULK_LIMIT:
+                return usernames[:BULK_LIMIT], usernames[BULK_LIMIT - 1]
+            return usernames, None
+        raise ValueError()
+
+    def __bulk_enabled(self, data: dict, enabled: bool) -> dict:
+        """
+        Enable or disable many users with one bulk write
+
+        :param dict data: Data from call
+        :param bool enabled: New state of the users
+        :return: Result dict with the result of every user and ``next``, the user name to continue a prefix after
+        :rtype: dict
+        """
+        try:
+            usernames, next_username = self.__bulk_usernames(data)
+        except ValueError:
+            return {'error': {'code': -10001, 'message': 'invalid_data'}}
+        except OverflowError:
+            return {'error': {'code': -10005, 'message': 'too_many_users'}}
+        results = {}
+        valid = []
+        for username in usernames:
+            if RULE_USERNAME.match(username):
+                valid.append(username)
+            else:
+                results[username] = {'error': {'code': -10002, 'message': 'invalid_username'}}
+        with BACKEND_SECONDS.time(('mongo', 'find')), TRACER.span('mongo find'):
+            current = {
+                user['username']: user.get('enabled', False) for user in self.__user_db.collection.find(
+                    {'username': {'$in': valid}}, projection={'_id': False, 'username': True, 'enabled': True}
+                )
+            }
+        changed = []
+        for username in valid:
+            if username not in current:
+                results[username] = {'error': {'code': -10003, 'message': 'user_not_found'}}
+            elif current[username] == enabled:
+                results[username] = {'error': {'code': -10004, 'message': 'user_already_{:s}'.format(
+                    'enabled' if enabled else 'disabled'
+                )}}
+            else:
+                results[username] = {'success': {'message': 'User {:s}'.format('enabled' if enabled else 'disabled')}}
+                changed.append(username)
+        modified = 0
+        if len(changed) > 0:
+            with BACKEND_SECONDS.time(('mongo', 'bulk_write')), TRACER.span('mongo bulk_write'):
+                modified = self.__user_db.collection.bulk_write([
+                    UpdateOne({'username': username, 'enabled': not enabled}, {'$set': {'enabled': enabled}})
+                    for username in changed
+                ], ordered=False).modified_count
+        UserCache().invalidate(changed)
+        UserStatistics().enabled(modified if enabled else -modified)
+        if not enabled:
+            SessionStore().revoke_users(changed)
+        return {'results': results, 'modified': modified, 'next': next_username}
+
+    def bulk_enable_users(self, data: dict) -> dict:
+        """
+        Enable many users
+
+        :param dict data: Data from call, ``usernames`` or ``prefix`` and optionally ``after``
+        :return: Result dict with the result of every user
+        :rtype: dict
+        """
+        return self.__bulk_enabled(data, True)
+
+    def bulk_disable_users(self, data: dict) -> dict:
+        """
+        Disable many users
+
+        :param dict data: Data from call, ``usernames`` or ``prefix`` and optionally ``after``
+        :return: Result dict with the result of every user
+        :rtype: dict
+        """
+        return self.__bulk_enabled(data, False)
+
+    @staticmethod
+    def __bulk_passwords(data: dict) -> tuple:
+        """
+        Get the valid passwords of a bulk call
+
+        :param dict data: Data from call
+        :return: Passwords by user name and results of the users with an invalid user name or password
+        :rtype: tuple
+        :raises ValueError: When the data is invalid
+        :raises OverflowError: When there are more than ``BULK_LIMIT`` users
+        """
+        if data is None or 'users' not in data or not isinstance(data['users'], list) or not all(
+                isinstance(user, dict) and isinstance(user.get('username'), str)
+                and isinstance(user.get('password'), str) for user in data['users']):
+            raise ValueError()
+        if len(data['users']) > BULK_LIMIT:
+            raise OverflowError()
+        passwords = {}
+        results = {}
+        for user in data['users']:
+            if not RULE_USERNAME.match(user['username']):
+                results[user['username']] = {'error': {'code': -10002, 'message': 'invalid_username'}}
+            elif not RULE_PASSWORD.match(user['password']):
+                results[user['username']] = {'error': {'code': -10003, 'message': 'invalid_password'}}
+            else:
+                passwords[user['username']] = user['password']
+        return passwords, results
+
+    @staticmethod
+    def __hash_all(hashing: HashingService, passwords: dict, results: dict) -> dict:
+        """
+        Hash many passwords in parallel. At most half of the workers hash for one call, so logins still find free
+        slots. When the own hashes or the hashing service are full, wait for an own hash to finish. No hash is
+        submitted later than ``BULK_HASH_SECONDS`` after the start, the remaining users are not processed and can be
+        sent again with another call.
+
+        :param HashingService hashing: The hashing service
+        :param dict passwords: Passwords by user name
+        :param dict results: Results by user name, users whose password could not be hashed are added
+        :return: Salt and future of the hash by user name
+        :rtype: dict
+        """
+        limit = max(hashing.workers // 2, 1)
+        deadline = time() + BULK_HASH_SECONDS
+        submitted = {}
+        for username, password in passwords.items():
+            salt = create_salt_as_base64_string()
+            while username not in submitted:
+                if time() >= deadline:
+                    results[username] = {'error': {'code': -10006, 'message': 'not_processed'}}
+                    break
+                running = [future for dummy, future in submitted.values() if not future.done()]
+                if len(running) < limit:
+                    try:
+                        submitted[username] = (salt, hashing.submit(password, salt))
+                        continue
+                    except HashingSaturated as error:
+                        if len(running) <= 0:
+                            results[username] = hashing_error(error)
+                            break
+                done, dummy = wait(running, timeout=hashing.timeout, return_when=FIRST_COMPLETED)
+                if len(done) <= 0:
+                    results[username] = hashing_error(FutureTimeout())
+                    break
+        return submitted
+
+    def bulk_set_passwords(self, data: dict) -> dict:
+        """
+        Set the passwords of many users, the passwords are hashed in parallel
+
+        :param dict data: Data from call, ``users`` is a list of at most ``BULK_LIMIT`` dicts with ``username`` and
+                          ``password``
+        :return: Result dict with the result of every user, users not hashed in time are ``not_processed``
+        :rtype: dict
+        """
+        try:
+            passwords, results = self.__bulk_passwords(data)
+        except ValueError:
+            return {'error': {'code': -10001, 'message': 'invalid_data'}}
+        except OverflowError:
+            return {'error': {'code': -10005, 'message': 'too_many_users'}}
+        with BACKEND_SECONDS.time(('mongo', 'find')), TRACER.span('mongo find'):
+            existing = {
+                user['username'] for user in self.__user_db.collection.find(
+                    {'username': {'$in': list(passwords)}}, projection={'_id': False, 'username': True}
+                )
+            }
+        for username in list(passwords):
+            if username not in existing:
+                results[username] = {'error': {'code': -10004, 'message': 'user_not_found'}}
+                del passwords[username]
+        hashing = HashingService()
+        updates = []
+        try:
+            hashing.acquire_waiter()
+        except HashingSaturated as error:
+            return hashing_error(error)
+        try:
+            with TRACER.span('hash passwords'):
+                for username, (salt, future) in self.__hash_all(hashing, passwords, results).items():
+                    try:
+                        password_hash = future.result(hashing.timeout)
+                    except FutureTimeout as error:
+                        results[username] = hashing_error(error)
+                        continue
+                    updates.append(UpdateOne({'username': username}, {'$set': {
+                        'salt': salt,
+                        'password': password_hash,
+                        'hash_version': hashing.version,
+                    }}))
+                    results[username] = {'success': {'message': 'User password changed'}}
+        finally:
+            hashing.release_waiter()
+        modified = 0
+        if len(updates) > 0:
+            with BACKEND_SECONDS.time(('mongo', 'bulk_write')), TRACER.span('mongo bulk_write'):
+                modified = self.__user_db.collection.bulk_write(updates, ordered=False).modified_count
+        changed = [username for username, result in results.items() if 'success' in result]
+        UserCache().invalidate(changed)
+        SessionStore().revoke_users(changed)
+        return {'results': results, 'modified': modified}
+
+    def list_users(self, data: dict) -> dict:
+        """
+        List users page by page, ordered by user name. The next page starts after the key of the last user, so every
+        page is one range scan on an index, no matter how many users there are.
+
+        :param dict data: Data from call, optional ``prefix`` (case insensitive), ``after`` (``next`` of the previous
+                          page) and ``limit``
+        :return: Result dict with the ``users`` and ``next``, ``None`` on the last page
+        :rtype: dict
+        """
+        data = data if data is not None else {}
+        prefix = data.get('prefix')
+        after = data.get('after')
+        limit = data.get('limit', 100)
+        if prefix is not None and (not isinstance(prefix, str) or not RULE_USERNAME_PREFIX.match(prefix)):
+            return {'error': {'code': -10001, 'message': 'invalid_data'}}
+        if after is not None and not isinstance(after, str):
+            return {'error': {'code': -10001, 'message': 'invalid_data'}}
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 0 < limit <= LIST_LIMIT:
+            return {'error': {'code': -10001, 'message': 'invalid_data'}}
+        key = 'username'
+        condition = {}
+        if prefix is not None:
+            key = 'username_lower'
+            condition['$regex'] = '^' + re.escape(prefix.lower())
+        if after is not None:
+            condition['$gt'] = after
+        try:
+            with BACKEND_SECONDS.time(('mongo', 'find')), TRACER.span('mongo find'):
+                cursor = self.__user_db.collection.find(
+                    {key: condition} if len(condition) > 0 else {},
+                    projection={'_id': False, key: True, **{field: True for field in PUBLIC_FIELDS}},
+                    sort=[(key, 1)], limit=limit + 1, batch_size=limit + 1,
+                ).hint([(key, 1)]).max_time_ms(LIST_MAX_TIME_MS)
+                users = list(cursor)
+        except ExecutionTimeout:
+            return {'error': {'code': -1, 'message': 'timeout'}}
+        next_key = users[limit - 1][key] if len(users) > limit else None
+        return {
+            'users': [{field: user[field] for field in PUBLIC_FIELDS if field in user} for user in users[:limit]],
+            'next': next_key,
+        }
+
+    @staticmethod
+    def stats(data: dict) -> dict:  # pylint: disable=unused-argument
+        """
+        Get the user statistics, read from the counters instead of the users collection
+
+        :param dict data: Data from call, unused
+        :return: Number of ``users``, ``enabled`` and ``disabled`` users and ``registrations`` by day
+        :rtype: dict
+        """
+        return UserStatistics().read()
+
     def export(self):
         """
         Export functions
@@ -96,6 +432,11 @@ class UserAdministration(object):
             'admin:enable_user': self.enable_user,
             'admin:disable_user': self.disable_user,
             'admin:set_password': self.set_password,
+            'admin:bulk_enable_users': self.bulk_enable_users,
+            'admin:bulk_disable_users': self.bulk_disable_users,
+            'admin:bulk_set_passwords': self.bulk_set_passwords,
+            'admin:list_users': self.list_users,
+            'admin:stats': self.stats,
         }
 
 
@@ -0,0 +1,89 @@
+"""
+Login Handling
+"""
+
+from hmac import compare_digest
+
+from ...core.lib.db import UserCache
+from ...core.lib.hash import LEGACY, HashingSaturated, HashingService, create_salt_as_base64_string, hashing_error
+from ...core.lib.session import SessionStore
+from ...util.tracing import TRACER
+
+
+class Login(object):
+    """
+    Login Implementation
+    """
+
+    def __init__(self):
+        """
+        Initialize Login
+        """
+        self.__users = UserCache()
+        self.__sessions = SessionStore()
+        self.__unknown_salt = create_salt_as_base64_string()
+
+    def authenticate(self, data: dict) -> dict:
+        """
+        Check the credentials of a user and start a session
+
+        :param dict data: Incoming Data
+        :return: Response Data
+        :rtype: dict
+        """
+        hashing = HashingService()
+        if hashing.saturated:
+            return hashing_error(HashingSaturated())
+        with TRACER.span('user cache get'):
+            user = self.__users.get(data['username'])
+        if user is not None and user['username'] != data['username']:
+            user = None
+        with TRACER.span('hash password'):
+            if user is None:
+                # hash anyway, unknown users must not answer faster than wrong passwords
+                password_hash, error = hashing.hash_or_error(data['password'], self.__unknown_salt)
+            else:
+                password_hash, error = hashing.hash_or_error(
+                    data['password'], user['salt'], user.get('hash_version', LEGACY)
+                )
+        if error is not None:
+            return error
+        if user is None or not compare_digest(password_hash, user['password']):
+            return {'error': {'code': -10001, 'message': 'invalid_credentials'}}
+        if not user['enabled']:
+            return {'error': {'code': -10002, 'message': 'account_disabled'}}
+        return {
+            'token': self.__sessions.create(user['username']),
+            'username': user['username'],
+        }
+
+    def status(self, data: dict) -> dict:
+        """
+        Check a session
+
+        :param dict data: Incoming Data
+        :return: Response Data
+        :rtype: dict
+        """
+        username = self.__sessions.validate(data['token'])
+        if username is None:
+            return {'error': {'code': -10003, 'message': 'invalid_session'}}
+        return {
+            'status': 'valid',
+            'username': username,
+        }
+
+    def export(self) -> dict:
+        """
+        Export functions
+
+        :return: Function dictionary
+        :rtype: dict
+        """
+        return {
+            'login:authenticate': self.authenticate,
+            'login:status': self.status,
+        }
+
+
+FUNCTIONS = Login().export()
@@ -2,17 +2,20 @@
 Registration Handling
 """
 
-from json import dumps, loads
-import re
 from uuid import uuid4
 
 from redis import StrictRedis
 
-from ...core.lib.db import UserDatabaseConnectivity
-from ...core.lib.hash import hash_password_with_base64_salt_as_base64_string, create_salt_as_base64_string
+from ...core.lib.bloom import CHECKS, UsernameFilter
+from ...core.lib.db import UserCache, UserDatabaseConnectivity
+from ...core.lib.hash import HashingSaturated, HashingService, create_salt_as_base64_string, hashing_error
+from ...core.lib.stats import UserStatistics
 from ...core.token import token_generator
+from ...util.codec import JSONCodec
 from ...util.config import ConfigurationFileFinder
+from ...util.metrics import BACKEND_SECONDS
 from ...util.redis import RedisConfiguration
+from ...util.tracing import TRACER
 
 
 class Registration(RedisConfiguration):
@@ -27,7 +30,10 @@ class Registration(RedisConfiguration):
         configuration = ConfigurationFileFinder().find_as_json()['tts']['registration']
         super(Registration, self).__init__(configuration)
         self.__user_db = UserDatabaseConnectivity()
+        self.__users = UserCache()
+        self.__filter = UsernameFilter()
         self.__connection_pool = self.create_redis_connection_pool()
+        self.__codec = JSONCodec()
         self.__expiration_time = 3600
         if 'lifetime' in configuration:
             self.__expiration_time = configuration['lifetime']
@@ -51,7 +57,8 @@ class Registration(RedisConfiguration):
             'token': token,
         }
         key = 'REG_{:s}'.format(registration_key)
-        redis.set(key, dumps(step_data), ex=self.__expiration_time)
+        with BACKEND_SECONDS.time(('redis', 'set')), TRACER.span('redis set'):
+            redis.set(key, self.__codec.encode(step_data), ex=self.__expiration_time)
         return {
             'registration_key': registration_key,
             'token': token,
@@ -60,9 +67,42 @@ class Registration(RedisConfiguration):
     def __get_key(self, key) -> (str, bytes):
         key_x = 'REG_{:s}'.format(key)
         redis = StrictRedis(connection_pool=self.__connection_pool)
-        state = redis.get(key_x)
+        with BACKEND_SECONDS.time(('redis', 'get')), TRACER.span('redis get'):
+            state = redis.get(key_x)
         return key_x, state, redis
 
+    def __check_step(self, state: bytes, step: int) -> tuple:
+        """
+        Decode the state of a registration and check its step
+
+        :param bytes state: State from Redis, ``None`` for an unknown registration key
+        :param int step: The expected step
+        :return: Decoded state and ``None`` or ``None`` and the error dict
+        :rtype: tuple
+        """
+        if state is None:
+            return None, {'error': {'code': -10001, 'message': 'invalid_registration_key'}}
+        state = self.__codec.decode(state)
+        if any(['step' not in state, state['step'] != step]):
+            return None, {'error': {'code': -10002, 'message': 'invalid_registration_step'}}
+        return state, None
+
+    @staticmethod
+    def __check_owner(state: dict, data: dict) -> dict:
+        """
+        Check that the registration continues with its token and from its IP address
+
+        :param dict state: Decoded state of the registration
+        :param dict data: Incoming Data
+        :return: Error dict or ``None``, when the caller owns the registration
+        :rtype: dict
+        """
+        if any(['token' not in state, state['token'] != data['token']]):
+            return {'error': {'code': -10003, 'message': 'invalid_registration_token'}}
+        if any(['ip' not in state, state['ip'] != data['ip']]):
+            return {'error': {'code': -10004, 'message': 'access_denied'}}
+        return None
+
     def choose_username(self, data: dict) -> dict:
         """
         Username selection Step
@@ -72,25 +112,27 @@ class Registration(RedisConfiguration):
         :rtype: dict
         """
         key, state, redis = self.__get_key(data['registration_key'])
-        if state is None:
-            return {'error': {'code': -10001, 'message': 'invalid_registration_key'}}
-        state = loads(state.decode('utf-8'), encoding='utf-8')
-        if any(['step' not in state, state['step'] != 1]):
-            return {'error': {'code': -10002, 'message': 'invalid_registration_step'}}
-        redis.delete(key)
-        if any(['token' not in state, state['token'] != data['token']]):
-            return {'error': {'code': -10003, 'message': 'invalid_registration_token'}}
-        if any(['ip' not in state, state['ip'] != data['ip']]):
-            return {'error': {'code': -10004, 'message': 'access_denied'}}
+        state, error = self.__check_step(state, 1)
+        if error is not None:
+            return error
+        with BACKEND_SECONDS.time(('redis', 'delete')), TRACER.span('redis delete'):
+            redis.delete(key)
+        error = self.__check_owner(state, data)
+        if error is not None:
+            return error
         internal_data = {}
         if all(['data' in state, isinstance(state['data'], dict)]):
             internal_data = state['data']
         username_to_check = data['username']
         step = 1
-        suc = self.__user_db.collection
-        user_obj = suc.find_one({
-            'username': re.compile('^' + re.escape(username_to_check) + '$', re.IGNORECASE),
-        })
+        user_obj = None
+        if not self.__filter.enabled or self.__filter.might_contain(username_to_check):
+            with TRACER.span('user cache get'):
+                user_obj = self.__users.get(username_to_check)
+            if self.__filter.enabled:
+                CHECKS.inc(labels=('positive' if user_obj is not None else 'false_positive',))
+        else:
+            CHECKS.inc(labels=('negative',))
         if user_obj is None:
             internal_data['username'] = username_to_check
             step = 2
@@ -103,7 +145,8 @@ class Registration(RedisConfiguration):
             'token': new_token,
             'step': step,
         }
-        redis.set('REG_{:s}'.format(new_key), dumps(save_back), ex=self.__expiration_time)
+        with BACKEND_SECONDS.time(('redis', 'set')), TRACER.span('redis set'):
+            redis.set('REG_{:s}'.format(new_key), self.__codec.encode(save_back), ex=self.__expiration_time)
         if step == 1:
             return {
                 'registration_key': new_key,
@@ -127,31 +170,41 @@ class Registration(RedisConfiguration):
         :rtype: dict
         """
         key, state, redis = self.__get_key(data['registration_key'])
-        if state is None:
-            return {'error': {'code': -10001, 'message': 'invalid_registration_key'}}
-        state = loads(state.decode('utf-8'), encoding='utf-8')
-        if any(['step' not in state, state['step'] != 2]):
-            return {'error': {'code': -10002, 'message': 'invalid_registration_step'}}
-        redis.delete(key)
-        if any(['token' not in state, state['token'] != data['token']]):
-            return {'error': {'code': -10003, 'message': 'invalid_registration_token'}}
-        if any(['ip' not in state, state['ip'] != data['ip']]):
-            return {'error': {'code': -10004, 'message': 'access_denied'}}
+        state, error = self.__check_step(state, 2)
+        if error is not None:
+            return error
+        hashing = HashingService()
+        if hashing.saturated:
+            return hashing_error(HashingSaturated())
+        with BACKEND_SECONDS.time(('redis', 'delete')), TRACER.span('redis delete'):
+            redis.delete(key)
+        error = self.__check_owner(state, data)
+        if error is not None:
+            return error
         salt = create_salt_as_base64_string()
-        pw_hash = hash_password_with_base64_salt_as_base64_string(data['password'], salt)
+        with TRACER.span('hash password'):
+            pw_hash, error = hashing.hash_or_error(data['password'], salt)
+        if error is not None:
+            return error
         user_document = {
             'username': state['data']['username'],
+            'username_lower': state['data']['username'].lower(),
             'salt': salt,
             'password': pw_hash,
+            'hash_version': hashing.version,
             'enabled': False,
         }
         suc = self.__user_db.collection
-        user_obj = suc.find_one({
-            'username': re.compile('^' + re.escape(state['data']['username']) + '$', re.IGNORECASE),
-        })
+        with TRACER.span('user cache get'):
+            user_obj = self.__users.get(state['data']['username'])
         if user_obj is not None:
             return {'error': {'code': -10005, 'message': 'registration_failed_username_already_taken'}}
-        suc.insert(user_document)
+        with BACKEND_SECONDS.time(('mongo', 'insert')), TRACER.span('mongo insert'):
+            suc.insert(user_document)
+        self.__users.invalidate([state['data']['username']])
+        if self.__filter.enabled:
+            self.__filter.add(state['data']['username'])
+        UserStatistics().registered()
         return {
             'message': 'registration_successful',
             'account_enabled': False,
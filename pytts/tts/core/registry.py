@@ -4,9 +4,11 @@ Implementation Registry of exported functions
 
 from .prog.registration import FUNCTIONS as REGISTRATION
 from .prog.administration import FUNCTIONS as ADMINISTRATION
+from .prog.login import FUNCTIONS as LOGIN
 
 
 FUNCTIONS = {
     **ADMINISTRATION,
+    **LOGIN,
     **REGISTRATION,
 }
@@ -2,11 +2,7 @@
 Token Stuff
 """
 
-from random import SystemRandom
-from string import ascii_letters, digits
-
-
-TOKEN_CHARS = ascii_letters + digits
+from .lib.entropy import tokens, token
 
 
 def token_generator() -> str:
@@ -16,8 +12,15 @@ def token_generator() -> str:
     :return: A token
     :rtype: str
     """
-    rand = SystemRandom()
-    token = ''
-    while len(token) < 64:
-        token += TOKEN_CHARS[rand.randrange(len(TOKEN_CHARS))]
-    return token
+    return token()
+
+
+def token_batch(count: int) -> list:
+    """
+    Create several tokens at once
+
+    :param int count: Number of tokens
+    :return: The tokens
+    :rtype: list
+    """
+    return tokens(count)
@@ -5,8 +5,11 @@ Base Launcher Module that initializes the Control Manager
 """
 
 import sys
-from tts.control import manager
+from tts.core.lib.hash import HashingService
 
 
 if __name__ == '__main__':
+    # fork the hashing workers before any thread runs, importing the control manager starts threads
+    HashingService().start()
+    from tts.control import manager  # pylint: disable=wrong-import-position
     manager.ControlManager.factory(sys.argv).start()
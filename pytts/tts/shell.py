@@ -5,14 +5,21 @@ Create an interactive shell to control the server
 
 from cmd import Cmd
 from getpass import getpass
+from json import load
+from time import sleep
 import requests
 from redis import StrictRedis
 
+from tts.core.lib.bloom import UsernameFilter
 from tts.core.rules import RULE_PASSWORD
+from tts.control.pools import POOL_STATISTICS
 from tts.core.token import token_generator
-from tts.util.queue.redis import RedisQueueProducer
+from tts.util.codec import JSONCodec
+from tts.util.queue.redis import RedisQueueAccess, RedisQueueProducer
 from tts.util.config import ConfigurationFileFinder
 from tts.util.redis import RedisConfiguration
+from tts.util.profiling import PROFILE_RESULT
+from tts.util.slowlog import STAGES, SlowLog, aggregate
 
 
 class PyTTSShell(Cmd):
@@ -20,10 +27,14 @@ class PyTTSShell(Cmd):
     Simple shell for working with pytts
     """
 
-    API = 'http://{:s}:{:d}/api/v1.0/admin'.format(
+    API_BASE = 'http://{:s}:{:d}/api/v1.0'.format(
         ConfigurationFileFinder().find_as_json()['tts']['server']['bind_ip'],
         ConfigurationFileFinder().find_as_json()['tts']['server']['bind_port']
     )
+    API = '{:s}/admin'.format(API_BASE)
+    BATCH_SIZE = 500
+    BULK_SIZE = 1000
+    PASSWORD_BULK_SIZE = 100
 
     intro = 'PyTTS Interactive Shell'
     prompt = '[PyTTS] $ '
@@ -51,12 +62,176 @@ class PyTTSShell(Cmd):
             return 'ERR {:d}: {:s}'.format(request.status_code, request.reason)
         return request.json()
 
+    def __batch_access(self, operations: list) -> list:
+        my_token = token_generator()
+        redis = StrictRedis(connection_pool=self.api_pool)
+        redis.set('ADMIN_TOKEN:{:s}'.format(my_token), 'batch', ex=5)
+        request = requests.post('{:s}/batch'.format(self.API_BASE), json={
+            'admin_token': my_token,
+            'operations': operations,
+        })
+        request.close()
+        if not request.ok:
+            return ['ERR {:d}: {:s}'.format(request.status_code, request.reason)] * len(operations)
+        return request.json()['results']
+
+    @staticmethod
+    def __read_chunks(file: str, size: int):
+        """
+        Read the non-empty lines of a file in chunks
+
+        :param str file: Path of the file
+        :param int size: Lines per chunk
+        :return: Generator of lists of stripped lines
+        """
+        chunk = []
+        with open(file, 'r', encoding='utf-8') as file_pointer:
+            for line in file_pointer:
+                line = line.strip()
+                if len(line) <= 0:
+                    continue
+                chunk.append(line)
+                if len(chunk) >= size:
+                    yield chunk
+                    chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    def __bulk_access(self, endpoint: str, data: dict) -> None:
+        """
+        Run a bulk call and print the result of every user
+
+        :param str endpoint: Endpoint
+        :param dict data: Data of the call
+        """
+        answer = self.__webservice_access(endpoint, data)
+        if not isinstance(answer, dict) or 'results' not in answer:
+            print(answer)
+            return
+        for username, result in sorted(answer['results'].items()):
+            print('{:s}: {!s}'.format(username, result))
+        if answer.get('next') is not None:
+            print('More users follow after {:s}'.format(answer['next']))
+
+    def __bulk_enabled(self, endpoint: str, arg: str) -> None:
+        """
+        Enable or disable the users listed in a file
+
+        :param str endpoint: Endpoint
+        :param str arg: Path of the file, one user name per line
+        """
+        if arg is None or not isinstance(arg, str) or len(arg.strip()) <= 0:
+            print('Usage: {:s} <file>'.format(endpoint))
+            return
+        for usernames in self.__read_chunks(arg.strip(), self.BULK_SIZE):
+            self.__bulk_access(endpoint, {'usernames': usernames})
+
     def do_stop(self, arg):
         """
         Send Stop Command to the Server
         """
         self.command_queue_access.fire_message('STOP')
 
+    def do_queues(self, arg):
+        """
+        Show depth, age of the oldest message and rates of all queues
+        """
+        print('{:<10s} {:>8s} {:>12s} {:>12s} {:>12s}'.format('queue', 'depth', 'oldest [s]', 'in [1/s]', 'out [1/s]'))
+        for name, snapshot in sorted(RedisQueueAccess.snapshot_all().items()):
+            print('{:<10s} {:>8d} {:>12s} {:>12.2f} {:>12.2f}'.format(
+                name, snapshot['depth'],
+                '-' if snapshot['oldest_age'] is None else '{:.2f}'.format(snapshot['oldest_age']),
+                snapshot['enqueued'], snapshot['dequeued']
+            ))
+
+    def do_pools(self, arg):
+        """
+        Show the utilization of the request pools of the server
+        """
+        redis = self.command_queue_access.get_connection()
+        redis.delete(POOL_STATISTICS)
+        self.command_queue_access.fire_message('POOLS')
+        for dummy in range(20):
+            statistics = redis.get(POOL_STATISTICS)
+            if statistics is not None:
+                break
+            sleep(.1)
+        else:
+            print('No answer from the server')
+            return
+        print('{:<8s} {:>6s} {:>6s} {:>7s} {:>6s} {:>10s} {:>9s}'.format(
+            'pool', 'active', 'size', 'waiting', 'peak', 'served', 'rejected'
+        ))
+        for name, pool in sorted(JSONCodec().decode(statistics).items()):
+            print('{:<8s} {:>6d} {:>6d} {:>7d} {:>6d} {:>10d} {:>9d}'.format(
+                name, pool['active'], pool['size'], pool['waiting'], pool['peak'], pool['served'], pool['rejected']
+            ))
+
+    def __profile_result(self, command: str, seconds: float) -> None:
+        redis = self.command_queue_access.get_connection()
+        redis.delete(PROFILE_RESULT)
+        self.command_queue_access.fire_message(command)
+        for dummy in range(int(seconds * 10) + 50):
+            result = redis.get(PROFILE_RESULT)
+            if result is not None:
+                print(result.decode('utf-8'))
+                return
+            sleep(.1)
+        print('No answer from the server')
+
+    def do_profile(self, arg):
+        """
+        Sample the stacks of all server threads and write them as collapsed stacks: profile [seconds]
+        """
+        seconds = float(arg) if arg is not None and arg.strip().replace('.', '', 1).isdigit() else 10.0
+        print('Profiling for {:.1f} seconds'.format(seconds))
+        self.__profile_result('PROFILE {!r}'.format(seconds), seconds)
+
+    def do_heapsnap(self, arg):
+        """
+        Report the allocations that grew since the previous snapshot of the server: heapsnap [stop]
+        """
+        self.__profile_result('HEAPSNAP stop' if arg is not None and arg.strip() == 'stop' else 'HEAPSNAP', 0)
+
+    def do_slowlog(self, arg):
+        """
+        Show the slowest API calls by function and the newest ones with their stages in ms: slowlog [count|clear]
+        """
+        if arg is not None and arg.strip() == 'clear':
+            SlowLog().clear()
+            return
+        count = int(arg) if arg is not None and arg.strip().isdigit() else 100
+        entries = SlowLog().entries(count)
+        if not entries:
+            print('No slow API calls recorded')
+            return
+        print('{:<32s} {:>6s} {:>8s} {:>10s} {:>10s}'.format('function', 'calls', 'timeouts', 'mean [ms]', 'max [ms]'))
+        for function, summary in sorted(aggregate(entries).items(), key=lambda item: -item[1]['mean']):
+            print('{:<32s} {:>6d} {:>8d} {:>10.1f} {:>10.1f}'.format(
+                function, summary['count'], summary['timeouts'], summary['mean'], summary['max']
+            ))
+        print()
+        print('{:<32s} {:>7s} '.format('function', 'bytes') + ' '.join('{:>13s}'.format(stage) for stage in STAGES))
+        for entry in entries[:20]:
+            print('{:<32s} {:>7d} '.format(entry['function'], entry['size']) + ' '.join(
+                '{:>13.1f}'.format(entry['stages'][stage]) if stage in entry['stages'] else '{:>13s}'.format('-')
+                for stage in STAGES
+            ))
+
+    def do_username_filter(self, arg):
+        """
+        Show memory use and false positive rate of the user name Bloom filter
+        """
+        report = UsernameFilter().report()
+        print('{:<32s} {:>14s}'.format('enabled', str(UsernameFilter().enabled)))
+        print('{:<32s} {:>14d} / {:d}'.format('user names / capacity', report['items'], report['capacity']))
+        print('{:<32s} {:>14d} ({:.1f} MiB)'.format('bits', report['bits'], report['bytes'] / 1048576.0))
+        print('{:<32s} {:>14d}'.format('hashes', report['hashes']))
+        print('{:<32s} {:>14.4f}'.format('fill', report['fill']))
+        print('{:<32s} {:>14.6f}'.format('false positive rate (target)', report['target_false_positive_rate']))
+        print('{:<32s} {:>14.6f}'.format('false positive rate (expected)', report['false_positive_rate']))
+        print('{:<32s} {:>14.6f}'.format('false positive rate (from fill)', report['estimated_false_positive_rate']))
+
     def do_enable_user(self, arg):
         """
         Activates an already created user account
@@ -99,6 +274,67 @@ class PyTTSShell(Cmd):
             'password': password1,
         }))
 
+    def do_bulk_enable_users(self, arg):
+        """
+        Activate the user accounts listed in a file, one user name per line
+        """
+        self.__bulk_enabled('bulk_enable_users', arg)
+
+    def do_bulk_disable_users(self, arg):
+        """
+        Disable the user accounts listed in a file, one user name per line
+        """
+        self.__bulk_enabled('bulk_disable_users', arg)
+
+    def do_bulk_set_passwords(self, arg):
+        """
+        Set the passwords of the users listed in a file, one user name and password separated by a space per line
+        """
+        if arg is None or not isinstance(arg, str) or len(arg.strip()) <= 0:
+            print('Usage: bulk_set_passwords <file>')
+            return
+        for lines in self.__read_chunks(arg.strip(), self.PASSWORD_BULK_SIZE):
+            users = []
+            for line in lines:
+                username, dummy, password = line.partition(' ')
+                users.append({'username': username, 'password': password.strip()})
+            self.__bulk_access('bulk_set_passwords', {'users': users})
+
+    def do_list_users(self, arg):
+        """
+        List all users or the users starting with a prefix, page by page
+        """
+        data = {'limit': self.BULK_SIZE}
+        if arg is not None and isinstance(arg, str) and len(arg.strip()) > 0:
+            data['prefix'] = arg.strip()
+        while True:
+            answer = self.__webservice_access('list_users', data)
+            if not isinstance(answer, dict) or 'users' not in answer:
+                print(answer)
+                return
+            for user in answer['users']:
+                print('{:<32s} {:s}'.format(user['username'], 'enabled' if user['enabled'] else 'disabled'))
+            if answer['next'] is None:
+                return
+            data['after'] = answer['next']
+
+    def do_batch(self, arg):
+        """
+        Run the operations from a JSON file (a list of {"operation": ..., "request": ...} objects) as batches
+        """
+        if arg is None or not isinstance(arg, str) or len(arg.strip()) <= 0:
+            print('Usage: batch <file>')
+            return
+        with open(arg.strip(), 'r') as file_pointer:
+            operations = load(file_pointer)
+        if not isinstance(operations, list):
+            print('The file must contain a list of operations')
+            return
+        for start in range(0, len(operations), self.BATCH_SIZE):
+            chunk = operations[start:start + self.BATCH_SIZE]
+            for operation, result in zip(chunk, self.__batch_access(chunk)):
+                print('{:s}: {!s}'.format(str(operation.get('operation')), result))
+
     def do_quit(self, arg):
         """
         Exit interactive Shell
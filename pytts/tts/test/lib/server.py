@@ -3,7 +3,7 @@ Base for Server Tests
 """
 
 from http.client import HTTPConnection
-from json import loads
+from json import dumps, loads
 from time import sleep
 from unittest import TestCase
 
@@ -99,3 +99,40 @@ class ServerTestCase(TestCase):
         json_data = loads(data.decode(encoding='utf-8'))
         connection.close()
         return json_data
+
+    def post_json_response(self, url: str, data: dict):
+        """
+        Post JSON data and get a JSON response
+
+        :param url: The URL to post to
+        :param data: The data to post
+        :return: The JSON response
+        """
+        connection = self.get_http_connection()
+        connection.request(url=url, method='POST', body=dumps(data).encode('utf-8'), headers={
+            'Content-Type': 'application/json',
+        })
+        response = connection.getresponse()
+        self.util_evaluate_json_response(response)
+        data = response.read()
+        json_data = loads(data.decode(encoding='utf-8'))
+        connection.close()
+        return json_data
+
+    def post_status(self, url: str, data) -> int:
+        """
+        Post JSON data and only get the status code
+
+        :param url: The URL to post to
+        :param data: The data to post
+        :return: The HTTP status code
+        :rtype: int
+        """
+        connection = self.get_http_connection()
+        connection.request(url=url, method='POST', body=dumps(data).encode('utf-8'), headers={
+            'Content-Type': 'application/json',
+        })
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        return response.code
@@ -0,0 +1,266 @@
+"""
+Test the user administration against a mocked users collection
+"""
+
+from concurrent.futures import Future
+from functools import partial
+from unittest import TestCase
+from unittest.mock import MagicMock, Mock, patch
+
+from pymongo.errors import ExecutionTimeout
+
+from ...core.lib.hash import HashingSaturated, HashingService
+from ...core.prog.administration import BULK_HASH_SECONDS, BULK_LIMIT, LIST_MAX_TIME_MS, UserAdministration
+
+
+def hashed(password: str, salt: str) -> Future:
+    """
+    Hash a password at once
+
+    :param str password: Password
+    :param str salt: Salt
+    :return: Future with the result
+    :rtype: Future
+    """
+    future = Future()
+    future.set_result('{:s}:{:s}'.format(salt, password))
+    return future
+
+
+class UserAdministrationTest(TestCase):
+    """
+    Test the error codes of the administration functions
+    """
+
+    def setUp(self) -> None:
+        """
+        Mock MongoDB, the hashing service and the Redis backed helpers
+        """
+        self.collection = Mock()
+        self.hashing = Mock(version='test', timeout=1.0, workers=4)
+        self.hashing.hash.return_value = 'hash'
+        self.hashing.hash_or_error.side_effect = partial(HashingService.hash_or_error, self.hashing)
+        self.hashing.submit.side_effect = hashed
+        for name, value in (
+                ('UserDatabaseConnectivity', Mock(return_value=Mock(collection=self.collection))),
+                ('HashingService', Mock(return_value=self.hashing)),
+                ('UserCache', Mock()),
+                ('SessionStore', Mock()),
+                ('UserStatistics', Mock()),
+        ):
+            patcher = patch('tts.core.prog.administration.{:s}'.format(name), value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.administration = UserAdministration()
+
+    def test_enable_user(self) -> None:
+        """
+        Enabling reports unknown and already enabled users from the previous document
+        """
+        self.collection.find_one_and_update.return_value = None
+        self.assertEqual(-10003, self.administration.enable_user({'username': 'alice'})['error']['code'])
+        self.collection.find_one_and_update.return_value = {'enabled': True}
+        self.assertEqual(-10004, self.administration.enable_user({'username': 'alice'})['error']['code'])
+        self.collection.find_one_and_update.return_value = {'enabled': False}
+        self.assertIn('success', self.administration.enable_user({'username': 'alice'}))
+        self.assertEqual({'$set': {'enabled': True}}, self.collection.find_one_and_update.call_args[0][1])
+
+    def test_disable_user(self) -> None:
+        """
+        Disabling reports unknown and already disabled users from the previous document
+        """
+        self.collection.find_one_and_update.return_value = None
+        self.assertEqual(-10003, self.administration.disable_user({'username': 'alice'})['error']['code'])
+        self.collection.find_one_and_update.return_value = {'enabled': False}
+        self.assertEqual(-10004, self.administration.disable_user({'username': 'alice'})['error']['code'])
+        self.collection.find_one_and_update.return_value = {'enabled': True}
+        self.assertIn('success', self.administration.disable_user({'username': 'alice'}))
+        self.assertEqual({'$set': {'enabled': False}}, self.collection.find_one_and_update.call_args[0][1])
+
+    def test_set_password_of_unknown_user(self) -> None:
+        """
+        Unknown users are reported without hashing
+        """
+        self.collection.find_one.return_value = None
+        result = self.administration.set_password({'username': 'alice', 'password': 'Secret-Password-1'})
+        self.assertEqual(-10004, result['error']['code'])
+        self.assertFalse(self.hashing.hash.called)
+        self.assertFalse(self.collection.update_one.called)
+
+    def test_set_password(self) -> None:
+        """
+        The new hash is stored, a user deleted while hashing is reported as unknown
+        """
+        self.collection.find_one.return_value = {'_id': 1}
+        self.collection.update_one.return_value = Mock(matched_count=1)
+        result = self.administration.set_password({'username': 'alice', 'password': 'Secret-Password-1'})
+        self.assertIn('success', result)
+        update = self.collection.update_one.call_args[0][1]['$set']
+        self.assertEqual('hash', update['password'])
+        self.assertEqual('test', update['hash_version'])
+        self.collection.update_one.return_value = Mock(matched_count=0)
+        result = self.administration.set_password({'username': 'alice', 'password': 'Secret-Password-1'})
+        self.assertEqual(-10004, result['error']['code'])
+
+    def test_invalid_data(self) -> None:
+        """
+        Malformed calls are rejected before MongoDB is asked
+        """
+        self.assertEqual(-10001, self.administration.enable_user(None)['error']['code'])
+        self.assertEqual(-10002, self.administration.disable_user({'username': 'a b'})['error']['code'])
+        self.assertEqual(-10001, self.administration.set_password({'username': 'alice'})['error']['code'])
+        self.assertFalse(self.collection.method_calls)
+
+    def test_bulk_enable_users(self) -> None:
+        """
+        Only existing disabled users are enabled, with one bulk write
+        """
+        self.collection.find.return_value = [
+            {'username': 'alice', 'enabled': False},
+            {'username': 'bob', 'enabled': True},
+        ]
+        self.collection.bulk_write.return_value = Mock(modified_count=1)
+        result = self.administration.bulk_enable_users({'usernames': ['alice', 'bob', 'carol', 'a b', 'alice']})
+        self.assertIn('success', result['results']['alice'])
+        self.assertEqual(-10004, result['results']['bob']['error']['code'])
+        self.assertEqual(-10003, result['results']['carol']['error']['code'])
+        self.assertEqual(-10002, result['results']['a b']['error']['code'])
+        self.assertEqual(1, result['modified'])
+        self.assertIsNone(result['next'])
+        self.assertEqual(1, len(self.collection.bulk_write.call_args[0][0]))
+
+    def test_bulk_disable_users_by_prefix(self) -> None:
+        """
+        A prefix matching more users than the limit tells where to continue
+        """
+        users = [{'username': 'user{:04d}'.format(index), 'enabled': True} for index in range(BULK_LIMIT + 1)]
+        self.collection.find.return_value = users
+        self.collection.bulk_write.return_value = Mock(modified_count=BULK_LIMIT)
+        result = self.administration.bulk_disable_users({'prefix': 'user'})
+        self.assertEqual(BULK_LIMIT, len(result['results']))
+        self.assertEqual(users[BULK_LIMIT - 1]['username'], result['next'])
+        self.administration.bulk_disable_users({'prefix': 'user', 'after': result['next']})
+        self.assertEqual({'$regex': '^user', '$gt': result['next']},
+                         self.collection.find.call_args_list[-2][0][0]['username'])
+        self.assertEqual(-10001, self.administration.bulk_disable_users({'prefix': 'us*'})['error']['code'])
+
+    def test_bulk_too_many_users(self) -> None:
+        """
+        Lists beyond the limit are rejected instead of cut
+        """
+        usernames = ['user{:04d}'.format(index) for index in range(BULK_LIMIT + 1)]
+        self.assertEqual(-10005, self.administration.bulk_enable_users({'usernames': usernames})['error']['code'])
+        result = self.administration.bulk_set_passwords({'users': [
+            {'username': username, 'password': 'Secret-Password-1'} for username in usernames
+        ]})
+        self.assertEqual(-10005, result['error']['code'])
+        self.assertFalse(self.collection.method_calls)
+
+    def test_bulk_set_passwords(self) -> None:
+        """
+        Passwords of existing users are hashed and written with one bulk write
+        """
+        self.collection.find.return_value = [{'username': 'alice'}, {'username': 'bob'}]
+        self.collection.bulk_write.return_value = Mock(modified_count=2)
+        result = self.administration.bulk_set_passwords({'users': [
+            {'username': 'alice', 'password': 'Secret-Password-1'},
+            {'username': 'bob', 'password': 'Secret-Password-2'},
+            {'username': 'carol', 'password': 'Secret-Password-3'},
+            {'username': 'dave', 'password': 'short'},
+        ]})
+        self.assertIn('success', result['results']['alice'])
+        self.assertIn('success', result['results']['bob'])
+        self.assertEqual(-10004, result['results']['carol']['error']['code'])
+        self.assertEqual(-10003, result['results']['dave']['error']['code'])
+        self.assertEqual(2, result['modified'])
+        self.assertEqual(2, self.hashing.submit.call_count)
+        self.hashing.release_waiter.assert_called_once_with()
+
+    def test_bulk_set_passwords_saturated(self) -> None:
+        """
+        A bulk call without a free waiter slot is rejected, a full hashing service fails the users
+        """
+        self.collection.find.return_value = [{'username': 'alice'}]
+        self.hashing.acquire_waiter.side_effect = HashingSaturated()
+        data = {'users': [{'username': 'alice', 'password': 'Secret-Password-1'}]}
+        self.assertEqual(-6, self.administration.bulk_set_passwords(data)['error']['code'])
+        self.hashing.acquire_waiter.side_effect = None
+        self.hashing.submit.side_effect = HashingSaturated()
+        self.assertEqual(-6, self.administration.bulk_set_passwords(data)['results']['alice']['error']['code'])
+        self.assertFalse(self.collection.bulk_write.called)
+
+    def test_bulk_set_passwords_deadline(self) -> None:
+        """
+        No hash is submitted after the deadline, the remaining users are not processed
+        """
+        self.collection.find.return_value = [{'username': 'alice'}, {'username': 'bob'}]
+        self.collection.bulk_write.return_value = Mock(modified_count=1)
+        clock = Mock(side_effect=[0.0, 0.0, BULK_HASH_SECONDS])
+        with patch('tts.core.prog.administration.time', clock):
+            result = self.administration.bulk_set_passwords({'users': [
+                {'username': 'alice', 'password': 'Secret-Password-1'},
+                {'username': 'bob', 'password': 'Secret-Password-2'},
+            ]})
+        self.assertIn('success', result['results']['alice'])
+        self.assertEqual(-10006, result['results']['bob']['error']['code'])
+        self.assertEqual(1, self.hashing.submit.call_count)
+
+    def list_users(self, users: list, data: dict) -> dict:
+        """
+        List users from a mocked cursor
+
+        :param list users: Documents returned by the cursor
+        :param dict data: Data of the call
+        :return: Result of the call
+        :rtype: dict
+        """
+        cursor = MagicMock()
+        cursor.hint.return_value = cursor
+        cursor.max_time_ms.return_value = cursor
+        cursor.__iter__.return_value = iter(users)
+        self.collection.find.return_value = cursor
+        result = self.administration.list_users(data)
+        if 'error' not in result:
+            cursor.max_time_ms.assert_called_once_with(LIST_MAX_TIME_MS)
+        return result
+
+    def test_list_users(self) -> None:
+        """
+        Users are paged by user name, a full page tells where the next one starts
+        """
+        users = [{'username': name, 'enabled': True} for name in ('alice', 'bob', 'carol')]
+        result = self.list_users(users, {'limit': 2})
+        self.assertEqual([{'username': 'alice', 'enabled': True}, {'username': 'bob', 'enabled': True}],
+                         result['users'])
+        self.assertEqual('bob', result['next'])
+        query, = self.collection.find.call_args[0]
+        self.assertEqual({}, query)
+        self.assertEqual([('username', 1)], self.collection.find.call_args[1]['sort'])
+        self.assertEqual(3, self.collection.find.call_args[1]['limit'])
+        result = self.list_users(users[2:], {'limit': 2, 'after': 'bob'})
+        self.assertIsNone(result['next'])
+        self.assertEqual({'username': {'$gt': 'bob'}}, self.collection.find.call_args[0][0])
+
+    def test_list_users_by_prefix(self) -> None:
+        """
+        A prefix is searched case insensitive on the normalized user name
+        """
+        users = [{'username': 'Alice', 'username_lower': 'alice', 'enabled': False}]
+        result = self.list_users(users, {'prefix': 'AL', 'after': 'ak'})
+        self.assertEqual([{'username': 'Alice', 'enabled': False}], result['users'])
+        self.assertIsNone(result['next'])
+        self.assertEqual({'username_lower': {'$regex': '^al', '$gt': 'ak'}}, self.collection.find.call_args[0][0])
+        self.assertEqual([('username_lower', 1)], self.collection.find.call_args[1]['sort'])
+
+    def test_list_users_errors(self) -> None:
+        """
+        Invalid paging data and slow queries are reported
+        """
+        for data in ({'limit': 0}, {'limit': True}, {'prefix': 'a*'}, {'after': 1}):
+            self.assertEqual(-10001, self.list_users([], data)['error']['code'])
+        cursor = MagicMock()
+        cursor.hint.return_value = cursor
+        cursor.max_time_ms.return_value = cursor
+        cursor.__iter__.side_effect = ExecutionTimeout('operation exceeded time limit')
+        self.collection.find.return_value = cursor
+        self.assertEqual(-1, self.administration.list_users({})['error']['code'])
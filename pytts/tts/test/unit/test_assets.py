@@ -0,0 +1,252 @@
+"""
+Test the static asset build and the content negotiation
+"""
+
+from os import path, utime
+from shutil import copytree, rmtree
+from tempfile import mkdtemp
+from time import sleep, time
+from unittest import TestCase
+
+from ...app.assets import AssetBuilder, minify_javascript, minify_stylesheet
+from ...app.server import AssetServer, negotiate_encoding
+
+
+SOURCE = path.abspath(path.join(path.dirname(__file__), '..', '..', 'app', 'static'))
+
+
+class AssetBuilderTest(TestCase):
+    """
+    Build the real static directory into a temporary directory
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """
+        Build once for all tests
+        """
+        cls.target = mkdtemp()
+        cls.manifest = AssetBuilder(SOURCE, cls.target, False).build()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Remove the build directory
+        """
+        rmtree(cls.target)
+
+    def read(self, file: str) -> str:
+        """
+        Read a built file
+
+        :param str file: Relative path within the build directory
+        :return: Content
+        :rtype: str
+        """
+        with open(path.join(self.target, file), 'r', encoding='utf-8') as file_pointer:
+            return file_pointer.read()
+
+    def test_fingerprint(self) -> None:
+        """
+        Assets get the content hash in their name, entry points keep theirs
+        """
+        asset = self.manifest['files']['tt-app/tt.js']
+        self.assertEqual('tt-app/tt.{:s}.js'.format(asset['etag']), asset['path'])
+        self.assertTrue(asset['immutable'])
+        self.assertTrue(path.isfile(path.join(self.target, asset['path'])))
+        entry = self.manifest['files']['index.xhtml']
+        self.assertEqual('index.xhtml', entry['path'])
+        self.assertFalse(entry['immutable'])
+
+    def test_precompressed(self) -> None:
+        """
+        Compressible assets have a gzip variant, already compressed ones do not
+        """
+        asset = self.manifest['files']['lib/jquery/jquery-2.2.1.min.js']
+        self.assertIn('gzip', asset['encodings'])
+        self.assertNotIn('br', asset['encodings'])
+        self.assertTrue(path.isfile(path.join(self.target, asset['path'] + '.gz')))
+        font = self.manifest['files']['lib/bootstrap/fonts/glyphicons-halflings-regular.woff2']
+        self.assertListEqual([], font['encodings'])
+
+    def test_references(self) -> None:
+        """
+        References in style sheets point to the fingerprinted names
+        """
+        css = self.read(self.manifest['files']['lib/bootstrap/css/bootstrap.min.css']['path'])
+        font = self.manifest['files']['lib/bootstrap/fonts/glyphicons-halflings-regular.eot']['path']
+        self.assertIn('url(../fonts/{:s}?#iefix)'.format(path.basename(font)), css)
+
+    def test_bundle(self) -> None:
+        """
+        The entry point loads one script and one style sheet bundle, with the dialog templates inlined
+        """
+        index = self.read('index.xhtml')
+        self.assertEqual(1, index.count('<script '))
+        self.assertEqual(1, index.count('<link '))
+        self.assertNotIn('bundle:', index)
+        script = self.manifest['files']['tt-app/bundle.js']['path']
+        self.assertIn('src="{:s}"'.format(script), index)
+        self.assertIn('href="{:s}"'.format(self.manifest['files']['tt-app/bundle.css']['path']), index)
+        bundle = self.read(script)
+        self.assertIn('templates["dialogs/registration.xhtml"] = "<form id=\\"formlib_registration\\"', bundle)
+        self.assertIn('namespace.password = /^.{8,255}$/;', bundle)
+        self.assertNotIn('/* The rules */', bundle)
+        css = self.read(self.manifest['files']['tt-app/bundle.css']['path'])
+        font = self.manifest['files']['lib/bootstrap/fonts/glyphicons-halflings-regular.eot']['path']
+        self.assertIn('url(../{:s}?#iefix)'.format(font), css)
+
+    def test_up_to_date(self) -> None:
+        """
+        An unchanged source directory is not built again
+        """
+        self.assertDictEqual(self.manifest, AssetBuilder(SOURCE, self.target, False).build())
+
+
+class MinifyTest(TestCase):
+    """
+    The conservative minification of scripts and style sheets
+    """
+
+    def test_javascript(self) -> None:
+        """
+        Indentation, empty lines and comments starting a line are removed, line breaks are kept
+        """
+        source = '/* Header\n * text */\n\n(function () {\n    // comment\n    var url = "http://x";\n})();\n'
+        self.assertEqual('(function () {\nvar url = "http://x";\n})();', minify_javascript(source))
+
+    def test_stylesheet(self) -> None:
+        """
+        Comments and white space are removed, license comments are kept
+        """
+        source = '/*! License */\n/* comment */\na:hover,\nb .c {\n    color: red;\n}\n'
+        self.assertEqual('/*! License */ a:hover, b .c{color: red;}', minify_stylesheet(source))
+
+
+class AssetServerTest(TestCase):
+    """
+    Prepare the responses of the built assets
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """
+        Build once for all tests
+        """
+        cls.target = mkdtemp()
+        cls.manifest = AssetBuilder(SOURCE, cls.target, False).build()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Remove the build directory
+        """
+        rmtree(cls.target)
+
+    def create_server(self, reload_interval: float=60.0) -> AssetServer:
+        """
+        Create a server for the build directory
+
+        :param float reload_interval: Seconds between checks of the manifest
+        :return: The server
+        :rtype: AssetServer
+        """
+        return AssetServer({
+            'build_dir': self.target,
+            'max_age': 3600,
+            'cache_file_size': 65536,
+            'reload_interval': reload_interval,
+        }, {'js': 'application/javascript'})
+
+    def test_prebuilt(self) -> None:
+        """
+        Small assets are held in memory with their headers, by fingerprinted and logical name
+        """
+        server = self.create_server()
+        asset = self.manifest['files']['tt-app/tt.js']
+        cached = server.assets[asset['path']][None]
+        with open(path.join(self.target, asset['path']), 'rb') as file_pointer:
+            self.assertEqual(file_pointer.read(), cached.body)
+        headers = dict(cached.headers)
+        self.assertEqual('application/javascript', headers['Content-Type'])
+        self.assertEqual(str(asset['size']), headers['Content-Length'])
+        self.assertEqual('public, max-age=3600, immutable', headers['Cache-Control'])
+        self.assertEqual('"{:s}"'.format(asset['etag']), cached.etag)
+        self.assertEqual('gzip', dict(server.assets[asset['path']]['gzip'].headers)['Content-Encoding'])
+        self.assertEqual('no-cache', dict(server.assets['tt-app/tt.js'][None].headers)['Cache-Control'])
+
+    def test_large(self) -> None:
+        """
+        Large assets are served from disk
+        """
+        server = self.create_server()
+        cached = server.assets[self.manifest['files']['lib/bootstrap/css/bootstrap.min.css']['path']][None]
+        self.assertIsNone(cached.body)
+        self.assertTrue(path.isfile(cached.file))
+
+    def test_reload(self) -> None:
+        """
+        A changed manifest is loaded again
+        """
+        server = self.create_server(0.0)
+        server.assets = {}
+        server.refresh()
+        self.assertDictEqual({}, server.assets)
+        manifest_file = path.join(self.target, AssetBuilder.MANIFEST)
+        utime(manifest_file, (path.getatime(manifest_file), path.getmtime(manifest_file) + 1))
+        server.refresh()
+        self.assertIn('index.xhtml', server.assets)
+
+    def test_rebuild(self) -> None:
+        """
+        Changed source assets are built in the background when watched and loaded again
+        """
+        source = path.join(mkdtemp(), 'static')
+        target = mkdtemp()
+        try:
+            copytree(SOURCE, source)
+            AssetBuilder(source, target, False).build()
+            server = AssetServer({
+                'source': source,
+                'build_dir': target,
+                'brotli': False,
+                'max_age': 3600,
+                'cache_file_size': 65536,
+                'reload_interval': 0.05,
+                'watch_source': True,
+            }, {})
+            etag = server.assets['tt-app/tt.js'][None].etag
+            with open(path.join(source, 'tt-app', 'tt.js'), 'a') as file_pointer:
+                file_pointer.write('\nvar changed = true;\n')
+            deadline = time() + 5.0
+            while etag == server.assets['tt-app/tt.js'][None].etag and time() < deadline:
+                sleep(0.05)
+                server.refresh()
+            server.stop()
+            self.assertNotEqual(etag, server.assets['tt-app/tt.js'][None].etag)
+        finally:
+            rmtree(path.dirname(source))
+            rmtree(target)
+
+
+class NegotiateEncodingTest(TestCase):
+    """
+    Choose the content encoding from the ``Accept-Encoding`` header
+    """
+
+    def test_preference(self) -> None:
+        """
+        Brotli is preferred over gzip
+        """
+        self.assertEqual('br', negotiate_encoding('gzip, deflate, br', ['gzip', 'br']))
+        self.assertEqual('gzip', negotiate_encoding('gzip, deflate, br', ['gzip']))
+        self.assertEqual('gzip', negotiate_encoding('*', ['gzip']))
+
+    def test_identity(self) -> None:
+        """
+        Without a matching encoding the asset is sent as it is
+        """
+        self.assertIsNone(negotiate_encoding(None, ['gzip']))
+        self.assertIsNone(negotiate_encoding('gzip', []))
+        self.assertIsNone(negotiate_encoding('gzip;q=0, br;q=0', ['gzip', 'br']))
+        self.assertIsNone(negotiate_encoding('deflate', ['gzip', 'br']))
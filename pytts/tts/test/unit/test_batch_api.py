@@ -0,0 +1,62 @@
+"""
+Test the Batch API
+"""
+
+from ..lib.server import ServerTestCase
+from ...core.rules import RULE_TOKEN, RULE_UUID
+
+
+class BatchAPITest(ServerTestCase):
+    """
+    Run batches against the running server
+    """
+
+    def test_prepare_batch(self):
+        """
+        Several registration preparations in one request deliver one result per operation
+        """
+        json_data = self.post_json_response('/api/v1.0/batch', {
+            'operations': [{'operation': 'registration:prepare', 'request': {}} for dummy in range(3)],
+        })
+        self.assertIn('results', json_data)
+        self.assertEqual(3, len(json_data['results']))
+        for result in json_data['results']:
+            self.assertTrue(RULE_TOKEN.match(result['token']))
+            self.assertTrue(RULE_UUID.match(result['registration_key']))
+        self.assertEqual(3, len(set(result['token'] for result in json_data['results'])))
+
+    def test_invalid_operations(self):
+        """
+        Invalid operations are answered individually without affecting the valid ones
+        """
+        json_data = self.post_json_response('/api/v1.0/batch', {
+            'operations': [
+                {'operation': 'registration:choose_username', 'request': {'username': 'x'}},
+                {'operation': 'registration:prepare', 'request': {}},
+                {'operation': 'does:not_exist', 'request': {}},
+                'not an operation',
+                {'operation': ['registration:prepare'], 'request': {}},
+                {'operation': {'registration:prepare': True}, 'request': {}},
+            ],
+        })
+        results = json_data['results']
+        self.assertEqual(6, len(results))
+        self.assertEqual(-3, results[0]['error']['code'])
+        self.assertIn('token', results[1])
+        for result in results[2:]:
+            self.assertEqual(-3, result['error']['code'])
+
+    def test_invalid_batch(self):
+        """
+        A batch without a list of operations is a bad request
+        """
+        self.assertEqual(400, self.post_status('/api/v1.0/batch', {'operations': 'none'}))
+        self.assertEqual(400, self.post_status('/api/v1.0/batch', {}))
+
+    def test_admin_operation_without_token(self):
+        """
+        Admin operations require an admin token issued for the batch endpoint
+        """
+        self.assertEqual(400, self.post_status('/api/v1.0/batch', {
+            'operations': [{'operation': 'admin:enable_user', 'request': {'data': {'username': 'nobody'}}}],
+        }))
@@ -0,0 +1,143 @@
+"""
+Test the local cache in front of BlackRed
+"""
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from redis import ConnectionError as RedisConnectionError
+
+from ...util.blackred import CachedBlackRed
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+
+
+class CachedBlackRedTest(TestCase):
+    """
+    Test caching behaviour with a mocked BlackRed
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances of the Configuration File Finder
+        """
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Fresh cache for every test
+        """
+        self.blackred = Mock()
+        self.blackred.is_blocked.side_effect = lambda item: item == 'blocked'
+        self.cache = CachedBlackRed(self.blackred)
+
+    def tearDown(self) -> None:
+        """
+        Stop the listener
+        """
+        self.cache.stop()
+
+    def test_positive_and_negative_caching(self) -> None:
+        """
+        Blocked and known good items are only asked once
+        """
+        for dummy in range(5):
+            self.assertTrue(self.cache.is_blocked('blocked'))
+            self.assertFalse(self.cache.is_blocked('good'))
+        self.assertEqual(2, self.blackred.is_blocked.call_count)
+        self.assertEqual({'hits': 8, 'misses': 2, 'entries': 2}, self.cache.statistics)
+
+    def test_expiry(self) -> None:
+        """
+        Expired entries are fetched again
+        """
+        self.cache.settings.allowed_ttl = 0
+        self.cache.is_blocked('good')
+        self.cache.is_blocked('good')
+        self.assertEqual(2, self.blackred.is_blocked.call_count)
+
+    def test_invalidate(self) -> None:
+        """
+        Invalidated entries are fetched again
+        """
+        self.cache.is_blocked('good')
+        self.cache.invalidate('good')
+        self.cache.is_blocked('good')
+        self.cache.is_blocked('blocked')
+        self.cache.invalidate(CachedBlackRed.FLUSH)
+        self.cache.is_blocked('blocked')
+        self.assertEqual(4, self.blackred.is_blocked.call_count)
+
+    def test_size_limit(self) -> None:
+        """
+        The cache does not grow beyond its size
+        """
+        self.cache.settings.size = 3
+        for item in range(10):
+            self.cache.is_blocked(str(item))
+        self.assertEqual(3, self.cache.statistics['entries'])
+
+    def test_disabled(self) -> None:
+        """
+        A disabled cache always asks BlackRed
+        """
+        self.cache.settings.enabled = False
+        self.cache.is_blocked('good')
+        self.cache.is_blocked('good')
+        self.assertEqual(2, self.blackred.is_blocked.call_count)
+
+    def test_unblock(self) -> None:
+        """
+        Unblocking drops the cached entry
+        """
+        self.assertTrue(self.cache.is_blocked('blocked'))
+        self.blackred.is_blocked.side_effect = lambda item: False
+        self.cache.unblock('blocked')
+        self.assertFalse(self.cache.is_blocked('blocked'))
+        self.blackred.unblock.assert_called_once_with('blocked')
+
+    def test_invalidated_while_reading(self) -> None:
+        """
+        An item invalidated while BlackRed is asked is not cached
+        """
+        def block(item: str) -> bool:
+            """
+            Block the item while it is asked for
+
+            :param str item: The item
+            :return: ``False``, the state before the item was blocked
+            :rtype: bool
+            """
+            self.cache.invalidate(item)
+            return False
+
+        self.blackred.is_blocked.side_effect = block
+        self.assertFalse(self.cache.is_blocked('good'))
+        self.blackred.is_blocked.side_effect = lambda item: True
+        self.assertTrue(self.cache.is_blocked('good'))
+
+    def test_resubscribe_after_redis_error(self) -> None:
+        """
+        A Redis error flushes the cache and the listener subscribes again
+        """
+        failing = Mock()
+        failing.subscribe.side_effect = RedisConnectionError('connection lost')
+        working = Mock()
+
+        def stop(**_options) -> None:
+            """
+            Stop the listener without a message
+            """
+            self.cache.stop()
+
+        working.get_message.side_effect = stop
+        connection = Mock()
+        connection.pubsub.side_effect = [failing, working]
+        self.cache.is_blocked('blocked')
+        with patch('tts.util.blackred.redis.StrictRedis', Mock(return_value=connection)), \
+                patch('tts.util.blackred.sleep') as sleep:
+            self.cache._CachedBlackRed__listen()  # pylint: disable=protected-access
+        sleep.assert_called_once_with(1.0)
+        self.assertEqual(0, self.cache.statistics['entries'])
+        working.subscribe.assert_called_once_with(CachedBlackRed.INVALIDATION_CHANNEL)
@@ -0,0 +1,81 @@
+"""
+Test the Bloom filter
+"""
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from ...core.lib.bloom import BloomFilter, UsernameFilter
+from ...util.singleton import SingletonMeta
+
+
+class BloomFilterTest(TestCase):
+    """
+    Test sizing, bit positions and false positive rate
+    """
+
+    def setUp(self) -> None:
+        """
+        Filter for 10000 items with a false positive rate of 1 %
+        """
+        self.filter = BloomFilter(10000, 0.01)
+
+    def contains(self, bitmap: bytearray, item: str) -> bool:
+        """
+        Check an item in a bitmap
+
+        :param bytearray bitmap: The bitmap
+        :param str item: The item
+        :return: ``True``, when all bits of the item are set
+        :rtype: bool
+        """
+        return all(bitmap[position >> 3] & (0x80 >> (position & 7)) for position in self.filter.positions(item))
+
+    def test_sizing(self) -> None:
+        """
+        About 9.6 bits and 7 hashes per item for 1 %
+        """
+        self.assertEqual(95851, self.filter.bits)
+        self.assertEqual(7, self.filter.hashes)
+        self.assertAlmostEqual(0.01, self.filter.false_positive_rate(10000), delta=0.001)
+
+    def test_positions(self) -> None:
+        """
+        Positions are stable and within the filter
+        """
+        positions = self.filter.positions('alice')
+        self.assertListEqual(positions, self.filter.positions('alice'))
+        self.assertEqual(self.filter.hashes, len(positions))
+        self.assertTrue(all(0 <= position < self.filter.bits for position in positions))
+
+    def test_no_false_negatives_and_few_false_positives(self) -> None:
+        """
+        All items are found, other items only at about the false positive rate
+        """
+        bitmap, count = self.filter.build('user{:d}'.format(number) for number in range(10000))
+        self.assertEqual(10000, count)
+        self.assertEqual((self.filter.bits + 7) // 8, len(bitmap))
+        self.assertTrue(all(self.contains(bitmap, 'user{:d}'.format(number)) for number in range(10000)))
+        false_positives = sum(self.contains(bitmap, 'other{:d}'.format(number)) for number in range(10000))
+        self.assertLess(false_positives, 200)
+
+
+class UsernameFilterTest(TestCase):
+    """
+    Test the configuration of the user name filter
+    """
+
+    def tearDown(self) -> None:
+        """
+        Forget the singleton
+        """
+        SingletonMeta.delete(UsernameFilter)
+
+    def test_disabled_without_configuration(self) -> None:
+        """
+        Without a ``username_filter`` section the filter is disabled
+        """
+        SingletonMeta.delete(UsernameFilter)
+        finder = Mock(return_value=Mock(find_as_json=Mock(return_value={'tts': {}})))
+        with patch('tts.core.lib.bloom.ConfigurationFileFinder', finder):
+            self.assertFalse(UsernameFilter().enabled)
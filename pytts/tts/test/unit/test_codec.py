@@ -0,0 +1,80 @@
+"""
+Test the JSON codec
+"""
+
+from unittest import TestCase
+
+from ...util.codec import JSONCodec, StandardBackend, available_backends
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+
+
+class JSONCodecTest(TestCase):
+    """
+    Test all backends that are installed
+    """
+
+    DATA = {
+        'string': 'Zeiterfassung – äöü',
+        'number': 1,
+        'float': 1.5,
+        'list': [1, 2, {'nested': None}],
+        'bool': True,
+    }
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(JSONCodec)
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def test_round_trip(self) -> None:
+        """
+        Every backend decodes what it encodes, from bytes and str
+        """
+        for backend in available_backends():
+            encoded = backend.encode(self.DATA)
+            self.assertIsInstance(encoded, bytes)
+            self.assertDictEqual(self.DATA, backend.decode(encoded))
+            self.assertDictEqual(self.DATA, backend.decode(encoded.decode('utf-8')))
+
+    def test_compatibility(self) -> None:
+        """
+        Every backend understands the output of the standard library backend and the other way round
+        """
+        for backend in available_backends():
+            self.assertDictEqual(self.DATA, backend.decode(StandardBackend.encode(self.DATA)))
+            self.assertDictEqual(self.DATA, StandardBackend.decode(backend.encode(self.DATA)))
+
+    def test_compact(self) -> None:
+        """
+        There is no whitespace in the output
+        """
+        for backend in available_backends():
+            self.assertEqual(b'{"a":[1,2]}', backend.encode({'a': [1, 2]}))
+
+    def test_invalid_data(self) -> None:
+        """
+        Invalid JSON raises a ``ValueError``
+        """
+        for backend in available_backends():
+            self.assertRaises(ValueError, backend.decode, b'{invalid')
+
+    def test_configured_codec(self) -> None:
+        """
+        The configured codec is a working singleton
+        """
+        SingletonMeta.delete(JSONCodec)
+        codec = JSONCodec()
+        self.assertIs(codec, JSONCodec())
+        self.assertDictEqual(self.DATA, codec.decode(codec.encode(self.DATA)))
+
+    def test_unknown_backend(self) -> None:
+        """
+        Unknown backends are refused
+        """
+        SingletonMeta.delete(JSONCodec)
+        self.assertRaises(ValueError, JSONCodec, 'does-not-exist')
+        SingletonMeta.delete(JSONCodec)
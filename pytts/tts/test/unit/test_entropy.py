@@ -0,0 +1,50 @@
+"""
+Test the creation of random tokens and salts
+"""
+
+from collections import Counter
+from unittest import TestCase
+
+from ...core.lib.entropy import TOKEN_CHARS, random_string, salt, tokens
+from ...core.rules import RULE_TOKEN
+from ...core.token import token_batch, token_generator
+
+
+class EntropyTest(TestCase):
+    """
+    Tokens, batches and salts
+    """
+
+    def test_token(self) -> None:
+        """
+        Tokens still match the token rule
+        """
+        self.assertTrue(RULE_TOKEN.match(token_generator()))
+        batch = token_batch(100)
+        self.assertEqual(100, len(set(batch)))
+        self.assertTrue(all(RULE_TOKEN.match(token) for token in batch))
+        self.assertListEqual([], tokens(0))
+
+    def test_distribution(self) -> None:
+        """
+        Every character of the alphabet is about equally likely
+        """
+        counts = Counter(random_string(len(TOKEN_CHARS) * 1000))
+        self.assertSetEqual(set(TOKEN_CHARS), set(counts))
+        self.assertTrue(all(800 < count < 1200 for count in counts.values()))
+        self.assertSetEqual({'a', 'b', 'c'}, set(random_string(1000, 'abc')))
+
+    def test_alphabet(self) -> None:
+        """
+        Alphabets must be ASCII and fit into a byte
+        """
+        self.assertRaises(ValueError, random_string, 8, '')
+        self.assertRaises(ValueError, random_string, 8, 'äöü')
+        self.assertRaises(ValueError, random_string, 8, 'a' * 257)
+
+    def test_salt(self) -> None:
+        """
+        Salts are random bytes
+        """
+        self.assertEqual(64, len(salt()))
+        self.assertNotEqual(salt(), salt())
@@ -0,0 +1,127 @@
+"""
+Test the envelopes of the API queue
+"""
+
+from time import time
+from unittest import TestCase
+from uuid import uuid4
+
+from ...core.functions import FUNCTION_TABLE
+from ...util.codec import JSONCodec
+from ...util.config import ConfigurationFileFinder
+from ...util.queue.envelope import EnvelopeCodec, FLAG_TRACE, HEADER, MAGIC, MAX_AGE, VERSION, created_at
+from ...util.singleton import SingletonMeta
+
+
+class EnvelopeTest(TestCase):
+    """
+    Write and read messages and replies in both formats
+    """
+
+    DATA = {'username': 'user', 'token': 'a' * 64}
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(JSONCodec)
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def util_round_trip(self, binary: bool) -> None:
+        """
+        Write a message and a reply and read them again
+
+        :param bool binary: Use the binary format
+        """
+        envelopes = EnvelopeCodec(FUNCTION_TABLE, binary=binary)
+        uuid = uuid4()
+        message = envelopes.pack('registration:choose_username', uuid, self.DATA)
+        envelope = EnvelopeCodec(FUNCTION_TABLE).unpack(message)
+        self.assertEqual(binary, envelope.binary)
+        self.assertEqual('registration:choose_username', envelope.function)
+        self.assertEqual(str(uuid), envelope.uuid)
+        self.assertAlmostEqual(time() + MAX_AGE, envelope.deadline, delta=1)
+        self.assertFalse(envelope.expired)
+        self.assertAlmostEqual(time(), envelope.created, delta=1)
+        self.assertDictEqual(self.DATA, envelope.data)
+        reply = envelopes.pack_reply(envelope, {'result': True})
+        self.assertDictEqual({'result': True}, envelopes.unpack_reply(reply))
+
+    def test_json(self) -> None:
+        """
+        The JSON format
+        """
+        self.util_round_trip(False)
+
+    def test_binary(self) -> None:
+        """
+        The binary format
+        """
+        self.util_round_trip(True)
+
+    def test_binary_header(self) -> None:
+        """
+        The binary header carries the function id and is followed by the payload only
+        """
+        message = EnvelopeCodec(FUNCTION_TABLE, binary=True).pack('login:status', uuid4(), {})
+        self.assertEqual(HEADER.size + 2, len(message))
+        self.assertEqual(FUNCTION_TABLE.index('login:status'), HEADER.unpack_from(message)[5])
+
+    def test_unknown_function_falls_back_to_json(self) -> None:
+        """
+        Functions missing in the table are written as JSON
+        """
+        message = EnvelopeCodec(FUNCTION_TABLE, binary=True).pack('does:not_exist', uuid4(), {})
+        envelope = EnvelopeCodec(FUNCTION_TABLE).unpack(message)
+        self.assertFalse(envelope.binary)
+        self.assertEqual('does:not_exist', envelope.function)
+
+    def test_invalid_messages(self) -> None:
+        """
+        Invalid messages are refused
+        """
+        envelopes = EnvelopeCodec(FUNCTION_TABLE)
+        for message in (b'', b'{invalid', b'[]', b'{"_": "a"}', b'\xf7\x01',
+                        b'{"_":"a","_uuid":"b","_time":"c","data":1}', b'{"_":["a"],"_uuid":"b","_time":1,"data":1}',
+                        b'{"_":"a","_uuid":{},"_time":1,"data":1}'):
+            self.assertIsNone(envelopes.unpack(message))
+
+    def test_created_at(self) -> None:
+        """
+        The creation time is read from both formats without the function table
+        """
+        for binary in (False, True):
+            message = EnvelopeCodec(FUNCTION_TABLE, binary).pack('login:status', uuid4(), self.DATA)
+            self.assertAlmostEqual(time(), created_at(message), delta=1)
+        for message in (b'STOP', b'{"_time": "c"}', b'\xf7\x01'):
+            self.assertIsNone(created_at(message))
+
+    def test_trace(self) -> None:
+        """
+        The trace context travels in both formats, the binary one extends the header
+        """
+        trace = '{:s}-{:s}'.format('0af7651916cd43dd8448eb211c80319c', 'b7ad6b7169203331')
+        for binary in (False, True):
+            envelopes = EnvelopeCodec(FUNCTION_TABLE, binary)
+            message = envelopes.pack('login:status', uuid4(), self.DATA, trace)
+            envelope = envelopes.unpack(message)
+            self.assertEqual(trace, envelope.trace)
+            self.assertDictEqual(self.DATA, envelope.data)
+            self.assertAlmostEqual(time(), created_at(message), delta=1)
+            self.assertIsNone(envelopes.unpack(envelopes.pack('login:status', uuid4(), self.DATA)).trace)
+
+    def test_versions(self) -> None:
+        """
+        Messages of version 1 are still read, their flags ignored, newer versions are refused
+        """
+        envelopes = EnvelopeCodec(FUNCTION_TABLE)
+        function_id = FUNCTION_TABLE.index('login:status')
+        payload = JSONCodec().encode(self.DATA)
+        envelope = envelopes.unpack(HEADER.pack(MAGIC, 1, FLAG_TRACE, uuid4().bytes, time() + MAX_AGE, function_id)
+                                    + payload)
+        self.assertEqual('login:status', envelope.function)
+        self.assertIsNone(envelope.trace)
+        self.assertDictEqual(self.DATA, envelope.data)
+        self.assertIsNone(envelopes.unpack(HEADER.pack(MAGIC, VERSION + 1, 0, uuid4().bytes, time() + MAX_AGE,
+                                                       function_id) + payload))
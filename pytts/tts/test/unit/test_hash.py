@@ -0,0 +1,129 @@
+"""
+Test the password hashing service
+"""
+
+from unittest import TestCase
+
+from ...core.lib.hash import HashingSaturated, HashingService, create_salt, create_salt_as_base64_string, \
+    hash_password, hash_password_with_base64_salt_as_base64_string, hash_password_with_salt, scrypt
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+
+
+class HashPasswordTest(TestCase):
+    """
+    The algorithms of the hash versions
+    """
+
+    def test_legacy(self) -> None:
+        """
+        The legacy version chains SHA-512
+        """
+        salt = create_salt()
+        self.assertEqual(hash_password_with_salt('password', salt),
+                         hash_password('password', salt, {'algorithm': 'sha512_chain', 'rounds': 250000}))
+
+    def test_algorithms(self) -> None:
+        """
+        Every algorithm delivers 64 bytes, depending on the parameters
+        """
+        salt = create_salt()
+        settings = [
+            {'algorithm': 'sha512_chain', 'rounds': 1000},
+            {'algorithm': 'pbkdf2_sha512', 'iterations': 1000},
+            {'algorithm': 'pbkdf2_sha512', 'iterations': 1001},
+        ]
+        if scrypt is not None:
+            settings.append({'algorithm': 'scrypt', 'n': 1024, 'r': 8, 'p': 1})
+        hashes = [hash_password('password', salt, setting) for setting in settings]
+        self.assertEqual(len(settings), len(set(hashes)))
+        self.assertListEqual([64] * len(settings), [len(password_hash) for password_hash in hashes])
+        self.assertRaises(ValueError, hash_password, 'password', salt, {'algorithm': 'md5'})
+
+
+class HashingServiceTest(TestCase):
+    """
+    Hash passwords in worker processes
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Use a single worker without queue
+        """
+        SingletonMeta.delete(HashingService)
+        self.service = HashingService(1, 0)
+
+    def tearDown(self) -> None:
+        """
+        Stop the worker processes
+        """
+        self.service.shutdown()
+        SingletonMeta.delete(HashingService)
+
+    def test_hash(self) -> None:
+        """
+        The worker computes the same hash as the inline function
+        """
+        salt = create_salt_as_base64_string()
+        self.assertEqual(hash_password_with_base64_salt_as_base64_string('password', salt),
+                         self.service.hash('password', salt))
+        self.assertEqual(0, self.service.pending)
+
+    def test_versions(self) -> None:
+        """
+        Hashes use the current version unless another one is requested
+        """
+        salt = create_salt_as_base64_string()
+        self.assertIn(self.service.version, self.service.versions)
+        self.service.versions['test'] = {'algorithm': 'pbkdf2_sha512', 'iterations': 1000}
+        expected = hash_password_with_base64_salt_as_base64_string('password', salt, self.service.versions['test'])
+        self.assertEqual(expected, self.service.hash('password', salt, 'test'))
+        self.assertRaises(ValueError, self.service.submit, 'password', salt, 'unknown')
+
+    def test_saturated(self) -> None:
+        """
+        Hashes beyond the workers and the queue are rejected at once
+        """
+        salt = create_salt_as_base64_string()
+        future = self.service.submit('password', salt)
+        self.assertTrue(self.service.saturated)
+        self.assertRaises(HashingSaturated, self.service.submit, 'password', salt)
+        self.assertEqual(88, len(future.result(30)))
+        self.assertFalse(self.service.saturated)
+
+    def test_waiters(self) -> None:
+        """
+        Threads beyond the waiter slots are rejected before they block
+        """
+        SingletonMeta.delete(HashingService)
+        self.service = HashingService(1, 0, 1)
+        self.service.start()
+        self.service.acquire_waiter()
+        self.assertTrue(self.service.saturated)
+        self.assertRaises(HashingSaturated, self.service.hash, 'password', create_salt_as_base64_string())
+        self.service.release_waiter()
+        self.assertFalse(self.service.saturated)
+        self.assertEqual(88, len(self.service.hash('password', create_salt_as_base64_string())))
+        self.assertEqual(0, self.service.waiting)
+
+    def test_hash_or_error(self) -> None:
+        """
+        A full hashing service is returned as error of the call
+        """
+        SingletonMeta.delete(HashingService)
+        self.service = HashingService(1, 0, 1)
+        self.service.start()
+        self.service.acquire_waiter()
+        self.assertEqual((None, {'error': {'code': -6, 'message': 'hashing_saturated'}}),
+                         self.service.hash_or_error('password', create_salt_as_base64_string()))
+        self.service.release_waiter()
+        password_hash, error = self.service.hash_or_error('password', create_salt_as_base64_string())
+        self.assertEqual(88, len(password_hash))
+        self.assertIsNone(error)
@@ -0,0 +1,100 @@
+"""
+Test the structured logging
+"""
+
+from logging import INFO, WARNING, getLogger, makeLogRecord
+from os import path
+from queue import Queue
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from ...util.codec import JSONCodec
+from ...util.config import ConfigurationFileFinder
+from ...util.log import BoundedQueueHandler, JSONFormatter, LogService, SamplingFilter
+from ...util.singleton import SingletonMeta
+
+
+class LogRecordTest(TestCase):
+    """
+    Format, sample and queue single records
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(JSONCodec)
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def test_format(self) -> None:
+        """
+        Fields given as extra are written next to the message
+        """
+        record = makeLogRecord({'name': 'tts.dispatch', 'levelno': INFO, 'levelname': 'INFO', 'msg': 'dispatch %s',
+                                'args': ('login:status',), 'uuid': 'a', 'duration': 0.5})
+        data = JSONCodec().decode(JSONFormatter().format(record))
+        self.assertEqual('dispatch login:status', data['message'])
+        self.assertEqual('dispatch', data['category'])
+        self.assertEqual('a', data['uuid'])
+        self.assertEqual(0.5, data['duration'])
+        self.assertNotIn('args', data)
+
+    def test_sampling(self) -> None:
+        """
+        Sampled categories keep warnings, other categories keep everything
+        """
+        sampling = SamplingFilter({'request': 0.0})
+        self.assertFalse(sampling.filter(makeLogRecord({'name': 'tts.request', 'levelno': INFO})))
+        self.assertTrue(sampling.filter(makeLogRecord({'name': 'tts.request', 'levelno': WARNING})))
+        self.assertTrue(sampling.filter(makeLogRecord({'name': 'tts.dispatch', 'levelno': INFO})))
+
+    def test_bounded(self) -> None:
+        """
+        Records are dropped when the queue is full
+        """
+        handler = BoundedQueueHandler(Queue(1))
+        for dummy in range(3):
+            handler.handle(makeLogRecord({'name': 'tts.request', 'msg': 'request'}))
+        self.assertEqual(2, handler.dropped)
+        self.assertEqual(1, handler.queue.qsize())
+
+
+class LogServiceTest(TestCase):
+    """
+    Write records in the background
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(JSONCodec)
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def test_file(self) -> None:
+        """
+        Records and exceptions of the ``tts`` loggers end up in the file
+        """
+        directory = mkdtemp()
+        try:
+            service = LogService()
+            service.file = path.join(directory, 'pytts.log')
+            service.rates = {'request': 0.0}
+            service.start()
+            getLogger('tts.request').info('request', extra={'endpoint': '/v1.0/login/status'})
+            try:
+                raise KeyError('username')
+            except KeyError:
+                getLogger('tts.dispatch').exception('function failed', extra={'function': 'login:status'})
+            service.stop()
+            with open(service.file, 'rb') as file_pointer:
+                records = [JSONCodec().decode(line) for line in file_pointer]
+        finally:
+            rmtree(directory)
+        self.assertEqual(1, len(records))
+        self.assertEqual('function failed', records[0]['message'])
+        self.assertEqual('login:status', records[0]['function'])
+        self.assertIn("KeyError: 'username'", records[0]['exception'])
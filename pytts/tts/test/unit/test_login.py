@@ -0,0 +1,99 @@
+"""
+Test the login against a mocked user cache, session store and hashing service
+"""
+
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import partial
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from ...core.lib.hash import HashingSaturated, HashingService
+from ...core.prog.login import Login
+
+
+class LoginTest(TestCase):
+    """
+    Test the error codes of the login functions
+    """
+
+    def setUp(self) -> None:
+        """
+        Mock the user cache, the session store and the hashing service
+        """
+        self.users = Mock()
+        self.users.get.return_value = {
+            'username': 'alice', 'salt': 'salt', 'password': 'hash', 'hash_version': 'test', 'enabled': True,
+        }
+        self.sessions = Mock()
+        self.sessions.create.return_value = 'token'
+        self.hashing = Mock(saturated=False)
+        self.hashing.hash.return_value = 'hash'
+        self.hashing.hash_or_error.side_effect = partial(HashingService.hash_or_error, self.hashing)
+        for name, value in (
+                ('UserCache', Mock(return_value=self.users)),
+                ('SessionStore', Mock(return_value=self.sessions)),
+                ('HashingService', Mock(return_value=self.hashing)),
+        ):
+            patcher = patch('tts.core.prog.login.{:s}'.format(name), value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.login = Login()
+
+    def test_authenticate(self) -> None:
+        """
+        Valid credentials of an enabled user start a session
+        """
+        result = self.login.authenticate({'username': 'alice', 'password': 'Secret-Password-1'})
+        self.assertEqual({'token': 'token', 'username': 'alice'}, result)
+        self.hashing.hash.assert_called_once_with('Secret-Password-1', 'salt', 'test')
+        self.sessions.create.assert_called_once_with('alice')
+
+    def test_invalid_credentials(self) -> None:
+        """
+        Wrong passwords, unknown users and user names in the wrong case are rejected alike, always after hashing
+        """
+        self.hashing.hash.return_value = 'other'
+        self.assertEqual(-10001, self.login.authenticate({'username': 'alice', 'password': 'x'})['error']['code'])
+        self.hashing.hash.return_value = 'hash'
+        self.hashing.hash_or_error.side_effect = partial(HashingService.hash_or_error, self.hashing)
+        self.assertEqual(-10001, self.login.authenticate({'username': 'Alice', 'password': 'x'})['error']['code'])
+        self.users.get.return_value = None
+        self.assertEqual(-10001, self.login.authenticate({'username': 'bob', 'password': 'x'})['error']['code'])
+        self.assertEqual(3, self.hashing.hash.call_count)
+        self.assertFalse(self.sessions.create.called)
+
+    def test_account_disabled(self) -> None:
+        """
+        Disabled users are told so only with the right password
+        """
+        self.users.get.return_value['enabled'] = False
+        result = self.login.authenticate({'username': 'alice', 'password': 'Secret-Password-1'})
+        self.assertEqual(-10002, result['error']['code'])
+        self.assertFalse(self.sessions.create.called)
+
+    def test_hashing_saturated(self) -> None:
+        """
+        A saturated hashing service is reported before and while hashing
+        """
+        self.hashing.saturated = True
+        self.assertEqual(-6, self.login.authenticate({'username': 'alice', 'password': 'x'})['error']['code'])
+        self.assertFalse(self.users.get.called)
+        self.hashing.saturated = False
+        self.hashing.hash.side_effect = HashingSaturated()
+        self.assertEqual(-6, self.login.authenticate({'username': 'alice', 'password': 'x'})['error']['code'])
+
+    def test_timeout(self) -> None:
+        """
+        A hash that is not ready in time is reported as timeout
+        """
+        self.hashing.hash.side_effect = FutureTimeout()
+        self.assertEqual(-1, self.login.authenticate({'username': 'alice', 'password': 'x'})['error']['code'])
+
+    def test_status(self) -> None:
+        """
+        Valid sessions tell their user, invalid ones are reported
+        """
+        self.sessions.validate.return_value = 'alice'
+        self.assertEqual({'status': 'valid', 'username': 'alice'}, self.login.status({'token': 'token'}))
+        self.sessions.validate.return_value = None
+        self.assertEqual(-10003, self.login.status({'token': 'token'})['error']['code'])
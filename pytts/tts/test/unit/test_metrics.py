@@ -0,0 +1,92 @@
+"""
+Test the metrics registry and the text exposition format
+"""
+
+from unittest import TestCase
+
+from ...util.metrics import MetricsRegistry, exposition, merge_snapshots
+
+
+class MetricsRegistryTest(TestCase):
+    """
+    Record metrics and write them in the exposition format
+    """
+
+    def setUp(self) -> None:
+        """
+        Create a registry with a metric of each type
+        """
+        self.registry = MetricsRegistry()
+        self.counter = self.registry.counter('tts_test_total', 'Test counter', ('function',))
+        self.gauge = self.registry.gauge('tts_test_entries', 'Test gauge')
+        self.histogram = self.registry.histogram('tts_test_seconds', 'Test histogram', buckets=(.1, 1.0))
+
+    def test_register(self) -> None:
+        """
+        Registering a name again returns the same metric, unless the type differs
+        """
+        self.assertIs(self.counter, self.registry.counter('tts_test_total', 'Test counter', ('function',)))
+        with self.assertRaises(ValueError):
+            self.registry.gauge('tts_test_total', 'Test counter')
+
+    def test_exposition(self) -> None:
+        """
+        All samples are written with help, type, labels and cumulative buckets
+        """
+        self.counter.inc(labels=('admin:enable_user',))
+        self.counter.inc(2, ('admin:enable_user',))
+        self.counter.inc(labels=('say "hi"',))
+        self.gauge.set(5)
+        self.histogram.observe(.05)
+        self.histogram.observe(.5)
+        self.histogram.observe(7)
+        self.assertEqual('\n'.join([
+            '# HELP tts_test_entries Test gauge',
+            '# TYPE tts_test_entries gauge',
+            'tts_test_entries 5',
+            '# HELP tts_test_seconds Test histogram',
+            '# TYPE tts_test_seconds histogram',
+            'tts_test_seconds_bucket{le="0.1"} 1',
+            'tts_test_seconds_bucket{le="1.0"} 2',
+            'tts_test_seconds_bucket{le="+Inf"} 3',
+            'tts_test_seconds_sum 7.55',
+            'tts_test_seconds_count 3',
+            '# HELP tts_test_total Test counter',
+            '# TYPE tts_test_total counter',
+            'tts_test_total{function="admin:enable_user"} 3',
+            'tts_test_total{function="say \\"hi\\""} 1',
+        ]) + '\n', exposition(self.registry.snapshot()))
+
+    def test_collector(self) -> None:
+        """
+        Collectors update their metrics right before the snapshot
+        """
+        self.registry.register_collector('entries', lambda: self.gauge.set(42))
+        self.assertListEqual([[42]], self.registry.snapshot()['tts_test_entries']['values'])
+
+    def test_timer(self) -> None:
+        """
+        The duration of a with block is observed
+        """
+        with self.histogram.time():
+            pass
+        counts, total = self.registry.snapshot()['tts_test_seconds']['values'][0]
+        self.assertEqual(1, counts[0])
+        self.assertLess(total, .1)
+
+    def test_merge(self) -> None:
+        """
+        Snapshots of several processes are summed up
+        """
+        self.counter.inc(labels=('login:status',))
+        self.histogram.observe(.5)
+        self.gauge.set(2)
+        snapshot = self.registry.snapshot()
+        other = MetricsRegistry()
+        other.counter('tts_test_total', 'Test counter', ('function',)).inc(4, ('login:status',))
+        other.counter('tts_test_total', 'Test counter', ('function',)).inc(labels=('login:authenticate',))
+        merged = merge_snapshots([snapshot, other.snapshot(), snapshot])
+        self.assertListEqual([['login:authenticate', 1], ['login:status', 6]],
+                             sorted(merged['tts_test_total']['values']))
+        self.assertListEqual([[[0, 2, 0], 1.0]], merged['tts_test_seconds']['values'])
+        self.assertListEqual([[4]], merged['tts_test_entries']['values'])
@@ -0,0 +1,141 @@
+"""
+Test the request pools of the web server
+"""
+
+from threading import Event, Thread
+from unittest import TestCase
+
+from ...control.pools import PoolMiddleware, RequestPool, pools_from_configuration
+from ...util.codec import JSONCodec
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+
+
+class RequestPoolTest(TestCase):
+    """
+    Limits and statistics of a single pool
+    """
+
+    def test_reject(self) -> None:
+        """
+        A full pool without queue rejects immediately
+        """
+        pool = RequestPool('api', 2)
+        self.assertTrue(pool.acquire())
+        self.assertTrue(pool.acquire())
+        self.assertFalse(pool.acquire())
+        pool.release()
+        self.assertTrue(pool.acquire())
+        statistics = pool.statistics
+        self.assertEqual(2, statistics['active'])
+        self.assertEqual(2, statistics['peak'])
+        self.assertEqual(1, statistics['served'])
+        self.assertEqual(1, statistics['rejected'])
+
+    def test_queue(self) -> None:
+        """
+        A queued request gets the next free slot, requests beyond the queue limit are rejected
+        """
+        pool = RequestPool('static', 1, 1, 5.0)
+        self.assertTrue(pool.acquire())
+        results = []
+        waiter = Thread(target=lambda: results.append(pool.acquire()))
+        waiter.start()
+        while pool.statistics['waiting'] < 1:
+            waiter.join(.01)
+        self.assertFalse(pool.acquire())
+        pool.release()
+        waiter.join()
+        self.assertListEqual([True], results)
+        self.assertEqual(2, pool.threads)
+
+    def test_timeout(self) -> None:
+        """
+        A queued request is rejected after the timeout
+        """
+        pool = RequestPool('static', 1, 1, .05)
+        self.assertTrue(pool.acquire())
+        self.assertFalse(pool.acquire())
+        self.assertEqual(0, pool.statistics['waiting'])
+        self.assertEqual(1, pool.statistics['rejected'])
+
+
+class PoolMiddlewareTest(TestCase):
+    """
+    Route requests to their pools
+    """
+
+    ROUTES = (
+        ('/api/v1.0/admin', 'admin'),
+        ('/api/', 'api'),
+    )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(JSONCodec)
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Create a middleware around an application that blocks until released
+        """
+        self.pools = pools_from_configuration({'pools': {'api': {'size': 1}}})
+        self.release = Event()
+        self.statuses = []
+
+        def application(environ, start_response):
+            """
+            Block until released
+            """
+            self.release.wait(5)
+            start_response('200 OK', [])
+            return [environ['PATH_INFO'].encode('utf-8')]
+
+        self.middleware = PoolMiddleware(application, self.pools, self.ROUTES)
+
+    def request(self, script_name: str, path_info: str) -> list:
+        """
+        Run a request through the middleware and close the response
+
+        :param str script_name: Mount point
+        :param str path_info: Path within the mount point
+        :return: Body parts
+        :rtype: list
+        """
+        response = self.middleware({'SCRIPT_NAME': script_name, 'PATH_INFO': path_info},
+                                   lambda status, headers: self.statuses.append(status))
+        body = list(response)
+        if hasattr(response, 'close'):
+            response.close()
+        return body
+
+    def test_route(self) -> None:
+        """
+        Requests are counted in the pool of their route class
+        """
+        self.release.set()
+        self.request('/api', '/v1.0/admin/enable_user')
+        self.request('/api', '/v1.0/login/status')
+        self.request('', '/static/index.xhtml')
+        for name in ('admin', 'api', 'static'):
+            self.assertEqual(1, self.pools[name].statistics['served'])
+            self.assertEqual(0, self.pools[name].statistics['active'])
+
+    def test_overload(self) -> None:
+        """
+        A full API pool answers with 503, static requests are still served
+        """
+        blocked = Thread(target=self.request, args=('/api', '/v1.0/login/status'))
+        blocked.start()
+        while self.pools['api'].statistics['active'] < 1:
+            blocked.join(.01)
+        body = self.request('/api', '/v1.0/login/status')
+        self.assertEqual('503 Service Unavailable', self.statuses[-1])
+        self.assertEqual(-4, JSONCodec().decode(body[0])['error']['code'])
+        self.release.set()
+        self.assertListEqual([b'/static/tt.js'], self.request('', '/static/tt.js'))
+        blocked.join()
+        self.assertEqual(1, self.pools['api'].statistics['rejected'])
@@ -0,0 +1,118 @@
+"""
+Test the on demand profiling
+"""
+
+from os import path
+from queue import Queue
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Event, Thread
+from unittest import TestCase
+
+from ...util.config import ConfigurationFileFinder
+from ...util.profiling import HeapProfiler, Profiler, StackSampler
+from ...util.singleton import SingletonMeta
+
+
+def wait_for(event: Event) -> None:
+    """
+    Block the calling thread
+
+    :param Event event: Event ending the wait
+    """
+    event.wait(5)
+
+
+class StackSamplerTest(TestCase):
+    """
+    Sample the stacks of all threads
+    """
+
+    def test_collapsed(self) -> None:
+        """
+        Stacks start with the thread name and end with the innermost frame
+        """
+        event = Event()
+        thread = Thread(target=wait_for, args=(event,), name='waiting')
+        thread.start()
+        sampler = StackSampler(0.001)
+        sampler.run(0.05)
+        event.set()
+        thread.join()
+        stacks = [stack for stack in sampler.stacks if stack.startswith('waiting;')]
+        self.assertGreater(sampler.samples, 1)
+        self.assertTrue(stacks)
+        self.assertIn(';wait_for (test_profiling.py:', stacks[0])
+        self.assertFalse([stack for stack in sampler.stacks if ';run (profiling.py:' in stack])
+
+
+class HeapProfilerTest(TestCase):
+    """
+    Compare heap snapshots
+    """
+
+    def tearDown(self) -> None:
+        """
+        Stop tracing
+        """
+        self.profiler.stop()
+
+    def test_growth(self) -> None:
+        """
+        The first snapshot is the baseline, the next one reports the allocations since then
+        """
+        self.profiler = HeapProfiler(top=5)
+        self.assertListEqual([], self.profiler.snapshot())
+        allocated = [bytearray(4096) for dummy in range(256)]
+        statistics = self.profiler.snapshot()
+        self.assertLessEqual(len(statistics), 5)
+        self.assertEqual(__file__, statistics[0].traceback[0].filename)
+        self.assertGreaterEqual(statistics[0].size_diff, 256 * 4096)
+        self.assertEqual(256, len(allocated))
+
+
+class ProfilerTest(TestCase):
+    """
+    Write the results into the result directory
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Write into a temporary directory
+        """
+        self.profiler = Profiler()
+        self.profiler.directory = mkdtemp()
+
+    def tearDown(self) -> None:
+        """
+        Remove the results
+        """
+        self.profiler.heap.stop()
+        rmtree(self.profiler.directory)
+
+    def test_profile(self) -> None:
+        """
+        Only one profile runs at a time, the result is reported to the callback
+        """
+        results = Queue()
+        self.assertTrue(self.profiler.profile(0.05, results.put))
+        self.assertFalse(self.profiler.profile(0.05, results.put))
+        file = results.get(timeout=5)
+        self.assertTrue(file.endswith('.collapsed'))
+        self.assertEqual(self.profiler.directory, path.dirname(file))
+        with open(file, 'r', encoding='utf-8') as file_pointer:
+            self.assertRegex(file_pointer.read(), r'(?m)^MainThread;.* \d+$')
+
+    def test_heap_snapshot(self) -> None:
+        """
+        The first snapshot writes no report
+        """
+        self.assertIsNone(self.profiler.heap_snapshot())
+        self.assertTrue(path.isfile(self.profiler.heap_snapshot()))
@@ -4,13 +4,16 @@ Test the Redis Queue superclass
 """
 
 from unittest import TestCase
-from unittest.mock import Mock
-from time import sleep
+from unittest.mock import Mock, patch
+from time import sleep, time
+from uuid import uuid4
 
 import pytest
 from redis import StrictRedis
 from redis.exceptions import ConnectionError as RedisConnectionError
+from ...core.functions import FUNCTION_TABLE
 from ...util.config import ConfigurationFileFinder
+from ...util.queue.envelope import EnvelopeCodec
 from ...util.queue.redis import RedisQueueAccess, RedisQueueConfiguration, RedisQueueConsumer, RedisQueueProducer
 from ...util.singleton import SingletonMeta
 
@@ -546,6 +549,100 @@ class RedisQueueProducerTest(TestCase):
         self.assertIsNone(item)
 
 
+class RedisQueueIntrospectionTest(TestCase):
+    """
+    Test depth, age and rates of a queue
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """
+        Setup the test class
+        """
+        SingletonMeta.delete(ConfigurationFileFinder)
+        cls.__config = ConfigurationFileFinder().find_as_json()['tts']['queues']['test']
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances of the Configuration File Finder and clear the database
+        """
+        StrictRedis(connection_pool=RedisQueueConfiguration(cls.__config).create_redis_connection_pool()).flushdb()
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Flush DB before test
+        """
+        StrictRedis(connection_pool=RedisQueueConfiguration(self.__config).create_redis_connection_pool()).flushdb()
+
+    def test_empty_queue(self) -> None:
+        """
+        An empty queue has no depth and no age
+        """
+        rqp = RedisQueueProducer(self.__config)
+        self.assertEqual(0, rqp.depth())
+        self.assertEqual(0.0, rqp.oldest_age())
+        self.assertDictEqual({'enqueued': 0.0, 'dequeued': 0.0}, rqp.rates())
+
+    def test_depth_and_age(self) -> None:
+        """
+        Depth and age of the head envelope are reported
+        """
+        rqp = RedisQueueProducer(self.__config)
+        envelopes = EnvelopeCodec(FUNCTION_TABLE, binary=True)
+        rqp.fire_messages([envelopes.pack('login:status', uuid4(), {}) for dummy in range(3)])
+        sleep(.5)
+        self.assertEqual(3, rqp.depth())
+        self.assertGreaterEqual(rqp.oldest_age(), .5)
+        self.assertLess(rqp.oldest_age(), 5)
+        rqp.get_connection().lpush(rqp.queue, 'STOP')
+        self.assertIsNone(rqp.oldest_age())
+
+    def test_rate_counters(self) -> None:
+        """
+        Pushed and popped messages are counted in the current bucket
+        """
+        rqp = RedisQueueProducer(self.__config)
+        bucket = int(time() // rqp.RATE_BUCKET)
+        rqp.fire_messages(['Message 1', 'Message 2'])
+        rqp.fire_message('Message 3')
+        mock = Mock()
+        rqc = RedisQueueConsumer(self.__config, mock)
+        rqc.stop()
+        self.assertEqual(3, mock.call_count)
+        redis_connection = rqp.get_connection()
+        enqueued = redis_connection.get(rqp.rate_key(rqp.ENQUEUED, bucket))
+        dequeued = redis_connection.get(rqp.rate_key(rqp.DEQUEUED, bucket))
+        if int(time() // rqp.RATE_BUCKET) == bucket:
+            self.assertEqual(b'3', enqueued)
+            self.assertEqual(b'3', dequeued)
+        self.assertIn('test', RedisQueueAccess.snapshot_all())
+
+    def test_dequeued_per_bucket(self) -> None:
+        """
+        A long drain counts the popped messages in the bucket they were popped in
+        """
+        rqp = RedisQueueProducer(self.__config)
+        bucket = rqp.bucket()
+        clock = [bucket * rqp.RATE_BUCKET + 1.0]
+
+        def callback(_message) -> None:
+            """
+            Every message takes a whole bucket
+            """
+            clock[0] += rqp.RATE_BUCKET
+
+        rqp.fire_messages(['Message 1', 'Message 2', 'Message 3'])
+        with patch('tts.util.queue.redis.time', lambda: clock[0]):
+            rqc = RedisQueueConsumer(self.__config, callback)
+            rqc.stop()
+        redis_connection = rqp.get_connection()
+        self.assertListEqual([b'1', b'1', b'1'], redis_connection.mget(
+            [rqp.rate_key(rqp.DEQUEUED, bucket + offset) for offset in range(3)]
+        ))
+
+
 class RedisQueueConsumerTest(TestCase):
     """
     Test the Redis Queue Consumer
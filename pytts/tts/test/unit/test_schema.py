@@ -0,0 +1,77 @@
+"""
+Test the declarative validation of request data
+"""
+
+from unittest import TestCase
+
+from werkzeug.exceptions import BadRequest
+
+from ...api.base.schema import Field, Schema
+from ...core.rules import RULE_USERNAME, RULE_TOKEN
+
+
+class SchemaTest(TestCase):
+    """
+    Compile a schema and validate some data with it
+    """
+
+    def setUp(self) -> None:
+        """
+        Compile a simple schema
+        """
+        self.validator = Schema(
+            Field('username', rule=RULE_USERNAME),
+            Field('token', rule=RULE_TOKEN),
+            Field('data', kind=dict),
+        ).compile()
+        self.valid = {
+            'username': 'user',
+            'token': 'a' * 64,
+            'data': {},
+        }
+
+    def test_valid(self) -> None:
+        """
+        Valid data passes and only the fields of the schema are extracted
+        """
+        self.assertTrue(self.validator.is_valid(self.valid))
+        data = dict(self.valid)
+        data['unknown'] = 1
+        self.assertDictEqual(self.valid, self.validator.validate(data))
+
+    def test_no_dict(self) -> None:
+        """
+        Only dictionaries are valid
+        """
+        for data in (None, [], 'username', 1):
+            self.assertFalse(self.validator.is_valid(data))
+            self.assertRaises(BadRequest, self.validator.validate, data)
+
+    def test_missing_field(self) -> None:
+        """
+        All fields are required
+        """
+        for field in self.valid:
+            data = dict(self.valid)
+            del data[field]
+            self.assertFalse(self.validator.is_valid(data))
+
+    def test_wrong_type(self) -> None:
+        """
+        Fields must have the right type
+        """
+        for field in self.valid:
+            data = dict(self.valid)
+            data[field] = 1
+            self.assertFalse(self.validator.is_valid(data))
+
+    def test_rule_mismatch(self) -> None:
+        """
+        Fields must match their rule
+        """
+        data = dict(self.valid)
+        data['username'] = 'x'
+        self.assertFalse(self.validator.is_valid(data))
+        data = dict(self.valid)
+        data['token'] = 'a' * 63
+        self.assertFalse(self.validator.is_valid(data))
@@ -0,0 +1,137 @@
+"""
+Test the local cache of validated sessions and the listener for revocations
+"""
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from redis import ConnectionError as RedisConnectionError
+
+from ...core.lib.session import SessionCache, SessionStore
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+
+
+class SessionCacheTest(TestCase):
+    """
+    Test the session cache
+    """
+
+    def setUp(self) -> None:
+        """
+        Fresh cache for every test
+        """
+        self.cache = SessionCache(size=3, ttl=30.0)
+
+    def test_hit_and_miss(self) -> None:
+        """
+        Remembered sessions are hits, unknown ones misses
+        """
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', 'alice')
+        self.assertEqual('alice', self.cache.get('a'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'entries': 1}, self.cache.statistics)
+
+    def test_expiry(self) -> None:
+        """
+        Expired sessions are misses
+        """
+        self.cache.ttl = 0
+        self.cache.put('a', 'alice')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_invalidate(self) -> None:
+        """
+        Invalidated sessions are misses, flushing drops everything
+        """
+        self.cache.put('a', 'alice')
+        self.cache.put('b', 'bob')
+        self.cache.invalidate('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual('bob', self.cache.get('b'))
+        self.cache.invalidate(SessionStore.FLUSH)
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_least_recently_used_are_dropped(self) -> None:
+        """
+        The cache does not grow beyond its size and keeps the recently used sessions
+        """
+        for session in 'abc':
+            self.cache.put(session, 'alice')
+        self.cache.get('a')
+        self.cache.put('d', 'bob')
+        self.assertEqual(3, self.cache.statistics['entries'])
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual('alice', self.cache.get('a'))
+
+    def test_invalidated_while_reading(self) -> None:
+        """
+        A session invalidated or flushed while it is read from Redis is not cached
+        """
+        generation = self.cache.generation('a')
+        self.cache.invalidate('a')
+        self.assertFalse(self.cache.put('a', 'alice', generation))
+        self.assertIsNone(self.cache.get('a'))
+        generation = self.cache.generation('a')
+        self.cache.invalidate(SessionStore.FLUSH)
+        self.assertFalse(self.cache.put('a', 'alice', generation))
+        self.assertTrue(self.cache.put('a', 'alice', self.cache.generation('a')))
+        self.assertEqual('alice', self.cache.get('a'))
+
+
+class SessionStoreListenerTest(TestCase):
+    """
+    Test the listener for revocations against a mocked Redis
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances of the Configuration File Finder
+        """
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Fresh store for every test
+        """
+        SingletonMeta.delete(SessionStore)
+        self.store = SessionStore()
+
+    def tearDown(self) -> None:
+        """
+        Forget the singleton
+        """
+        SingletonMeta.delete(SessionStore)
+
+    def test_resubscribe_after_redis_error(self) -> None:
+        """
+        A Redis error flushes the cache and the listener subscribes again
+        """
+        failing = Mock()
+        failing.subscribe.side_effect = RedisConnectionError('connection lost')
+        working = Mock()
+
+        def revoke(**_options) -> dict:
+            """
+            Deliver one revocation and stop the listener
+
+            :return: The message
+            :rtype: dict
+            """
+            self.store.stop()
+            return {'type': 'message', 'data': b'b'}
+
+        working.get_message.side_effect = revoke
+        connection = Mock()
+        connection.pubsub.side_effect = [failing, working]
+        self.store.cache.put('a', 'alice')
+        self.store.cache.put('b', 'bob')
+        with patch('tts.core.lib.session.redis.StrictRedis', Mock(return_value=connection)), \
+                patch('tts.core.lib.session.sleep') as sleep:
+            self.store._SessionStore__listen()  # pylint: disable=protected-access
+        sleep.assert_called_once_with(1.0)
+        self.assertIsNone(self.store.cache.get('a'))
+        working.subscribe.assert_called_once_with(SessionStore.REVOCATION_CHANNEL)
+        failing.close.assert_called_once_with()
+        working.close.assert_called_once_with()
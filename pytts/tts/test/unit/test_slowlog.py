@@ -0,0 +1,94 @@
+"""
+Test the slow log of the API calls
+"""
+
+from time import time
+from unittest import TestCase
+
+from ...util.codec import JSONCodec
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+from ...util.slowlog import SlowLog, aggregate, stage_offsets
+
+
+class StageOffsetsTest(TestCase):
+    """
+    Convert and sum up the stage timings
+    """
+
+    def test_offsets(self) -> None:
+        """
+        Stages are milliseconds after the arrival, missing stages are left out
+        """
+        arrival = 1000.0
+        self.assertDictEqual({
+            'enqueued': 1.0,
+            'dequeued': 2.0,
+            'handler_start': 3.0,
+            'handler_end': 300.0,
+            'published': 301.0,
+            'received': 305.0,
+        }, stage_offsets(arrival, 1000.001, [1000.002, 1000.003, 1000.3, 1000.301], 1000.305))
+        self.assertDictEqual({'enqueued': 1.0, 'dequeued': 2.0, 'published': 3.0},
+                             stage_offsets(arrival, 1000.001, [1000.002, None, None, 1000.003], None))
+        self.assertDictEqual({'enqueued': 1.0}, stage_offsets(arrival, 1000.001, 'invalid', None))
+
+    def test_aggregate(self) -> None:
+        """
+        Records are summed up by function
+        """
+        summary = aggregate([
+            {'function': 'login:login', 'total': 300.0, 'timeout': False, 'stages': {'received': 300.0}},
+            {'function': 'login:login', 'total': 500.0, 'timeout': False, 'stages': {'received': 500.0}},
+            {'function': 'login:status', 'total': 2.0, 'timeout': True, 'stages': {'enqueued': 2.0}},
+        ])
+        self.assertEqual(2, summary['login:login']['count'])
+        self.assertEqual(400.0, summary['login:login']['mean'])
+        self.assertEqual(500.0, summary['login:login']['max'])
+        self.assertDictEqual({'received': 400.0}, summary['login:login']['stages'])
+        self.assertEqual(1, summary['login:status']['timeouts'])
+
+
+class SlowLogTest(TestCase):
+    """
+    Write slow calls to Redis
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(SlowLog)
+        SingletonMeta.delete(JSONCodec)
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Use a separate list, records are written by the test instead of the background writer
+        """
+        self.slowlog = SlowLog()
+        self.slowlog.KEY = 'PYTTS_SLOWLOG_TEST'
+        self.slowlog.size = 2
+        self.slowlog.clear()
+
+    def tearDown(self) -> None:
+        """
+        Remove the list
+        """
+        self.slowlog.clear()
+        self.slowlog.KEY = SlowLog.KEY
+
+    def test_threshold(self) -> None:
+        """
+        Only calls above the threshold and timeouts are recorded, the list is capped
+        """
+        arrival = time()
+        self.assertFalse(self.slowlog.record('login:status', 'a', 10, arrival, {'enqueued': 1.0, 'received': 5.0}))
+        self.assertTrue(self.slowlog.record('login:login', 'b', 10, arrival, {'enqueued': 1.0, 'received': 900.0}))
+        self.assertTrue(self.slowlog.record('login:status', 'c', 10, arrival, {'enqueued': 1.0}))
+        self.assertTrue(self.slowlog.record('login:status', 'd', 10, arrival, {'enqueued': 1.0}))
+        self.slowlog.flush()
+        entries = self.slowlog.entries()
+        self.assertListEqual(['d', 'c'], [entry['uuid'] for entry in entries])
+        self.assertTrue(entries[0]['timeout'])
@@ -0,0 +1,128 @@
+"""
+Test the user statistics
+"""
+
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from redis import ConnectionError as RedisConnectionError, StrictRedis
+
+from ...core.lib.stats import UserStatistics, parse, today
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+
+
+class StatisticsTest(TestCase):
+    """
+    Test turning the counters into statistics
+    """
+
+    def test_parse(self) -> None:
+        """
+        Counters from Redis become numbers, registrations are ordered by day
+        """
+        self.assertDictEqual({
+            'users': 5,
+            'enabled': 3,
+            'disabled': 2,
+            'registrations': {'2024-01-01': 2, '2024-01-02': 3},
+        }, parse({
+            b'users': b'5',
+            b'enabled': b'3',
+            b'registered:2024-01-02': b'3',
+            b'registered:2024-01-01': b'2',
+        }))
+
+    def test_parse_empty(self) -> None:
+        """
+        Missing counters are zero
+        """
+        self.assertDictEqual({'users': 0, 'enabled': 0, 'disabled': 0, 'registrations': {}}, parse({}))
+
+
+class UserStatisticsTest(TestCase):
+    """
+    Test the counters in Redis
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances of the Configuration File Finder
+        """
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Start without counters
+        """
+        SingletonMeta.delete(UserStatistics)
+        self.statistics = UserStatistics()
+        self.redis = StrictRedis(connection_pool=self.statistics.create_redis_connection_pool())
+        self.redis.delete(UserStatistics.KEY)
+
+    def tearDown(self) -> None:
+        """
+        Remove the counters and forget the singleton
+        """
+        self.redis.delete(UserStatistics.KEY)
+        SingletonMeta.delete(UserStatistics)
+
+    def test_increments(self) -> None:
+        """
+        Registrations count users of the day, enabling and disabling move the enabled users
+        """
+        self.statistics.registered()
+        self.statistics.registered()
+        self.statistics.enabled(2)
+        self.statistics.enabled(0)
+        self.statistics.enabled(-1)
+        self.assertDictEqual({
+            'users': 2,
+            'enabled': 1,
+            'disabled': 1,
+            'registrations': {today(): 2},
+        }, self.statistics.read())
+
+    def test_reconcile(self) -> None:
+        """
+        Reconciling replaces drifted counters with the users of the collection
+        """
+        self.statistics.enabled(7)
+        collection = Mock()
+        collection.find.return_value = [{
+            '_id': Mock(generation_time=datetime(2024, 1, day, 12, tzinfo=timezone.utc)),
+            'enabled': enabled,
+        } for day, enabled in ((1, True), (1, False), (2, True))]
+        with patch('tts.core.lib.stats.UserDatabaseConnectivity', Mock(return_value=Mock(collection=collection))):
+            expected = {
+                'users': 3,
+                'enabled': 2,
+                'disabled': 1,
+                'registrations': {'2024-01-01': 2, '2024-01-02': 1},
+            }
+            self.assertDictEqual(expected, self.statistics.reconcile())
+        self.assertDictEqual(expected, self.statistics.read())
+
+    def test_counting_never_fails(self) -> None:
+        """
+        Redis errors while counting are logged, the write of the user goes on
+        """
+        with patch('tts.core.lib.stats.redis.StrictRedis', Mock(side_effect=RedisConnectionError('connection lost'))):
+            with self.assertLogs('tts.stats', 'WARNING'):
+                self.statistics.registered()
+                self.statistics.enabled(1)
+
+    def test_without_configuration(self) -> None:
+        """
+        Without a ``stats`` section nothing is counted
+        """
+        SingletonMeta.delete(UserStatistics)
+        finder = Mock(return_value=Mock(find_as_json=Mock(return_value={'tts': {}})))
+        with patch('tts.core.lib.stats.ConfigurationFileFinder', finder):
+            statistics = UserStatistics()
+        statistics.registered()
+        statistics.enabled(1)
+        self.assertDictEqual(parse({}), statistics.read())
+        self.assertEqual({}, self.redis.hgetall(UserStatistics.KEY))
@@ -0,0 +1,98 @@
+"""
+Test the request tracing
+"""
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from ...util.codec import JSONCodec
+from ...util.config import ConfigurationFileFinder
+from ...util.singleton import SingletonMeta
+from ...util.tracing import NO_SPAN, Tracer
+
+
+class TracerTest(TestCase):
+    """
+    Create spans and export them to a file
+    """
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances
+        """
+        SingletonMeta.delete(JSONCodec)
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Create a tracer sampling every request
+        """
+        self.directory = mkdtemp()
+        self.file = path.join(self.directory, 'traces.jsonl')
+        self.tracer = Tracer()
+        self.tracer.configure({'exporter': 'file', 'file': self.file, 'sample_rate': 1.0, 'service': 'test'})
+
+    def tearDown(self) -> None:
+        """
+        Stop the tracer and remove the trace file
+        """
+        self.tracer.shutdown()
+        rmtree(self.directory)
+
+    def read(self) -> list:
+        """
+        Export the queued spans and read them
+
+        :return: Exported spans
+        :rtype: list
+        """
+        self.tracer.flush()
+        codec = JSONCodec()
+        with open(self.file, 'rb') as file_pointer:
+            return [codec.decode(line) for line in file_pointer]
+
+    def test_disabled(self) -> None:
+        """
+        Without configuration or sampling nothing is traced
+        """
+        self.assertIs(NO_SPAN, Tracer().start_trace('GET /'))
+        self.tracer.sample_rate = 0.0
+        self.assertIs(NO_SPAN, self.tracer.start_trace('GET /'))
+        self.assertIs(NO_SPAN, self.tracer.span('mongo find_one'))
+        self.assertIsNone(self.tracer.context())
+
+    def test_children(self) -> None:
+        """
+        Spans started within a span are its children
+        """
+        with self.tracer.start_trace('GET /api/v1.0/login/status') as root:
+            self.assertIs(root, self.tracer.current)
+            with self.tracer.span('queue dispatch') as child:
+                child.set('messages', 1)
+                self.assertEqual(child.context, self.tracer.context())
+            self.assertIs(root, self.tracer.current)
+        self.assertIsNone(self.tracer.current)
+        spans = {span['name']: span for span in self.read()}
+        self.assertEqual(root.trace_id, spans['queue dispatch']['trace_id'])
+        self.assertEqual(root.span_id, spans['queue dispatch']['parent_id'])
+        self.assertIsNone(spans['GET /api/v1.0/login/status']['parent_id'])
+        self.assertDictEqual({'messages': 1}, spans['queue dispatch']['attributes'])
+        self.assertEqual('test', spans['queue dispatch']['service'])
+
+    def test_continue(self) -> None:
+        """
+        A trace is continued from its context, invalid contexts are ignored
+        """
+        context = '0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331'
+        with self.assertRaises(KeyError):
+            with self.tracer.continue_trace(context, 'dispatch login:status'):
+                raise KeyError('username')
+        self.assertIs(NO_SPAN, self.tracer.continue_trace(None, 'dispatch'))
+        self.assertIs(NO_SPAN, self.tracer.continue_trace('invalid', 'dispatch'))
+        span = self.read()[0]
+        self.assertEqual('0af7651916cd43dd8448eb211c80319c', span['trace_id'])
+        self.assertEqual('b7ad6b7169203331', span['parent_id'])
+        self.assertEqual("KeyError: 'username'", span['error'])
@@ -0,0 +1,144 @@
+"""
+Test the tiers of the user cache
+"""
+
+from unittest import TestCase
+from unittest.mock import Mock
+
+from redis import StrictRedis
+
+from ...core.lib.db import UserCache
+from ...util.config import ConfigurationFileFinder
+from ...util.redis import RedisConfiguration
+from ...util.singleton import SingletonMeta
+
+
+class UserCacheTest(TestCase):
+    """
+    Test caching behaviour with a mocked users collection
+    """
+
+    USERS = {
+        'alice': {'username': 'Alice', 'username_lower': 'alice', 'enabled': True},
+    }
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Clean up singleton instances of the Configuration File Finder
+        """
+        SingletonMeta.delete(ConfigurationFileFinder)
+
+    def setUp(self) -> None:
+        """
+        Fresh cache for every test, importing the login builds the singleton with the real collection
+        """
+        SingletonMeta.delete(UserCache)
+        self.collection = Mock()
+        self.collection.find_one.side_effect = lambda query, projection: self.USERS.get(query['username_lower'])
+        self.cache = UserCache(self.collection)
+        self.cache.settings.shared = False
+
+    def tearDown(self) -> None:
+        """
+        Stop the listener and forget the singleton
+        """
+        self.cache.stop()
+        SingletonMeta.delete(UserCache)
+
+    def test_read_through(self) -> None:
+        """
+        Users are read once, case insensitive
+        """
+        for username in ('alice', 'Alice', 'ALICE'):
+            self.assertEqual('Alice', self.cache.get(username)['username'])
+        self.assertEqual(1, self.collection.find_one.call_count)
+        self.collection.find_one.assert_called_with({'username_lower': 'alice'}, projection={'_id': False})
+
+    def test_unknown_users_are_not_cached(self) -> None:
+        """
+        Unknown users are always looked up, so a new user is found at once
+        """
+        self.assertIsNone(self.cache.get('bob'))
+        self.assertIsNone(self.cache.get('bob'))
+        self.assertEqual(2, self.collection.find_one.call_count)
+
+    def test_returns_copies(self) -> None:
+        """
+        Changing a returned document does not change the cache
+        """
+        self.cache.get('alice')['enabled'] = False
+        self.assertTrue(self.cache.get('alice')['enabled'])
+
+    def test_invalidate_and_expiry(self) -> None:
+        """
+        Invalidated and expired users are read again
+        """
+        self.cache.get('alice')
+        self.cache.invalidate_local('alice')
+        self.cache.get('alice')
+        self.cache.invalidate_local(UserCache.FLUSH)
+        self.cache.get('alice')
+        self.assertEqual(3, self.collection.find_one.call_count)
+        self.cache.settings.ttl = 0
+        self.cache.invalidate_local('alice')
+        self.cache.get('alice')
+        self.cache.get('alice')
+        self.assertEqual(5, self.collection.find_one.call_count)
+
+    def test_kill_switch(self) -> None:
+        """
+        A disabled cache always asks MongoDB
+        """
+        self.cache.settings.enabled = False
+        self.cache.get('alice')
+        self.cache.get('alice')
+        self.assertEqual(2, self.collection.find_one.call_count)
+
+    def read_while_invalidated(self, query: dict, **_options) -> dict:
+        """
+        Read a user from the mocked collection, the first read is overtaken by an invalidation
+
+        :param dict query: Query of the user
+        :return: The user document
+        :rtype: dict
+        """
+        if self.collection.find_one.call_count == 1:
+            self.cache.invalidate(['alice'])
+        return self.USERS.get(query['username_lower'])
+
+    def test_invalidated_while_reading(self) -> None:
+        """
+        A user invalidated while it is read is not cached
+        """
+        self.collection.find_one.side_effect = self.read_while_invalidated
+        self.assertEqual('Alice', self.cache.get('alice')['username'])
+        self.cache.get('alice')
+        self.cache.get('alice')
+        self.assertEqual(2, self.collection.find_one.call_count)
+
+    def test_shared_invalidated_while_reading(self) -> None:
+        """
+        A user invalidated while it is read is not shared with the other processes
+        """
+        self.cache.settings.shared = True
+        self.cache.invalidate(['alice'])
+        connection = StrictRedis(connection_pool=RedisConfiguration(
+            ConfigurationFileFinder().find_as_json()['tts']['user_cache']
+        ).create_redis_connection_pool())
+        self.collection.find_one.side_effect = self.read_while_invalidated
+        self.cache.get('alice')
+        self.assertIsNone(connection.get(UserCache.key('alice')))
+        self.cache.get('alice')
+        self.assertIsNotNone(connection.get(UserCache.key('alice')))
+        self.cache.invalidate(['alice'])
+        self.assertIsNone(connection.get(UserCache.key('alice')))
+
+    def test_change_streams_not_available(self) -> None:
+        """
+        Without change streams in pymongo or MongoDB the watcher logs and ends
+        """
+        SingletonMeta.delete(UserCache)
+        self.cache = UserCache(Mock(spec=['find_one']))
+        with self.assertLogs('tts.cache', 'WARNING'):
+            self.cache._UserCache__watch()  # pylint: disable=protected-access
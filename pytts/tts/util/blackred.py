@@ -0,0 +1,220 @@
+"""
+Local cache in front of BlackRed
+"""
+
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from blackred import BlackRed
+import redis
+
+from .config import ConfigurationFileFinder
+from .metrics import REGISTRY
+from .redis import RedisConfiguration
+
+
+LOG = getLogger('tts.cache')
+RECONNECT_DELAY = 1.0
+CACHE_LOOKUPS = REGISTRY.counter('tts_blackred_cache_lookups_total', 'Lookups in the BlackRed cache', ('result',))
+CACHE_ENTRIES = REGISTRY.gauge('tts_blackred_cache_entries', 'Entries in the BlackRed cache')
+
+
+class CachedBlackRedSettings(object):
+    """
+    Settings of the BlackRed cache from the ``blackred`` section of the configuration file
+    """
+
+    def __init__(self):
+        """
+        Load the settings, without a ``blackred`` section nothing is broadcast
+        """
+        self.enabled = True
+        self.blocked_ttl = 10.0
+        self.allowed_ttl = 2.0
+        self.size = 10000
+        self.connection_pool = None
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'blackred' not in config:
+            return
+        self.connection_pool = RedisConfiguration(config['blackred']).create_redis_connection_pool()
+        if 'cache' not in config['blackred']:
+            return
+        cache_config = config['blackred']['cache']
+        if 'enabled' in cache_config:
+            self.enabled = bool(cache_config['enabled'])
+        if 'blocked_ttl' in cache_config:
+            self.blocked_ttl = cache_config['blocked_ttl']
+        if 'allowed_ttl' in cache_config:
+            self.allowed_ttl = cache_config['allowed_ttl']
+        if 'size' in cache_config:
+            self.size = cache_config['size']
+
+
+class CachedBlackRed(object):
+    """
+    Keep the results of ``BlackRed.is_blocked`` for a short time in process, for blocked and for known good items.
+
+    Changes are broadcast via Redis Publish/Subscribe, so every process drops its cached entry for an item as soon as
+    it is blocked or unblocked. If a broadcast gets lost, the cached entry still expires after its time to live.
+    Every invalidation counts up a generation of the item, the result of a miss is only cached when the generation did
+    not change while BlackRed was asked.
+    """
+
+    INVALIDATION_CHANNEL = 'PYTTS_BLACKRED_INVALIDATION'
+    FLUSH = '*'
+
+    def __init__(self, blackred: BlackRed=None):
+        """
+        Configure the cache from the ``blackred`` section of the configuration file
+
+        :param BlackRed blackred: The BlackRed instance to ask on a cache miss
+        """
+        self.__blackred = blackred if blackred is not None else BlackRed()
+        self.__cache = OrderedDict()
+        self.__generations = {}
+        self.__flushes = 0
+        self.__lock = Lock()
+        self.__listener = None
+        self.__should_run = True
+        self.__hits = 0
+        self.__misses = 0
+        self.settings = CachedBlackRedSettings()
+
+    def __start_listener(self) -> None:
+        """
+        Start listening for invalidations, if not already done
+        """
+        if self.__listener is not None or self.settings.connection_pool is None:
+            return
+        with self.__lock:
+            if self.__listener is not None:
+                return
+            self.__listener = Thread(target=self.__listen, daemon=True)
+            self.__listener.start()
+
+    def __listen(self) -> None:
+        """
+        Wait for invalidation messages on the pubsub channel. When Redis fails, invalidations may be missed, so the
+        cache is flushed and the channel subscribed again.
+        """
+        failed = False
+        while self.__should_run:
+            pubsub = redis.StrictRedis(connection_pool=self.settings.connection_pool).pubsub()
+            try:
+                pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                if failed:
+                    self.invalidate(self.FLUSH)
+                while self.__should_run:
+                    message = pubsub.get_message(ignore_subscribe_messages=True, timeout=.125)
+                    if message and message['type'] == 'message':
+                        self.invalidate(message['data'].decode('utf-8'))
+                pubsub.unsubscribe(self.INVALIDATION_CHANNEL)
+            except redis.RedisError:
+                LOG.warning('listening for BlackRed invalidations failed, subscribing again', exc_info=True)
+                failed = True
+                self.invalidate(self.FLUSH)
+                sleep(RECONNECT_DELAY)
+            finally:
+                pubsub.close()
+
+    def __broadcast(self, item: str) -> None:
+        """
+        Tell all processes to forget about an item
+
+        :param str item: The item or ``FLUSH``
+        """
+        self.invalidate(item)
+        if self.settings.connection_pool is None:
+            return
+        redis.StrictRedis(connection_pool=self.settings.connection_pool).publish(self.INVALIDATION_CHANNEL, item)
+
+    def invalidate(self, item: str) -> None:
+        """
+        Drop an item from the local cache
+
+        :param str item: The item to drop or ``FLUSH`` to drop everything
+        """
+        with self.__lock:
+            if item == self.FLUSH or len(self.__generations) >= self.settings.size:
+                # forgetting the generations counts as a flush for the reads in progress
+                self.__flushes += 1
+                self.__generations.clear()
+            if item == self.FLUSH:
+                self.__cache.clear()
+            else:
+                self.__generations[item] = self.__generations.get(item, 0) + 1
+                self.__cache.pop(item, None)
+
+    def is_blocked(self, item: str) -> bool:
+        """
+        Check if an item is blocked, use the local cache whenever possible
+
+        :param str item: The item to check, e.g. an IP address
+        :return: ``True`` when blocked
+        :rtype: bool
+        """
+        if not self.settings.enabled:
+            return self.__blackred.is_blocked(item)
+        self.__start_listener()
+        now = monotonic()
+        with self.__lock:
+            entry = self.__cache.get(item)
+            if entry is not None and entry[1] > now:
+                self.__hits += 1
+                self.__cache.move_to_end(item)
+                CACHE_LOOKUPS.inc(labels=('hit',))
+                return entry[0]
+            self.__misses += 1
+            generation = (self.__flushes, self.__generations.get(item, 0))
+        CACHE_LOOKUPS.inc(labels=('miss',))
+        blocked = bool(self.__blackred.is_blocked(item))
+        with self.__lock:
+            if (self.__flushes, self.__generations.get(item, 0)) != generation:
+                return blocked
+            self.__cache[item] = (blocked, now + (self.settings.blocked_ttl if blocked else self.settings.allowed_ttl))
+            self.__cache.move_to_end(item)
+            while len(self.__cache) > self.settings.size:
+                self.__cache.popitem(last=False)
+            CACHE_ENTRIES.set(len(self.__cache))
+        return blocked
+
+    def log_fail(self, item: str) -> None:
+        """
+        Log a failure for an item, which may block it
+
+        :param str item: The item that failed
+        """
+        self.__blackred.log_fail(item)
+        self.__broadcast(item)
+
+    def unblock(self, item: str) -> None:
+        """
+        Unblock an item
+
+        :param str item: The item to unblock
+        """
+        self.__blackred.unblock(item)
+        self.__broadcast(item)
+
+    def stop(self) -> None:
+        """
+        Stop listening for invalidations
+        """
+        self.__should_run = False
+
+    @property
+    def statistics(self) -> dict:
+        """
+        Cache hit and miss counters
+
+        :return: Dictionary with ``hits``, ``misses`` and ``entries``
+        :rtype: dict
+        """
+        with self.__lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'entries': len(self.__cache),
+            }
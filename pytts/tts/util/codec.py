@@ -0,0 +1,176 @@
+"""
+JSON encoding and decoding with an optional accelerated backend
+"""
+
+from collections import OrderedDict
+import json
+
+from .config import ConfigurationFileFinder
+from .singleton import SingletonMeta
+
+
+class StandardBackend(object):
+    """
+    JSON from the standard library, always available
+    """
+
+    name = 'json'
+
+    @staticmethod
+    def encode(data) -> bytes:
+        """
+        Encode compact JSON
+
+        :param data: Data to encode
+        :return: UTF-8 encoded JSON
+        :rtype: bytes
+        """
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    @staticmethod
+    def decode(data):
+        """
+        Decode JSON
+
+        :param data: UTF-8 encoded JSON (``bytes``) or ``str``
+        :return: Decoded data
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode('utf-8')
+        return json.loads(data)
+
+
+class UJSONBackend(object):
+    """
+    JSON with ``ujson``, when installed
+    """
+
+    name = 'ujson'
+
+    def __init__(self):
+        """
+        Import the module
+
+        :raises ImportError: When ``ujson`` is not installed
+        """
+        import ujson
+        self.__ujson = ujson
+
+    def encode(self, data) -> bytes:
+        """
+        Encode compact JSON
+
+        :param data: Data to encode
+        :return: UTF-8 encoded JSON
+        :rtype: bytes
+        """
+        return self.__ujson.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data):
+        """
+        Decode JSON
+
+        :param data: UTF-8 encoded JSON (``bytes``) or ``str``
+        :return: Decoded data
+        """
+        if isinstance(data, (bytearray, memoryview)):
+            data = bytes(data)
+        return self.__ujson.loads(data)
+
+
+class ORJSONBackend(object):
+    """
+    JSON with ``orjson``, when installed
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        """
+        Import the module
+
+        :raises ImportError: When ``orjson`` is not installed
+        """
+        import orjson
+        self.__orjson = orjson
+
+    def encode(self, data) -> bytes:
+        """
+        Encode compact JSON
+
+        :param data: Data to encode
+        :return: UTF-8 encoded JSON
+        :rtype: bytes
+        """
+        return self.__orjson.dumps(data)
+
+    def decode(self, data):
+        """
+        Decode JSON
+
+        :param data: UTF-8 encoded JSON (``bytes``) or ``str``
+        :return: Decoded data
+        """
+        return self.__orjson.loads(data)
+
+
+BACKENDS = OrderedDict([
+    (ORJSONBackend.name, ORJSONBackend),
+    (UJSONBackend.name, UJSONBackend),
+    (StandardBackend.name, StandardBackend),
+])
+
+
+def available_backends() -> list:
+    """
+    Create an instance of every backend that can be used here
+
+    :return: Backend instances, fastest first
+    :rtype: list
+    """
+    backends = []
+    for backend in BACKENDS.values():
+        try:
+            backends.append(backend())
+        except ImportError:
+            continue
+    return backends
+
+
+class JSONCodec(object, metaclass=SingletonMeta):
+    """
+    The codec for everything that goes over HTTP or through the queues. It always emits compact UTF-8 encoded JSON.
+
+    The backend is chosen by the ``codec`` setting in the configuration file: ``auto`` (default) uses the fastest
+    installed backend, ``json``, ``ujson`` or ``orjson`` force a backend.
+    """
+
+    def __init__(self, backend: str=None):
+        """
+        Choose the backend
+
+        :param str backend: Name of the backend, read from the configuration when not given
+        :raises ValueError: When the backend is unknown
+        :raises ImportError: When the backend is not installed
+        """
+        if backend is None:
+            config = ConfigurationFileFinder().find_as_json()['tts']
+            backend = config['codec'] if 'codec' in config else 'auto'
+        if backend == 'auto':
+            self.__backend = available_backends()[0]
+        elif backend in BACKENDS:
+            self.__backend = BACKENDS[backend]()
+        else:
+            raise ValueError('Unknown JSON backend: {:s}'.format(backend))
+        self.encode = self.__backend.encode
+        self.decode = self.__backend.decode
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the backend in use
+
+        :return: Backend name
+        :rtype: str
+        """
+        return self.__backend.name
@@ -0,0 +1,201 @@
+"""
+Structured logging that keeps the request and dispatch paths free of I/O
+
+Records are formatted as JSON lines. The handlers of the ``tts`` loggers only put records into a bounded queue, a
+``QueueListener`` writes them in the background. When the queue is full, records are dropped and counted. Every
+category, the last part of the logger name, can be sampled; warnings and errors are always kept.
+"""
+
+from logging import Filter, Formatter, LogRecord, StreamHandler, FileHandler, getLogger, makeLogRecord, WARNING
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from random import random
+import sys
+
+from .codec import JSONCodec
+from .config import ConfigurationFileFinder
+from .metrics import REGISTRY
+
+
+ROOT = 'tts'
+DROPPED = REGISTRY.counter('tts_log_dropped_total', 'Log records dropped because the log queue was full', ('category',))
+RESERVED = frozenset(vars(makeLogRecord({})).keys()) | {'message', 'asctime'}
+
+
+def category_of(record: LogRecord) -> str:
+    """
+    Get the category of a record
+
+    :param LogRecord record: The record
+    :return: Last part of the logger name
+    :rtype: str
+    """
+    return record.name.rpartition('.')[2]
+
+
+class JSONFormatter(Formatter):
+    """
+    Format records as JSON objects with the fields given as ``extra``
+    """
+
+    def __init__(self):
+        """
+        Create the formatter
+        """
+        super(JSONFormatter, self).__init__()
+        self.__codec = JSONCodec()
+
+    def format(self, record: LogRecord) -> str:
+        """
+        Format a record
+
+        :param LogRecord record: The record
+        :return: One line of JSON
+        :rtype: str
+        """
+        data = {
+            'time': record.created,
+            'level': record.levelname,
+            'category': category_of(record),
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED:
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        return self.__codec.encode(data).decode('utf-8')
+
+
+class SamplingFilter(Filter):
+    """
+    Keep only a share of the records of a category below ``WARNING``
+    """
+
+    def __init__(self, rates: dict):
+        """
+        Configure the rates
+
+        :param dict rates: Share of the records to keep by category, categories not given are kept completely
+        """
+        super(SamplingFilter, self).__init__()
+        self.rates = rates
+
+    def filter(self, record: LogRecord) -> bool:
+        """
+        Decide whether the record is kept
+
+        :param LogRecord record: The record
+        :return: ``True``, when the record is kept
+        :rtype: bool
+        """
+        if record.levelno >= WARNING:
+            return True
+        category = category_of(record)
+        return category not in self.rates or random() < self.rates[category]
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Queue handler that drops records instead of blocking, when the queue is full
+    """
+
+    def __init__(self, queue: Queue):
+        """
+        Create the handler
+
+        :param Queue queue: The bounded queue
+        """
+        super(BoundedQueueHandler, self).__init__(queue)
+        self.dropped = 0
+        self.__formatter = Formatter()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """
+        Merge the arguments into the message and render the exception, so the record can be written later
+
+        :param LogRecord record: The record
+        :return: The prepared record
+        :rtype: LogRecord
+        """
+        if record.exc_info:
+            record.exc_text = self.__formatter.formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        """
+        Put a record into the queue or drop it
+
+        :param LogRecord record: The prepared record
+        """
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+            DROPPED.inc(labels=(category_of(record),))
+
+
+class LogService(object):
+    """
+    Write the records of the ``tts`` loggers in the background
+    """
+
+    def __init__(self):
+        """
+        Configure the service from the ``logging`` section of the configuration file
+        """
+        self.level = 'INFO'
+        self.file = None
+        self.queue_size = 10000
+        self.rates = {}
+        self.__listener = None
+        self.__handler = None
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'logging' not in config:
+            return
+        logging_config = config['logging']
+        if 'level' in logging_config:
+            self.level = logging_config['level']
+        if 'file' in logging_config:
+            self.file = logging_config['file']
+        if 'queue_size' in logging_config:
+            self.queue_size = logging_config['queue_size']
+        if 'sampling' in logging_config:
+            self.rates = dict(logging_config['sampling'])
+
+    def start(self) -> None:
+        """
+        Attach the queue handler to the ``tts`` logger and start writing
+        """
+        if self.__listener is not None:
+            return
+        target = FileHandler(self.file, encoding='utf-8') if self.file else StreamHandler(sys.stderr)
+        target.setFormatter(JSONFormatter())
+        queue = Queue(self.queue_size)
+        self.__handler = BoundedQueueHandler(queue)
+        self.__handler.addFilter(SamplingFilter(self.rates))
+        logger = getLogger(ROOT)
+        logger.setLevel(self.level)
+        logger.addHandler(self.__handler)
+        logger.propagate = False
+        self.__listener = QueueListener(queue, target)
+        self.__listener.start()
+
+    def stop(self) -> None:
+        """
+        Write the remaining records and detach from the ``tts`` logger
+        """
+        if self.__listener is None:
+            return
+        getLogger(ROOT).removeHandler(self.__handler)
+        getLogger(ROOT).propagate = True
+        self.__listener.stop()
+        for handler in self.__listener.handlers:
+            handler.close()
+        self.__listener = None
+        self.__handler = None
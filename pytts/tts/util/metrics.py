@@ -0,0 +1,509 @@
+"""
+Counters, gauges and histograms in the Prometheus text exposition format
+
+Every process records into its own registry. The processes publish snapshots of their registries to Redis, the
+exporter sums up the snapshots of all live processes and serves them on a separate port.
+"""
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import getpid
+from socket import gethostname
+from threading import Lock, Thread, Event
+from time import perf_counter, time
+
+import redis
+
+from .codec import JSONCodec
+from .config import ConfigurationFileFinder
+from .redis import RedisConfiguration
+
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 25.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Timer(object):
+    """
+    Observe the duration of a ``with`` block in a histogram
+    """
+
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: 'Histogram', labels: tuple):
+        """
+        Prepare the timer
+
+        :param Histogram histogram: Histogram to observe the duration in
+        :param tuple labels: Label values
+        """
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self) -> 'Timer':
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *dummy) -> None:
+        self.histogram.observe(perf_counter() - self.start, self.labels)
+
+
+class Metric(object):
+    """
+    Base class of all metrics: a value per combination of label values
+    """
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labels: tuple=()):
+        """
+        Create the metric
+
+        :param str name: Name of the metric
+        :param str documentation: Help text
+        :param tuple labels: Names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = Lock()
+
+    def snapshot(self) -> dict:
+        """
+        Copy the current values
+
+        :return: Dictionary that can be encoded as JSON
+        :rtype: dict
+        """
+        with self.lock:
+            values = [list(labels) + [value] for labels, value in self.values.items()]
+        return {
+            'type': self.kind,
+            'help': self.documentation,
+            'labels': list(self.labels),
+            'values': values,
+        }
+
+
+class Counter(Metric):
+    """
+    A value that only goes up
+    """
+
+    kind = 'counter'
+
+    def inc(self, amount: float=1, labels: tuple=()) -> None:
+        """
+        Increase the counter
+
+        :param float amount: Amount to add
+        :param tuple labels: Label values
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down
+    """
+
+    kind = 'gauge'
+
+    def set(self, value: float, labels: tuple=()) -> None:
+        """
+        Set the gauge
+
+        :param float value: New value
+        :param tuple labels: Label values
+        """
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, amount: float=1, labels: tuple=()) -> None:
+        """
+        Increase the gauge
+
+        :param float amount: Amount to add, may be negative
+        :param tuple labels: Label values
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in buckets
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple=(), buckets: tuple=DEFAULT_BUCKETS):
+        """
+        Create the histogram
+
+        :param str name: Name of the metric
+        :param str documentation: Help text
+        :param tuple labels: Names of the labels
+        :param tuple buckets: Upper bounds of the buckets, in ascending order
+        """
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: tuple=()) -> None:
+        """
+        Observe a value
+
+        :param float value: The value
+        :param tuple labels: Label values
+        """
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, labels: tuple=()) -> Timer:
+        """
+        Observe the duration of a ``with`` block
+
+        :param tuple labels: Label values
+        :return: Context manager
+        :rtype: Timer
+        """
+        return Timer(self, labels)
+
+    def snapshot(self) -> dict:
+        """
+        Copy the bucket counts and sums
+
+        :return: Dictionary that can be encoded as JSON
+        :rtype: dict
+        """
+        with self.lock:
+            values = [list(labels) + [list(entry[0]), entry[1]] for labels, entry in self.values.items()]
+        return {
+            'type': self.kind,
+            'help': self.documentation,
+            'labels': list(self.labels),
+            'buckets': list(self.buckets),
+            'values': values,
+        }
+
+
+class MetricsRegistry(object):
+    """
+    All metrics of a process, and collectors that update gauges right before a snapshot is taken
+    """
+
+    def __init__(self):
+        """
+        Create an empty registry
+        """
+        self.metrics = {}
+        self.collectors = {}
+        self.__lock = Lock()
+
+    def __register(self, kind: type, name: str, *args) -> Metric:
+        """
+        Get a metric, create it on first use
+
+        :param type kind: Class of the metric
+        :param str name: Name of the metric
+        :param args: Further arguments of the class
+        :return: The metric
+        :rtype: Metric
+        :raises ValueError: When the name is already used by a metric of another type
+        """
+        with self.__lock:
+            if name not in self.metrics:
+                self.metrics[name] = kind(name, *args)
+            if not isinstance(self.metrics[name], kind):
+                raise ValueError('Metric {:s} is already registered as {:s}'.format(name, self.metrics[name].kind))
+            return self.metrics[name]
+
+    def counter(self, name: str, documentation: str, labels: tuple=()) -> Counter:
+        """
+        Get a counter
+
+        :param str name: Name of the metric
+        :param str documentation: Help text
+        :param tuple labels: Names of the labels
+        :return: The counter
+        :rtype: Counter
+        """
+        return self.__register(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: tuple=()) -> Gauge:
+        """
+        Get a gauge
+
+        :param str name: Name of the metric
+        :param str documentation: Help text
+        :param tuple labels: Names of the labels
+        :return: The gauge
+        :rtype: Gauge
+        """
+        return self.__register(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: tuple=(), buckets: tuple=DEFAULT_BUCKETS) -> Histogram:
+        """
+        Get a histogram
+
+        :param str name: Name of the metric
+        :param str documentation: Help text
+        :param tuple labels: Names of the labels
+        :param tuple buckets: Upper bounds of the buckets
+        :return: The histogram
+        :rtype: Histogram
+        """
+        return self.__register(Histogram, name, documentation, labels, buckets)
+
+    def register_collector(self, name: str, collector) -> None:
+        """
+        Register a function that updates metrics before each snapshot, replacing one with the same name
+
+        :param str name: Name of the collector
+        :param collector: Function without arguments
+        """
+        self.collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        """
+        Run the collectors and copy all metrics
+
+        :return: Dictionary of metric snapshots by name
+        :rtype: dict
+        """
+        for collector in list(self.collectors.values()):
+            collector()
+        with self.__lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+BACKEND_SECONDS = REGISTRY.histogram('tts_backend_seconds', 'Duration of MongoDB and Redis calls',
+                                     ('backend', 'operation'))
+
+
+def merge_snapshots(snapshots: list) -> dict:
+    """
+    Sum up the snapshots of several processes
+
+    :param list snapshots: Registry snapshots
+    :return: A single registry snapshot
+    :rtype: dict
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            if name not in merged:
+                merged[name] = dict(metric, values={})
+            values = merged[name]['values']
+            width = len(metric['labels'])
+            for value in metric['values']:
+                labels = tuple(value[:width])
+                if metric['type'] != 'histogram':
+                    values[labels] = values.get(labels, 0) + value[width]
+                elif labels not in values:
+                    values[labels] = [list(value[width]), value[width + 1]]
+                else:
+                    values[labels] = [[left + right for left, right in zip(values[labels][0], value[width])],
+                                      values[labels][1] + value[width + 1]]
+    for metric in merged.values():
+        metric['values'] = [list(labels) + (value if metric['type'] == 'histogram' else [value])
+                            for labels, value in metric['values'].items()]
+    return merged
+
+
+def format_labels(names: list, values: list) -> str:
+    """
+    Format a label set
+
+    :param list names: Names of the labels
+    :param list values: Values of the labels
+    :return: ``{name="value",...}`` or an empty string
+    :rtype: str
+    """
+    if not names:
+        return ''
+    return '{' + ','.join('{:s}="{:s}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')) for name, value in zip(names, values)) + '}'
+
+
+def format_value(value: float) -> str:
+    """
+    Format a sample value
+
+    :param float value: The value
+    :return: The value as text
+    :rtype: str
+    """
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def exposition(snapshot: dict) -> str:
+    """
+    Write a registry snapshot in the text exposition format
+
+    :param dict snapshot: Registry snapshot
+    :return: Text for the ``/metrics`` endpoint
+    :rtype: str
+    """
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append('# HELP {:s} {:s}'.format(name, metric['help']))
+        lines.append('# TYPE {:s} {:s}'.format(name, metric['type']))
+        names = metric['labels']
+        for value in sorted(metric['values'], key=lambda item: [str(label) for label in item[:len(names)]]):
+            labels = value[:len(names)]
+            if metric['type'] != 'histogram':
+                lines.append('{:s}{:s} {:s}'.format(name, format_labels(names, labels), format_value(value[-1])))
+                continue
+            counts, total = value[len(names)], value[len(names) + 1]
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + ['+Inf'], counts):
+                cumulative += count
+                lines.append('{:s}_bucket{:s} {:d}'.format(
+                    name, format_labels(names + ['le'], labels + [bound if bound == '+Inf' else repr(float(bound))]),
+                    cumulative
+                ))
+            lines.append('{:s}_sum{:s} {:s}'.format(name, format_labels(names, labels), format_value(total)))
+            lines.append('{:s}_count{:s} {:d}'.format(name, format_labels(names, labels), cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsService(object):
+    """
+    Publish the snapshots of this process to Redis and serve the sum of all processes on the metrics port. When
+    another process already serves the port, this one only publishes.
+    """
+
+    SNAPSHOTS = 'PYTTS_METRICS'
+
+    def __init__(self, registry: MetricsRegistry=REGISTRY):
+        """
+        Configure the service from the ``metrics`` section of the configuration file
+
+        :param MetricsRegistry registry: The registry of this process
+        """
+        self.registry = registry
+        self.process = '{:s}:{:d}'.format(gethostname(), getpid())
+        self.bind_ip = '127.0.0.1'
+        self.bind_port = 9180
+        self.interval = 5.0
+        self.__codec = JSONCodec()
+        self.__stopped = Event()
+        self.__server = None
+        self.__connection_pool = None
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'metrics' not in config:
+            return
+        metrics_config = config['metrics']
+        if 'bind_ip' in metrics_config:
+            self.bind_ip = metrics_config['bind_ip']
+        if 'bind_port' in metrics_config:
+            self.bind_port = metrics_config['bind_port']
+        if 'interval' in metrics_config:
+            self.interval = metrics_config['interval']
+        if ('host' in metrics_config and metrics_config['host'] is not None) \
+                or ('socket' in metrics_config and metrics_config['socket'] is not None):
+            self.__connection_pool = RedisConfiguration(metrics_config).create_redis_connection_pool()
+
+    def publish(self) -> None:
+        """
+        Store the snapshot of this process in Redis
+        """
+        if self.__connection_pool is None:
+            return
+        connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+        connection.hset(self.SNAPSHOTS, self.process, self.__codec.encode({
+            'time': time(),
+            'metrics': self.registry.snapshot(),
+        }))
+
+    def collect(self) -> dict:
+        """
+        Sum up the snapshots of all live processes, drop the ones of processes that stopped publishing
+
+        :return: Registry snapshot
+        :rtype: dict
+        """
+        if self.__connection_pool is None:
+            return self.registry.snapshot()
+        self.publish()
+        connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+        snapshots = []
+        for process, snapshot in connection.hgetall(self.SNAPSHOTS).items():
+            snapshot = self.__codec.decode(snapshot)
+            if snapshot['time'] < time() - 3 * self.interval:
+                connection.hdel(self.SNAPSHOTS, process)
+                continue
+            snapshots.append(snapshot['metrics'])
+        return merge_snapshots(snapshots)
+
+    def __publisher(self) -> None:
+        """
+        Publish the snapshots until stopped
+        """
+        while not self.__stopped.wait(self.interval):
+            try:
+                self.publish()
+            except redis.RedisError:
+                continue
+
+    def start(self) -> None:
+        """
+        Start publishing and try to serve the metrics port
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """
+            Serve ``/metrics``
+            """
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """
+                Answer a scrape
+                """
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exposition(service.collect()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *dummy):
+                """
+                Do not log scrapes
+                """
+
+        Thread(target=self.__publisher, daemon=True).start()
+        try:
+            self.__server = HTTPServer((self.bind_ip, self.bind_port), Handler)
+        except OSError:
+            self.__server = None
+            return
+        Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """
+        Stop publishing and serving
+        """
+        self.__stopped.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
@@ -0,0 +1,235 @@
+"""
+Profile the live server on demand
+
+* ``StackSampler`` samples the stacks of all threads in a fixed interval and counts them as collapsed stacks, the
+  input format of ``flamegraph.pl`` and speedscope
+* ``HeapProfiler`` compares ``tracemalloc`` snapshots and reports the allocations that grew the most
+
+Both write their results as files into the configured directory.
+"""
+
+from collections import Counter
+from os import getpid, path
+import sys
+from tempfile import gettempdir
+from threading import Lock, Thread, current_thread, enumerate as enumerate_threads
+from time import perf_counter, sleep, strftime
+import tracemalloc
+
+from .config import ConfigurationFileFinder
+
+
+PROFILE_RESULT = 'PYTTS_PROFILE_RESULT'
+
+
+def collapse(frame, thread_name: str) -> str:
+    """
+    Collapse a stack into one line, from the thread down to the innermost frame
+
+    :param frame: Innermost frame of the stack
+    :param str thread_name: Name of the thread
+    :return: Frames separated by ``;``
+    :rtype: str
+    """
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append('{:s} ({:s}:{:d})'.format(code.co_name, path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ';'.join(reversed(frames))
+
+
+class StackSampler(object):
+    """
+    Sampling profiler for all threads of the process. Only the stacks are read, the profiled code runs unchanged.
+    """
+
+    def __init__(self, interval: float=0.01):
+        """
+        Configure the sampler
+
+        :param float interval: Seconds between two samples
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def sample(self) -> None:
+        """
+        Take one sample of every thread but the sampling one
+        """
+        names = {thread.ident: thread.name for thread in enumerate_threads()}
+        own = current_thread().ident
+        for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if ident == own:
+                continue
+            self.stacks[collapse(frame, names[ident] if ident in names else str(ident))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> Counter:
+        """
+        Sample for some time
+
+        :param float seconds: Duration of the profile
+        :return: Number of samples by collapsed stack
+        :rtype: Counter
+        """
+        end = perf_counter() + seconds
+        while perf_counter() < end:
+            self.sample()
+            sleep(self.interval)
+        return self.stacks
+
+    def write(self, file: str) -> None:
+        """
+        Write the collapsed stacks, one stack and its count per line
+
+        :param str file: Path of the file
+        """
+        with open(file, 'w', encoding='utf-8') as file_pointer:
+            for stack, count in self.stacks.most_common():
+                file_pointer.write('{:s} {:d}\n'.format(stack, count))
+
+
+class HeapProfiler(object):
+    """
+    Report the growth of allocations between snapshots. Tracing allocations starts with the first snapshot.
+    """
+
+    def __init__(self, frames: int=10, top: int=50):
+        """
+        Configure the profiler
+
+        :param int frames: Frames stored for every allocation
+        :param int top: Number of allocation sites in a report
+        """
+        self.frames = frames
+        self.top = top
+        self.baseline = None
+
+    def snapshot(self) -> list:
+        """
+        Take a snapshot and compare it with the previous one
+
+        :return: Statistics of the allocation sites that grew the most, empty on the first snapshot
+        :rtype: list
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        previous, self.baseline = self.baseline, snapshot
+        if previous is None:
+            return []
+        return snapshot.compare_to(previous, 'lineno')[:self.top]
+
+    def stop(self) -> None:
+        """
+        Stop tracing allocations and forget the baseline
+        """
+        self.baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def write(statistics: list, file: str) -> None:
+        """
+        Write a report of the allocation sites
+
+        :param list statistics: Statistics as returned by ``snapshot``
+        :param str file: Path of the file
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        with open(file, 'w', encoding='utf-8') as file_pointer:
+            file_pointer.write('traced memory: {:d} bytes, peak {:d} bytes\n'.format(current, peak))
+            for statistic in statistics:
+                file_pointer.write('{!s}\n'.format(statistic))
+
+
+class Profiler(object):
+    """
+    Run the profiles requested through the command queue, one at a time
+    """
+
+    def __init__(self):
+        """
+        Configure the profiler from the ``profiling`` section of the configuration file
+        """
+        self.directory = gettempdir()
+        self.interval = 0.01
+        self.max_seconds = 300.0
+        self.heap = HeapProfiler()
+        self.__lock = Lock()
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'profiling' not in config:
+            return
+        profiling_config = config['profiling']
+        if 'directory' in profiling_config and profiling_config['directory'] is not None:
+            self.directory = profiling_config['directory']
+        if 'interval' in profiling_config:
+            self.interval = profiling_config['interval']
+        if 'max_seconds' in profiling_config:
+            self.max_seconds = profiling_config['max_seconds']
+        if 'top' in profiling_config:
+            self.heap.top = profiling_config['top']
+
+    def file(self, kind: str, extension: str) -> str:
+        """
+        Build the path of a result file
+
+        :param str kind: Kind of the profile
+        :param str extension: File extension
+        :return: Path within the result directory
+        :rtype: str
+        """
+        return path.join(self.directory, 'pytts-{:s}-{:d}-{:s}.{:s}'.format(
+            kind, getpid(), strftime('%Y%m%d-%H%M%S'), extension
+        ))
+
+    def profile(self, seconds: float, callback=None) -> bool:
+        """
+        Sample the stacks in the background and write them as collapsed stacks
+
+        :param float seconds: Duration of the profile, limited to ``max_seconds``
+        :param callback: Called with the path of the result file
+        :return: ``False``, when a profile is already running
+        :rtype: bool
+        """
+        if not self.__lock.acquire(blocking=False):
+            return False
+        seconds = min(max(seconds, self.interval), self.max_seconds)
+
+        def run():
+            """
+            Sample, write and report the result
+            """
+            try:
+                sampler = StackSampler(self.interval)
+                sampler.run(seconds)
+                file = self.file('profile', 'collapsed')
+                sampler.write(file)
+            finally:
+                self.__lock.release()
+            if callback is not None:
+                callback(file)
+
+        Thread(target=run, name='pytts-profiler', daemon=True).start()
+        return True
+
+    def heap_snapshot(self) -> str:
+        """
+        Take a heap snapshot and write the growth since the previous one
+
+        :return: Path of the report, ``None`` on the first snapshot
+        :rtype: str
+        """
+        first = self.heap.baseline is None
+        statistics = self.heap.snapshot()
+        if first:
+            return None
+        file = self.file('heap', 'txt')
+        self.heap.write(statistics, file)
+        return file
@@ -0,0 +1,233 @@
+"""
+Envelopes of the messages in the API queue and their replies
+
+There are two formats, both can be read at any time:
+
+* JSON: a JSON object with the keys ``_`` (function), ``_uuid``, ``_time`` (creation time), ``data`` and optionally
+  ``_trace`` (trace context)
+* Binary: a fixed header followed by the payload encoded with the codec. The header consists of a magic byte, the
+  format version, flags, the 16 bytes of the UUID, the deadline as double and the function id from a function table.
+  With the ``FLAG_TRACE`` flag, the 16 bytes of the trace id and the 8 bytes of the parent span id follow the header.
+  Replies carry the same header as their request, without flags.
+
+Every change of the binary layout, e.g. a new flag, increases ``VERSION``. Consumers read all ``READABLE_VERSIONS``
+and refuse newer messages instead of misreading them; version 1 had no flags, its flag byte is ignored.
+
+The binary format starts with a byte that can never start a JSON text, so a consumer can tell the formats apart.
+When rolling out, update the consumers first and switch the producers to the binary format afterwards.
+"""
+
+from struct import Struct, error as StructError
+from time import time
+from uuid import UUID
+
+from ..codec import JSONCodec
+
+
+MAGIC = 0xF7
+MAGIC_PREFIX = bytes((MAGIC,))
+VERSION = 2
+READABLE_VERSIONS = (1, 2)
+HEADER = Struct('>BBB16sdH')
+TRACE = Struct('>16s8s')
+FLAG_TRACE = 0x01
+MAX_AGE = 20
+
+
+class Envelope(object):
+    """
+    A message from the queue. The data of binary messages is decoded on first access only.
+    """
+
+    __slots__ = ('function', 'function_id', 'uuid', 'deadline', 'binary', 'trace', '__data', '__payload', '__codec')
+
+    def __init__(self, function: str, uuid: str, deadline: float, binary: bool, **kwargs):
+        """
+        Create an envelope
+
+        :param str function: Name of the function to call
+        :param str uuid: UUID of the message
+        :param float deadline: Point in time after which the message must not be handled any more
+        :param bool binary: Did the message arrive in the binary format?
+        :param kwargs: Either ``data`` or ``payload`` and ``codec``, the ``function_id`` and the ``trace`` context
+        """
+        self.function = function
+        self.function_id = kwargs.get('function_id', 0)
+        self.trace = kwargs.get('trace')
+        self.uuid = uuid
+        self.deadline = deadline
+        self.binary = binary
+        self.__data = kwargs.get('data')
+        self.__payload = kwargs.get('payload')
+        self.__codec = kwargs.get('codec')
+
+    @property
+    def data(self):
+        """
+        The data of the message
+
+        :return: Decoded data
+        """
+        if self.__payload is not None:
+            self.__data = self.__codec.decode(self.__payload)
+            self.__payload = None
+        return self.__data
+
+    @property
+    def created(self) -> float:
+        """
+        Point in time the message was created
+
+        :return: Timestamp
+        :rtype: float
+        """
+        return self.deadline - MAX_AGE
+
+    @property
+    def expired(self) -> bool:
+        """
+        Is the deadline of the message passed?
+
+        :return: ``True`` when the message should be dropped
+        :rtype: bool
+        """
+        return self.deadline < time()
+
+
+def created_at(message: bytes) -> float:
+    """
+    Read the creation time of a message without decoding its data, as far as possible
+
+    :param bytes message: The raw message
+    :return: Timestamp or ``None`` if the message is not an envelope
+    :rtype: float
+    """
+    if message[:1] == MAGIC_PREFIX:
+        try:
+            return HEADER.unpack_from(message)[4] - MAX_AGE
+        except StructError:
+            return None
+    try:
+        data = JSONCodec().decode(message)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or '_time' not in data or not isinstance(data['_time'], (int, float)):
+        return None
+    return data['_time']
+
+
+class EnvelopeCodec(object):
+    """
+    Write messages in the configured format, read messages and replies in both formats
+    """
+
+    def __init__(self, functions: tuple, binary: bool=False):
+        """
+        Prepare the function table
+
+        :param tuple functions: Table of function names, the position is the id on the wire
+        :param bool binary: Write messages in the binary format
+        """
+        self.__functions = functions
+        self.__function_ids = {function: index for index, function in enumerate(functions) if function is not None}
+        self.__codec = JSONCodec()
+        self.binary = binary
+
+    def pack(self, function: str, uuid: UUID, data, trace: str=None) -> bytes:
+        """
+        Write a message. Functions missing in the function table are always written as JSON.
+
+        :param str function: Function to call
+        :param UUID uuid: UUID of the message
+        :param data: The data for the function
+        :param str trace: Trace context ``<trace id>-<span id>`` or ``None``
+        :return: The message
+        :rtype: bytes
+        """
+        now = time()
+        if self.binary and function in self.__function_ids:
+            flags, extension = 0, b''
+            if trace is not None:
+                flags, extension = FLAG_TRACE, TRACE.pack(*[bytes.fromhex(part) for part in trace.split('-')])
+            return HEADER.pack(MAGIC, VERSION, flags, uuid.bytes, now + MAX_AGE,
+                               self.__function_ids[function]) + extension + self.__codec.encode(data)
+        message = {
+            '_': function,
+            '_uuid': str(uuid),
+            '_time': now,
+            'data': data,
+        }
+        if trace is not None:
+            message['_trace'] = trace
+        return self.__codec.encode(message)
+
+    @staticmethod
+    def __valid(data) -> bool:
+        """
+        Check the keys of a JSON message
+
+        :param data: The decoded message
+        :return: ``True``, when function and UUID are strings, the creation time is a number and there is data
+        :rtype: bool
+        """
+        if not isinstance(data, dict) or 'data' not in data:
+            return False
+        return isinstance(data.get('_'), str) and isinstance(data.get('_uuid'), str) \
+            and isinstance(data.get('_time'), (int, float))
+
+    def unpack(self, message: bytes) -> Envelope:
+        """
+        Read a message, the data of binary messages is not decoded yet
+
+        :param bytes message: The raw message
+        :return: The envelope or ``None`` if the message is invalid
+        :rtype: Envelope
+        """
+        if message[:1] == MAGIC_PREFIX:
+            try:
+                dummy, version, flags, uuid, deadline, function_id = HEADER.unpack_from(message)
+                trace, offset = None, HEADER.size
+                if version > 1 and flags & FLAG_TRACE:
+                    trace = '-'.join(part.hex() for part in TRACE.unpack_from(message, offset))
+                    offset += TRACE.size
+            except StructError:
+                return None
+            if version not in READABLE_VERSIONS:
+                return None
+            function = self.__functions[function_id] if function_id < len(self.__functions) else None
+            return Envelope(function, str(UUID(bytes=uuid)), deadline, True, function_id=function_id, trace=trace,
+                            payload=message[offset:], codec=self.__codec)
+        try:
+            data = self.__codec.decode(message)
+        except ValueError:
+            return None
+        if not self.__valid(data):
+            return None
+        return Envelope(data['_'], data['_uuid'], data['_time'] + MAX_AGE, False, data=data['data'],
+                        trace=data['_trace'] if isinstance(data.get('_trace'), str) else None)
+
+    def pack_reply(self, envelope: Envelope, response: dict) -> bytes:
+        """
+        Write the reply to a message in the format of the message
+
+        :param Envelope envelope: The message that is answered
+        :param dict response: The response
+        :return: The reply
+        :rtype: bytes
+        """
+        if envelope.binary:
+            return HEADER.pack(MAGIC, VERSION, 0, UUID(envelope.uuid).bytes, envelope.deadline,
+                               envelope.function_id) + self.__codec.encode(response)
+        return self.__codec.encode(response)
+
+    def unpack_reply(self, reply: bytes) -> dict:
+        """
+        Read a reply in any format
+
+        :param bytes reply: The raw reply
+        :return: The response
+        :rtype: dict
+        """
+        if reply[:1] == MAGIC_PREFIX:
+            return self.__codec.decode(reply[HEADER.size:])
+        return self.__codec.decode(reply)
@@ -2,10 +2,20 @@
 Implement Queues with Redis
 """
 
+from logging import getLogger
+from math import ceil
 from threading import Thread
+from time import time
 import redis
 
+from ..config import ConfigurationFileFinder
+from ..metrics import REGISTRY
 from ..redis import RedisConfiguration
+from .envelope import created_at
+
+
+CONSUMED = REGISTRY.counter('tts_queue_consumed_total', 'Workloads taken from a queue', ('queue',))
+LOG = getLogger('tts.queue')
 
 
 class RedisQueueConfiguration(RedisConfiguration):
@@ -41,8 +51,16 @@ class RedisQueueConfiguration(RedisConfiguration):
 class RedisQueueAccess(RedisQueueConfiguration):
     """
     Access class for a Redis Queue
+
+    Producers and consumers count the messages they push and pop in Redis, in buckets of ``RATE_BUCKET`` seconds that
+    are kept for ``RATE_RETENTION`` seconds. Every process sees the rates of all processes.
     """
 
+    RATE_BUCKET = 10
+    RATE_RETENTION = 3600
+    ENQUEUED = 'enqueued'
+    DEQUEUED = 'dequeued'
+
     __pubsub_channel = None
     __connection_pool = None
 
@@ -100,6 +118,111 @@ class RedisQueueAccess(RedisQueueConfiguration):
         """
         return redis.StrictRedis(connection_pool=self.connection_pool)
 
+    def rate_key(self, direction: str, bucket: int) -> str:
+        """
+        Get the key of a rate counter
+
+        :param str direction: ``ENQUEUED`` or ``DEQUEUED``
+        :param int bucket: Number of the time bucket
+        :return: The Redis key
+        :rtype: str
+        """
+        return '{:s}_RATE_{:s}_{:d}'.format(self.queue, direction, bucket)
+
+    def bucket(self) -> int:
+        """
+        Get the current time bucket
+
+        :return: Number of the time bucket
+        :rtype: int
+        """
+        return int(time() // self.RATE_BUCKET)
+
+    def count(self, pipeline, direction: str, amount: int, bucket: int=None) -> None:
+        """
+        Add the increment of a rate counter to a pipeline
+
+        :param pipeline: A Redis pipeline
+        :param str direction: ``ENQUEUED`` or ``DEQUEUED``
+        :param int amount: Number of messages
+        :param int bucket: Number of the time bucket, defaults to the current one
+        """
+        key = self.rate_key(direction, self.bucket() if bucket is None else bucket)
+        pipeline.incrby(key, amount)
+        pipeline.expire(key, self.RATE_RETENTION)
+
+    def depth(self) -> int:
+        """
+        Get the number of messages in the queue
+
+        :return: Length of the queue
+        :rtype: int
+        """
+        return self.get_connection().llen(self.queue)
+
+    def oldest_age(self) -> float:
+        """
+        Get the age of the message at the head of the queue
+
+        :return: Age in seconds, ``0.0`` for an empty queue or ``None`` if the head is not an envelope
+        :rtype: float
+        """
+        head = self.get_connection().lindex(self.queue, 0)
+        if head is None:
+            return 0.0
+        created = created_at(head)
+        if created is None:
+            return None
+        return max(time() - created, 0.0)
+
+    def rates(self, window: int=60) -> dict:
+        """
+        Get the messages per second pushed to and popped from the queue, over the last complete time buckets
+
+        :param int window: Seconds to average over, rounded up to whole buckets
+        :return: Dictionary with ``ENQUEUED`` and ``DEQUEUED`` rates
+        :rtype: dict
+        """
+        current = self.bucket()
+        buckets = range(current - max(int(ceil(window / self.RATE_BUCKET)), 1), current)
+        rates = {}
+        for direction in (self.ENQUEUED, self.DEQUEUED):
+            values = self.get_connection().mget([self.rate_key(direction, bucket) for bucket in buckets])
+            rates[direction] = sum(int(value) for value in values if value is not None) / (
+                len(buckets) * self.RATE_BUCKET
+            )
+        return rates
+
+    def snapshot(self) -> dict:
+        """
+        Get depth, age of the oldest message and rates of the queue
+
+        :return: Dictionary with ``depth``, ``oldest_age``, ``enqueued`` and ``dequeued``
+        :rtype: dict
+        """
+        snapshot = {
+            'depth': self.depth(),
+            'oldest_age': self.oldest_age(),
+        }
+        snapshot.update(self.rates())
+        return snapshot
+
+    @staticmethod
+    def snapshot_all() -> dict:
+        """
+        Get the snapshots of all queues in the configuration file
+
+        :return: Snapshots by queue name of the configuration
+        :rtype: dict
+        """
+        queues = ConfigurationFileFinder().find_as_json()['tts']['queues']
+        snapshots = {}
+        for name, configuration in queues.items():
+            access = RedisQueueAccess(configuration)
+            snapshots[name] = access.snapshot()
+            access.connection_pool.disconnect()
+        return snapshots
+
 
 class RedisQueueConsumer(RedisQueueAccess):
     """
@@ -124,16 +247,44 @@ class RedisQueueConsumer(RedisQueueAccess):
         self.__watcher = Thread(target=self.__listener, daemon=daemon)
         self.__watcher.start()
 
+    def __count_dequeued(self, redis_connection, consumed: int, bucket: int) -> None:
+        """
+        Count the popped messages of a time bucket
+
+        :param redis_connection: Connection to Redis
+        :param int consumed: Number of messages
+        :param int bucket: Number of the time bucket
+        """
+        if consumed > 0:
+            pipeline = redis_connection.pipeline(transaction=False)
+            self.count(pipeline, self.DEQUEUED, consumed, bucket)
+            pipeline.execute()
+
     def work(self) -> None:
         """
-        Work Queue entries
+        Work Queue entries, the popped messages are counted whenever a time bucket is complete and at the end
         """
         redis_connection = self.get_connection()
-        while self.__should_run:
-            workload = redis_connection.lpop(self.queue)
-            if workload is None:
-                break
-            self.__callback(workload)
+        bucket = self.bucket()
+        consumed = 0
+        try:
+            while self.__should_run:
+                workload = redis_connection.lpop(self.queue)
+                if workload is None:
+                    break
+                current = self.bucket()
+                if current != bucket:
+                    self.__count_dequeued(redis_connection, consumed, bucket)
+                    bucket = current
+                    consumed = 0
+                consumed += 1
+                CONSUMED.inc(labels=(self.queue,))
+                try:
+                    self.__callback(workload)
+                except Exception:  # pylint: disable=broad-except
+                    LOG.exception('callback failed', extra={'queue': self.queue, 'size': len(workload)})
+        finally:
+            self.__count_dequeued(redis_connection, consumed, bucket)
 
     def __listener(self) -> None:
         """
@@ -182,5 +333,23 @@ class RedisQueueProducer(RedisQueueAccess):
         :rtype: int
         """
         redis_connection = self.get_connection()
-        redis_connection.rpush(self.queue, message)
+        pipeline = redis_connection.pipeline(transaction=False)
+        pipeline.rpush(self.queue, message)
+        self.count(pipeline, self.ENQUEUED, 1)
+        pipeline.execute()
+        return redis_connection.publish(self.pubsub_channel, '1')
+
+    def fire_messages(self, messages: list) -> int:
+        """
+        Send several messages to the queue with a single pipelined ``RPUSH`` and a single notification
+
+        :param list messages: Messages to be send
+        :return: Number of clients that received the notification
+        :rtype: int
+        """
+        redis_connection = self.get_connection()
+        pipeline = redis_connection.pipeline(transaction=False)
+        pipeline.rpush(self.queue, *messages)
+        self.count(pipeline, self.ENQUEUED, len(messages))
+        pipeline.execute()
         return redis_connection.publish(self.pubsub_channel, '1')
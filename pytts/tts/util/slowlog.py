@@ -0,0 +1,202 @@
+"""
+Record API calls that exceed a threshold with the timings of all stages
+
+A call passes these stages, all given in milliseconds after the arrival of the HTTP request:
+
+* ``enqueued``: the message was pushed to the API queue
+* ``dequeued``: a dispatcher took the message from the queue
+* ``handler_start`` and ``handler_end``: the exported function ran
+* ``published``: the reply was published
+* ``received``: the web server received the reply
+
+The dispatcher stages travel in the ``_timing`` entry of the reply. Records are written in the background into a
+capped Redis list, newest first.
+"""
+
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+
+import redis
+
+from .codec import JSONCodec
+from .config import ConfigurationFileFinder
+from .metrics import REGISTRY
+from .redis import RedisConfiguration
+from .singleton import SingletonMeta
+
+
+STAGES = ('enqueued', 'dequeued', 'handler_start', 'handler_end', 'published', 'received')
+DISPATCHER_STAGES = STAGES[1:5]
+TIMING = '_timing'
+RECORDED = REGISTRY.counter('tts_slowlog_records_total', 'Slow API calls recorded', ('function',))
+DROPPED = REGISTRY.counter('tts_slowlog_dropped_total', 'Slow API calls dropped because the write queue was full')
+
+
+def stage_offsets(arrival: float, enqueued: float, timing: list, received: float) -> dict:
+    """
+    Convert the times of the stages to milliseconds after the arrival
+
+    :param float arrival: Arrival of the HTTP request
+    :param float enqueued: Time the message was pushed to the queue
+    :param list timing: Times of the dispatcher stages from the reply or ``None``
+    :param float received: Time the reply was received or ``None`` on a timeout
+    :return: Offsets by stage, missing stages are left out
+    :rtype: dict
+    """
+    times = {'enqueued': enqueued, 'received': received}
+    if isinstance(timing, list) and len(timing) == len(DISPATCHER_STAGES):
+        times.update(zip(DISPATCHER_STAGES, timing))
+    return {
+        stage: round((times[stage] - arrival) * 1000.0, 3)
+        for stage in STAGES if stage in times and times[stage] is not None
+    }
+
+
+def aggregate(entries: list) -> dict:
+    """
+    Sum up records by function
+
+    :param list entries: Records as returned by ``SlowLog.entries``
+    :return: By function the number of calls and timeouts, the mean and maximum total and the mean of every stage
+    :rtype: dict
+    """
+    functions = {}
+    for entry in entries:
+        if entry['function'] not in functions:
+            functions[entry['function']] = {'count': 0, 'timeouts': 0, 'total': 0.0, 'max': 0.0, 'stages': {}}
+        summary = functions[entry['function']]
+        summary['count'] += 1
+        summary['timeouts'] += 1 if entry['timeout'] else 0
+        summary['total'] += entry['total']
+        summary['max'] = max(summary['max'], entry['total'])
+        for stage, offset in entry['stages'].items():
+            summary['stages'].setdefault(stage, []).append(offset)
+    for summary in functions.values():
+        summary['mean'] = summary.pop('total') / summary['count']
+        summary['stages'] = {stage: sum(offsets) / len(offsets) for stage, offsets in summary['stages'].items()}
+    return functions
+
+
+class SlowLog(object, metaclass=SingletonMeta):
+    """
+    Capped Redis list of the API calls slower than the threshold
+    """
+
+    KEY = 'PYTTS_SLOWLOG'
+
+    def __init__(self):
+        """
+        Configure the slow log from the ``slowlog`` section of the configuration file
+        """
+        self.enabled = False
+        self.threshold = 250.0
+        self.size = 1000
+        self.__codec = JSONCodec()
+        self.__queue = Queue(1024)
+        self.__lock = Lock()
+        self.__writer = None
+        self.__connection_pool = None
+        config = ConfigurationFileFinder().find_as_json()['tts']
+        if 'slowlog' not in config:
+            return
+        slowlog_config = config['slowlog']
+        self.enabled = 'enabled' not in slowlog_config or bool(slowlog_config['enabled'])
+        if 'threshold' in slowlog_config:
+            self.threshold = float(slowlog_config['threshold'])
+        if 'size' in slowlog_config:
+            self.size = slowlog_config['size']
+        self.__connection_pool = RedisConfiguration(slowlog_config).create_redis_connection_pool()
+
+    def record(self, function: str, uuid: str, size: int, arrival: float, stages: dict) -> bool:
+        """
+        Queue a call for writing, if it took longer than the threshold or got no reply
+
+        :param str function: Function of the call
+        :param str uuid: UUID of the message
+        :param int size: Size of the message in bytes
+        :param float arrival: Arrival of the HTTP request
+        :param dict stages: Offsets by stage as returned by ``stage_offsets``
+        :return: ``True``, when the call was queued
+        :rtype: bool
+        """
+        if not self.enabled or self.__connection_pool is None:
+            return False
+        timeout = 'received' not in stages
+        total = max(stages.values()) if stages else 0.0
+        if not timeout and total < self.threshold:
+            return False
+        try:
+            self.__queue.put_nowait({
+                'time': arrival,
+                'function': function,
+                'uuid': uuid,
+                'size': size,
+                'total': total,
+                'timeout': timeout,
+                'stages': stages,
+            })
+        except Full:
+            DROPPED.inc()
+            return False
+        RECORDED.inc(labels=(function,))
+        return True
+
+    def entries(self, count: int=100) -> list:
+        """
+        Read the newest records
+
+        :param int count: Maximum number of records
+        :return: Records, newest first
+        :rtype: list
+        """
+        if self.__connection_pool is None:
+            return []
+        connection = redis.StrictRedis(connection_pool=self.__connection_pool)
+        return [self.__codec.decode(entry) for entry in connection.lrange(self.KEY, 0, count - 1)]
+
+    def clear(self) -> None:
+        """
+        Remove all records
+        """
+        if self.__connection_pool is not None:
+            redis.StrictRedis(connection_pool=self.__connection_pool).delete(self.KEY)
+
+    def flush(self, first: dict=None) -> None:
+        """
+        Write all queued records
+
+        :param dict first: Record already taken from the queue
+        """
+        entries = [] if first is None else [self.__codec.encode(first)]
+        try:
+            while True:
+                entries.append(self.__codec.encode(self.__queue.get_nowait()))
+        except Empty:
+            pass
+        if not entries:
+            return
+        pipeline = redis.StrictRedis(connection_pool=self.__connection_pool).pipeline(transaction=False)
+        pipeline.lpush(self.KEY, *entries)
+        pipeline.ltrim(self.KEY, 0, self.size - 1)
+        pipeline.execute()
+
+    def start(self) -> None:
+        """
+        Start the background writer, if it is not running yet
+        """
+        if not self.enabled or self.__connection_pool is None:
+            return
+        with self.__lock:
+            if self.__writer is None:
+                self.__writer = Thread(target=self.__write_loop, daemon=True)
+                self.__writer.start()
+
+    def __write_loop(self) -> None:
+        """
+        Write the queued records
+        """
+        while True:
+            try:
+                self.flush(self.__queue.get())
+            except redis.RedisError:
+                continue
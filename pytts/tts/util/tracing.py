@@ -0,0 +1,406 @@
+"""
+Request tracing across the web server, the API queue and the dispatcher
+
+A trace starts with a sampled API request. Its context travels in the queue envelope as ``<trace id>-<span id>`` and
+is continued by the dispatcher. Finished spans are exported in the background, either as JSON lines to a file or in
+the OTLP/HTTP JSON format to a collector.
+"""
+
+from queue import Full, Empty, Queue
+from random import getrandbits, random
+from threading import Event, Thread, local
+from time import time
+from urllib.request import Request, urlopen
+
+from .codec import JSONCodec
+from .metrics import REGISTRY
+
+
+DROPPED = REGISTRY.counter('tts_tracing_dropped_spans_total', 'Spans dropped because the export queue was full')
+EXPORT_ERRORS = REGISTRY.counter('tts_tracing_export_errors_total', 'Failed span exports')
+
+
+class Span(object):
+    """
+    A timed operation within a trace. Entering a span makes it the current span of the thread.
+    """
+
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start', 'end', 'error',
+                 'previous')
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: str, parent_id: str=None):
+        """
+        Start the span
+
+        :param Tracer tracer: The tracer exporting the span
+        :param str name: Name of the operation
+        :param str trace_id: Id of the trace, 32 hex digits
+        :param str parent_id: Id of the parent span, 16 hex digits
+        """
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = '{:016x}'.format(getrandbits(64))
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = {}
+        self.start = time()
+        self.end = None
+        self.error = None
+        self.previous = None
+
+    @property
+    def context(self) -> str:
+        """
+        Context for child spans in other processes
+
+        :return: ``<trace id>-<span id>``
+        :rtype: str
+        """
+        return '{:s}-{:s}'.format(self.trace_id, self.span_id)
+
+    def set(self, key: str, value) -> None:
+        """
+        Set an attribute
+
+        :param str key: Name of the attribute
+        :param value: Value of the attribute
+        """
+        self.attributes[key] = value
+
+    def activate(self) -> 'Span':
+        """
+        Make this span the current span of the thread
+
+        :return: The span
+        :rtype: Span
+        """
+        self.previous = self.tracer.current
+        self.tracer.current = self
+        return self
+
+    def finish(self, error: BaseException=None) -> None:
+        """
+        End the span, restore the previous current span and hand the span to the exporter
+
+        :param BaseException error: Exception that ended the operation
+        """
+        self.end = time()
+        if error is not None:
+            self.error = '{:s}: {!s}'.format(type(error).__name__, error)
+        if self.tracer.current is self:
+            self.tracer.current = self.previous
+        self.previous = None
+        self.tracer.export(self)
+
+    def __enter__(self) -> 'Span':
+        return self.activate()
+
+    def __exit__(self, *exception) -> None:
+        self.finish(exception[1])
+
+
+class NoSpan(object):
+    """
+    Stand-in when the operation is not traced
+    """
+
+    context = None
+
+    def set(self, key: str, value) -> None:
+        """
+        Ignore the attribute
+
+        :param str key: Name of the attribute
+        :param value: Value of the attribute
+        """
+
+    def activate(self) -> 'NoSpan':
+        """
+        Nothing to activate
+
+        :return: The stand-in
+        :rtype: NoSpan
+        """
+        return self
+
+    def finish(self, error: BaseException=None) -> None:
+        """
+        Nothing to finish
+
+        :param BaseException error: Exception that ended the operation
+        """
+
+    def __enter__(self) -> 'NoSpan':
+        return self
+
+    def __exit__(self, *dummy) -> None:
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+class FileExporter(object):
+    """
+    Append spans as JSON lines to a file
+    """
+
+    def __init__(self, file: str):
+        """
+        Configure the file
+
+        :param str file: Path of the file
+        """
+        self.file = file
+
+    def __call__(self, spans: list, service: str) -> None:
+        """
+        Write spans
+
+        :param list spans: Finished spans
+        :param str service: Name of the service
+        """
+        codec = JSONCodec()
+        with open(self.file, 'ab') as file_pointer:
+            for span in spans:
+                file_pointer.write(codec.encode({
+                    'service': service,
+                    'trace_id': span.trace_id,
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'start': span.start,
+                    'end': span.end,
+                    'attributes': span.attributes,
+                    'error': span.error,
+                }) + b'\n')
+
+
+class OTLPExporter(object):
+    """
+    Send spans to a collector in the OTLP/HTTP JSON format
+    """
+
+    def __init__(self, endpoint: str, timeout: float=2.0):
+        """
+        Configure the collector
+
+        :param str endpoint: URL of the traces endpoint, e.g. ``http://localhost:4318/v1/traces``
+        :param float timeout: Timeout of a request in seconds
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    @staticmethod
+    def attribute(key: str, value) -> dict:
+        """
+        Convert an attribute
+
+        :param str key: Name of the attribute
+        :param value: Value of the attribute
+        :return: OTLP key value
+        :rtype: dict
+        """
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        if isinstance(value, float):
+            return {'key': key, 'value': {'doubleValue': value}}
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    def __call__(self, spans: list, service: str) -> None:
+        """
+        Send spans
+
+        :param list spans: Finished spans
+        :param str service: Name of the service
+        """
+        body = JSONCodec().encode({
+            'resourceSpans': [{
+                'resource': {'attributes': [self.attribute('service.name', service)]},
+                'scopeSpans': [{
+                    'scope': {'name': 'tts'},
+                    'spans': [{
+                        'traceId': span.trace_id,
+                        'spanId': span.span_id,
+                        'parentSpanId': span.parent_id or '',
+                        'name': span.name,
+                        'kind': 1,
+                        'startTimeUnixNano': str(int(span.start * 1e9)),
+                        'endTimeUnixNano': str(int(span.end * 1e9)),
+                        'attributes': [self.attribute(key, value) for key, value in span.attributes.items()],
+                        'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+                    } for span in spans],
+                }],
+            }],
+        })
+        request = Request(self.endpoint, data=body, headers={'Content-Type': 'application/json'})
+        urlopen(request, timeout=self.timeout).close()
+
+
+class Tracer(object):
+    """
+    Create spans and export them in the background. Until it is configured, the tracer traces nothing.
+    """
+
+    def __init__(self):
+        """
+        Create a tracer that is not configured yet
+        """
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.service = 'pytts'
+        self.batch_size = 256
+        self.interval = 1.0
+        self.__exporter = None
+        self.__local = local()
+        self.__queue = Queue(4096)
+        self.__stopped = Event()
+        self.__worker = None
+
+    def configure(self, config: dict) -> None:
+        """
+        Configure the tracer from the ``tracing`` section of the configuration file and start exporting
+
+        :param dict config: Tracing configuration
+        :raises ValueError: When the exporter is unknown
+        """
+        if 'enabled' in config and not config['enabled']:
+            return
+        exporter = config['exporter'] if 'exporter' in config else 'file'
+        if exporter == 'file':
+            self.__exporter = FileExporter(config['file'] if 'file' in config else 'pytts-traces.jsonl')
+        elif exporter == 'otlp':
+            self.__exporter = OTLPExporter(config['endpoint'] if 'endpoint' in config
+                                           else 'http://localhost:4318/v1/traces')
+        else:
+            raise ValueError('Unknown trace exporter {:s}'.format(exporter))
+        if 'sample_rate' in config:
+            self.sample_rate = float(config['sample_rate'])
+        if 'service' in config:
+            self.service = config['service']
+        self.__stopped.clear()
+        self.__worker = Thread(target=self.__export_loop, daemon=True)
+        self.__worker.start()
+        self.enabled = True
+
+    def shutdown(self) -> None:
+        """
+        Stop tracing and export the remaining spans
+        """
+        self.enabled = False
+        self.__stopped.set()
+        if self.__worker is not None:
+            self.__worker.join(5)
+            self.__worker = None
+
+    @property
+    def current(self):
+        """
+        The current span of the thread
+
+        :return: The span or ``None``
+        :rtype: Span
+        """
+        return getattr(self.__local, 'span', None)
+
+    @current.setter
+    def current(self, span) -> None:
+        """
+        Set the current span of the thread
+
+        :param Span span: The span or ``None``
+        """
+        self.__local.span = span
+
+    def start_trace(self, name: str):
+        """
+        Start a new trace, if it is sampled
+
+        :param str name: Name of the root span
+        :return: The root span, not activated yet, or ``NO_SPAN``
+        :rtype: Span
+        """
+        if not self.enabled or random() >= self.sample_rate:
+            return NO_SPAN
+        return Span(self, name, '{:032x}'.format(getrandbits(128)))
+
+    def continue_trace(self, context: str, name: str):
+        """
+        Continue a trace from another process
+
+        :param str context: ``<trace id>-<span id>`` or ``None``
+        :param str name: Name of the span
+        :return: The span, not activated yet, or ``NO_SPAN``
+        :rtype: Span
+        """
+        if not self.enabled or not context:
+            return NO_SPAN
+        trace_id, dummy, parent_id = context.partition('-')
+        if len(trace_id) != 32 or len(parent_id) != 16:
+            return NO_SPAN
+        return Span(self, name, trace_id, parent_id)
+
+    def span(self, name: str):
+        """
+        Start a child span of the current span
+
+        :param str name: Name of the span
+        :return: The span, not activated yet, or ``NO_SPAN`` if there is no current span
+        :rtype: Span
+        """
+        parent = self.current
+        if parent is None:
+            return NO_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id)
+
+    def context(self) -> str:
+        """
+        Context of the current span for other processes
+
+        :return: ``<trace id>-<span id>`` or ``None``
+        :rtype: str
+        """
+        parent = self.current
+        return parent.context if parent is not None else None
+
+    def export(self, span: Span) -> None:
+        """
+        Queue a finished span for the export, drop it when the queue is full
+
+        :param Span span: The finished span
+        """
+        try:
+            self.__queue.put_nowait(span)
+        except Full:
+            DROPPED.inc()
+
+    def flush(self) -> None:
+        """
+        Export all queued spans
+        """
+        while not self.__queue.empty():
+            spans = []
+            try:
+                while len(spans) < self.batch_size:
+                    spans.append(self.__queue.get_nowait())
+            except Empty:
+                pass
+            if not spans or self.__exporter is None:
+                return
+            try:
+                self.__exporter(spans, self.service)
+            except (OSError, ValueError):
+                EXPORT_ERRORS.inc()
+
+    def __export_loop(self) -> None:
+        """
+        Export the queued spans until stopped
+        """
+        while not self.__stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+
+TRACER = Tracer()